@@ -151,6 +151,105 @@ BOSS_VERSION = 'v1'
 # Maximum number of bytes in an uncompressed matrix supported by the Cutout Service
 CUTOUT_MAX_SIZE = 520 * 1048576
 
+# Maximum number of bytes in an uncompressed matrix supported by the Cutout Service when streaming the response
+CUTOUT_STREAM_MAX_SIZE = 4 * 1024 * 1048576
+
+# Coalesce identical concurrent cutout reads across worker processes using a redis lock, and the maximum number of
+# seconds a worker holds or waits on that lock
+CUTOUT_COALESCE_ACROSS_WORKERS = False
+CUTOUT_COALESCE_LOCK_TIMEOUT = 30
+
+# Number of bytes of encoded cutout responses each worker caches (0 disables the cache) and the maximum number of
+# seconds an entry is served. Writes through the cutout service invalidate entries immediately; the TTL bounds how
+# long data written by other means (eg. ingest) can be served stale.
+CUTOUT_RESPONSE_CACHE_SIZE = 0
+CUTOUT_RESPONSE_CACHE_TTL = 300
+
+# Default zlib compression level of npygz cutout responses (clients can select another with ?gzlevel=) and the
+# number of threads compressing each response
+NPYGZ_DEFAULT_LEVEL = 6
+NPYGZ_THREADS = 4
+
+# Default compression levels of zstd and lz4 cutout responses (clients can select another with ?level=). The formats
+# are only offered when the zstandard and lz4 packages are installed.
+CUTOUT_ZSTD_LEVEL = 3
+CUTOUT_LZ4_LEVEL = 0
+
+# Default number of histogram bins returned by the cutout statistics service and the number of seconds the histograms
+# of whole cuboids are cached (0 disables the cache). Writes through the cutout service invalidate cached histograms
+# immediately; like CUTOUT_RESPONSE_CACHE_TTL, the TTL bounds how long data written by other means can be served stale.
+CUTOUT_STATS_DEFAULT_BINS = 256
+CUTOUT_STATS_CACHE_TTL = 300
+
+# Number of time samples per block and number of blocks fetched concurrently when reading time series cutouts. Ranges
+# that fit in one block are read with a single call.
+CUTOUT_TIME_BLOCK_SIZE = 16
+CUTOUT_TIME_WORKERS = 4
+
+# Maximum number of cuboid keys the cutout estimate service looks up in the cache (larger regions are sampled) and the
+# model of its latency estimate: seconds per cuboid read from the cache and from the object store, and uncompressed
+# bytes encoded per second.
+CUTOUT_ESTIMATE_MAX_PROBES = 100000
+CUTOUT_ESTIMATE_MODEL = {"cached_cuboid_s": 0.002, "cold_cuboid_s": 0.05, "bytes_per_s": 200 * 1048576}
+
+# Number of cache pre-warm jobs each worker runs at once, the maximum number waiting or running, the maximum number of
+# cuboids (counting each time sample) a job may cover and the number of seconds a job's progress is kept
+CUTOUT_PREWARM_WORKERS = 2
+CUTOUT_PREWARM_MAX_JOBS = 16
+CUTOUT_PREWARM_MAX_CUBOIDS = 100000
+CUTOUT_PREWARM_JOB_TTL = 86400
+
+# Maximum number of uncompressed bytes in the region of an upload session, and the number of seconds a session is kept
+# after it was opened or last received a part. Each part is still limited by CUTOUT_MAX_SIZE.
+CUTOUT_UPLOAD_MAX_SIZE = 64 * 1024 * 1048576
+CUTOUT_UPLOAD_SESSION_TTL = 86400
+
+# Asynchronous cutout writes (POST with ?async=true). Writes are spooled to CUTOUT_WRITE_BEHIND_DIR (a directory in the
+# system temp dir if None), which has to survive worker restarts, and applied by CUTOUT_WRITE_BEHIND_WORKERS threads per
+# worker. Reads and synchronous writes wait up to CUTOUT_WRITE_BEHIND_WAIT_TIMEOUT seconds for the pending writes they
+# overlap. Reads only check for pending writes while this is enabled. Writes pending for longer than
+# CUTOUT_WRITE_BEHIND_MAX_AGE seconds are assumed lost with their node and stop blocking the region. An asynchronous
+# write is tried up to CUTOUT_WRITE_BEHIND_MAX_ATTEMPTS times, each waiting up to the wait timeout for the earlier
+# writes it overlaps, with backoff after errors. Its ticket is then failed, and its spooled data is kept so it is
+# applied again once another worker adopts the spool.
+CUTOUT_WRITE_BEHIND_ENABLED = False
+CUTOUT_WRITE_BEHIND_DIR = None
+CUTOUT_WRITE_BEHIND_WORKERS = 2
+CUTOUT_WRITE_BEHIND_MAX_PENDING = 64
+CUTOUT_WRITE_BEHIND_WAIT_TIMEOUT = 30
+CUTOUT_WRITE_BEHIND_MAX_AGE = 3600
+CUTOUT_WRITE_BEHIND_MAX_ATTEMPTS = 10
+CUTOUT_WRITE_BEHIND_TICKET_TTL = 86400
+
+# POST bodies larger than this many bytes are spooled to a temp file and memory mapped instead of being read into the
+# worker's heap (0 disables spooling). Temp files are created in CUTOUT_SPOOL_DIR, or the system temp dir if None.
+CUTOUT_SPOOL_THRESHOLD = 64 * 1048576
+CUTOUT_SPOOL_DIR = None
+
+# Budget of uncompressed cutout bytes in flight shared by all workers on a node (0 disables admission control).
+# Requests smaller than the bypass size are not counted. Others wait up to the queue timeout for room in the budget
+# and are then rejected with a 503 and a Retry-After of the given number of seconds. Leases not released within their
+# TTL (eg. by a worker that died) are reclaimed. Streamed responses renew their leases every third of the TTL while
+# they send data, so the TTL only has to be longer than the longest stall of a response, not the whole response.
+CUTOUT_ADMISSION_BUDGET = 0
+CUTOUT_ADMISSION_BYPASS_SIZE = 16 * 1048576
+CUTOUT_ADMISSION_QUEUE_TIMEOUT = 10
+CUTOUT_ADMISSION_RETRY_AFTER = 5
+CUTOUT_ADMISSION_LEASE_TTL = 900
+
+# Maximum number of regions in a batch cutout request
+CUTOUT_BATCH_MAX_REGIONS = 1000
+
+# Maximum number of channels in a stacked cutout request and the number of channels fetched concurrently
+CUTOUT_STACK_MAX_CHANNELS = 8
+CUTOUT_STACK_WORKERS = 4
+
+# Time the stages of cutout, tile and object requests. Timings are returned in a Server-Timing header and passed to
+# the sink, a dotted path to a callable taking the endpoint name and a list of (stage, seconds) pairs. The default
+# sink aggregates them into per endpoint histograms reported by the cutout metrics service.
+BOSS_TIMING_ENABLED = False
+BOSS_TIMING_SINK = "bosscore.timing.record_histograms"
+
 # Allow all cross site origins
 CORS_ORIGIN_ALLOW_ALL = True
 
@@ -58,6 +58,15 @@ urlpatterns = [
     url(r'^v1/groups/', include('bosscore.urls.group-urls', namespace='v1')),
     url(r'^v1/cutout/', include('bossspatialdb.urls', namespace='v1')),
     url(r'^v1/downsample/', include('bossspatialdb.urls_downsample', namespace='v1')),
+    url(r'^v1/cutout-batch/', include('bossspatialdb.urls_batch', namespace='v1')),
+    url(r'^v1/cutout-stack/', include('bossspatialdb.urls_stack', namespace='v1')),
+    url(r'^v1/cutout-metrics/', include('bossspatialdb.urls_metrics', namespace='v1')),
+    url(r'^v1/cutout-stats/', include('bossspatialdb.urls_stats', namespace='v1')),
+    url(r'^v1/cutout-estimate/', include('bossspatialdb.urls_estimate', namespace='v1')),
+    url(r'^v1/prewarm/', include('bossspatialdb.urls_prewarm', namespace='v1')),
+    url(r'^v1/upload/', include('bossspatialdb.urls_upload', namespace='v1')),
+    url(r'^v1/cutout-write/', include('bossspatialdb.urls_write', namespace='v1')),
+    url(r'^v1/projection/', include('bossspatialdb.urls_projection', namespace='v1')),
     url(r'^v1/image/', include('bosstiles.image_urls', namespace='v1')),
     url(r'^v1/tile/', include('bosstiles.tile_urls', namespace='v1')),
     url(r'^v1/ingest/', include('bossingest.urls', namespace='v1')),
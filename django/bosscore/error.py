@@ -74,6 +74,7 @@ class ErrorCodes(IntEnum):
     BOSS_SYSTEM_ERROR = 9001
     UNHANDLED_EXCEPTION = 9002
     UNSUPPORTED_VERSION = 9003
+    SERVER_BUSY = 9004
 
 
 
@@ -114,7 +115,8 @@ RESP_CODES = {
     ErrorCodes.FUTURE: 404,
     ErrorCodes.BOSS_SYSTEM_ERROR: 400,
     ErrorCodes.UNHANDLED_EXCEPTION: 500,
-    ErrorCodes.UNSUPPORTED_VERSION: 400
+    ErrorCodes.UNSUPPORTED_VERSION: 400,
+    ErrorCodes.SERVER_BUSY: 503
 
 }
 
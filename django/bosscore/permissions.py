@@ -234,7 +234,8 @@ class BossPermissionManager:
         """
         if method_type == 'GET':
             permission = 'read_volumetric_data'
-        elif method_type == 'POST':
+        elif method_type == 'POST' or method_type == 'PUT':
+            # PUT writes the parts of upload sessions
             permission = 'add_volumetric_data'
         elif method_type == 'DELETE':
             permission = 'delete_volumetric_data'
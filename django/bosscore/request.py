@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import re
 import numpy as np
 
@@ -19,6 +20,7 @@ from .models import Collection, Experiment, Channel
 from .lookup import LookUpKey
 from .error import BossHTTPError, BossError, ErrorCodes, BossRestArgsError
 from .permissions import BossPermissionManager
+from .timing import get_timer
 
 META_CONNECTOR = "&"
 
@@ -44,6 +46,7 @@ class BossRequest:
         self.collection = None
         self.experiment = None
         self.channel = None
+        self.channels = None
 
         self.default_time = None
         self.coord_frame = None
@@ -77,6 +80,7 @@ class BossRequest:
         self.user = request.user
         self.method = request.method
         self.version = request.version
+        self.timer = get_timer(request)
 
         # object service
         self.object_id = 0
@@ -85,33 +89,41 @@ class BossRequest:
         # Validate the request based on the service
         self.service = self.bossrequest['service']
 
-        if self.service == 'meta':
-            self.validate_meta_service()
+        with self.timer.stage("validate"):
+            if self.service == 'meta':
+                self.validate_meta_service()
 
-        elif self.service == 'view':
-            raise BossError("Views not implemented. Specify the full request", ErrorCodes.FUTURE)
+            elif self.service == 'view':
+                raise BossError("Views not implemented. Specify the full request", ErrorCodes.FUTURE)
 
-        elif self.service == 'image':
-            self.validate_image_service()
+            elif self.service == 'image':
+                self.validate_image_service()
 
-        elif self.service == 'tile':
-            self.validate_tile_service()
+            elif self.service == 'tile':
+                self.validate_tile_service()
 
-        elif self.service == 'ids':
-            # Currently the validation is the same as the cutout service
-            self.validate_ids_service()
+            elif self.service == 'ids':
+                # Currently the validation is the same as the cutout service
+                self.validate_ids_service()
 
-        elif self.service == 'reserve':
-            self.validate_reserve_service()
+            elif self.service == 'reserve':
+                self.validate_reserve_service()
 
-        elif self.service == 'boundingbox':
-            self.validate_bounding_box()
+            elif self.service == 'boundingbox':
+                self.validate_bounding_box()
 
-        elif self.service == 'downsample':
-            self.validate_downsample_service()
+            elif self.service == 'downsample':
+                self.validate_downsample_service()
 
-        else:
-            self.validate_cutout_service()
+            elif self.service == 'batch':
+                # Validated as a cutout of the bounding box of all the regions in the batch
+                self.validate_cutout_service()
+
+            elif self.service == 'stack':
+                self.validate_stack_service()
+
+            else:
+                self.validate_cutout_service()
 
     def validate_meta_service(self):
         """
@@ -183,6 +195,66 @@ class BossRequest:
         self.set_cutoutargs(int(self.bossrequest['resolution']), self.bossrequest['x_args'],
                             self.bossrequest['y_args'], self.bossrequest['z_args'])
 
+    def validate_stack_service(self):
+        """
+        Validate a cutout of the same region of several channels of one experiment
+
+        The collection, experiment and cutout arguments are validated once. Each channel is looked up and its
+        permissions checked. self.channel is set to the first channel.
+
+        Raises:
+            BossError: For invalid requests
+        """
+        channel_names = self.bossrequest['channel_names']
+        if not channel_names:
+            raise BossError("A stacked cutout requires at least one channel", ErrorCodes.INVALID_CUTOUT_ARGS)
+        if len(set(channel_names)) != len(channel_names):
+            raise BossError("Channels {} are not unique".format(",".join(channel_names)),
+                            ErrorCodes.INVALID_CUTOUT_ARGS)
+
+        self.set_collection(self.bossrequest['collection_name'])
+        self.set_experiment(self.bossrequest['experiment_name'])
+
+        self.channels = []
+        for channel_name in channel_names:
+            self.set_channel(channel_name)
+            with self.timer.stage("permissions"):
+                self.check_permissions()
+            self.channels.append(self.channel)
+        self.channel = self.channels[0]
+        self.set_boss_key()
+
+        time = self.bossrequest['time_args']
+        if not time:
+            # get default time, which has to be the same for every channel
+            if len(set(channel.default_time_sample for channel in self.channels)) > 1:
+                raise BossError("The channels have different default time samples. Specify a time range.",
+                                ErrorCodes.INVALID_CUTOUT_ARGS)
+            self.time_start = self.channel.default_time_sample
+            self.time_stop = self.channel.default_time_sample + 1
+            self.time_request = False
+        else:
+            self.set_time(time)
+            self.time_request = True
+
+        self.set_cutoutargs(int(self.bossrequest['resolution']), self.bossrequest['x_args'],
+                            self.bossrequest['y_args'], self.bossrequest['z_args'])
+
+    def get_channel_request(self, channel):
+        """
+        Get a copy of a validated stacked cutout request for one of its channels
+
+        Args:
+            channel (bosscore.models.Channel): One of the channels of the request
+
+        Returns:
+            (BossRequest): The request, with the channel and boss key of the channel
+        """
+        req = copy.copy(self)
+        req.channel = channel
+        req.set_boss_key()
+        return req
+
     def validate_ids_service(self):
         """
 
@@ -330,7 +402,8 @@ class BossRequest:
                 if channel_name and expstatus:
                     self.set_channel(channel_name)
 
-        self.check_permissions()
+        with self.timer.stage("permissions"):
+            self.check_permissions()
         self.set_boss_key()
 
     def set_cutoutargs(self, resolution, x_range, y_range, z_range):
@@ -791,6 +864,10 @@ class BossRequest:
                 or self.service == 'boundingbox' or self.service == 'downsample':
             perm = BossPermissionManager.check_data_permissions(self.user, self.channel, self.method)
 
+        elif self.service == 'batch' or self.service == 'stack':
+            # Batch cutouts are POSTed but only read data, like stacked cutouts
+            perm = BossPermissionManager.check_data_permissions(self.user, self.channel, 'GET')
+
         elif self.service == 'meta':
             if self.collection and self.experiment and self.channel:
                 obj = self.channel
@@ -599,6 +599,49 @@ class CutoutInvalidRequestTests(APITestCase):
         with self.assertRaises(BossError):
             BossRequest(drfrequest, request_args)
 
+    def test_request_stack_channels(self):
+        """
+        Test initialization of stacked cutout requests and of the requests of their channels
+        :return:
+        """
+        url = '/' + version + '/cutout-stack/col1/exp1/channel1,layer1/2/0:5/0:6/0:2/'
+
+        # Create the request
+        request = self.rf.get(url)
+        force_authenticate(request, user=self.user)
+        drfrequest = Cutout().initialize_request(request)
+        drfrequest.version = version
+
+        # Create the request dict
+        request_args = {
+            "service": "stack",
+            "version": version,
+            "collection_name": 'col1',
+            "experiment_name": 'exp1',
+            "channel_names": ['channel1', 'layer1'],
+            "resolution": 2,
+            "x_args": "0:5",
+            "y_args": "0:6",
+            "z_args": "0:2",
+            "time_args": None
+        }
+
+        ret = BossRequest(drfrequest, request_args)
+        self.assertEqual([channel.name for channel in ret.channels], ['channel1', 'layer1'])
+        self.assertEqual(ret.get_boss_key(), 'col1&exp1&channel1')
+
+        layer = ret.get_channel_request(ret.channels[1])
+        self.assertEqual(layer.get_channel(), 'layer1')
+        self.assertEqual(layer.get_boss_key(), 'col1&exp1&layer1')
+        self.assertEqual(layer.get_x_span(), 5)
+        self.assertEqual(ret.get_boss_key(), 'col1&exp1&channel1')
+
+        # Duplicate and unknown channels are rejected
+        for channel_names in (['channel1', 'channel1'], ['channel1', 'channel133323'], []):
+            request_args["channel_names"] = channel_names
+            with self.assertRaises(BossError):
+                BossRequest(drfrequest, request_args)
+
     def test_request_cutout_invalid_datamodel(self):
         """
         Test initialization of cutout requests for an invalid datamodel - experiment  does not exist for the collection
@@ -0,0 +1,118 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+from rest_framework.test import APITestCase, APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import AllowAny
+from django.test import override_settings
+
+from bosscore.timing import RequestTimer, NULL_TIMER, NULL_STAGE, TimingHistograms, TimingMixin, get_timer
+
+recorded = []
+
+
+def record_to_list(endpoint, timings):
+    recorded.append((endpoint, timings))
+
+
+class TimedView(TimingMixin, APIView):
+    permission_classes = (AllowAny,)
+
+    def get(self, request):
+        with get_timer(request).stage("fetch"):
+            data = {"value": 1}
+        return Response(data)
+
+
+class TimingTests(APITestCase):
+
+    def test_stages_are_summed(self):
+        """Time spent in a stage entered several times is added up"""
+        timer = RequestTimer()
+        timer.add("fetch", 0.25)
+        timer.add("fetch", 0.5)
+        with timer.stage("render"):
+            pass
+
+        timings = dict(timer.get_timings())
+        self.assertEqual(timings["fetch"], 0.75)
+        self.assertIn("render", timings)
+        self.assertIn("total", timings)
+
+    def test_header(self):
+        """Durations are reported in milliseconds"""
+        timer = RequestTimer()
+        timer.add("validate", 0.0125)
+        header = timer.get_header()
+
+        self.assertTrue(header.startswith("validate;dur=12.50, total;dur="))
+
+    def test_null_timer(self):
+        """Untimed requests share a timer that returns the same no-op stage"""
+        self.assertIs(get_timer(object()), NULL_TIMER)
+        self.assertIs(NULL_TIMER.stage("fetch"), NULL_STAGE)
+        with NULL_TIMER.stage("fetch"):
+            pass
+
+    def test_stage_records_on_exception(self):
+        """A stage is recorded even if the code inside it raises"""
+        timer = RequestTimer()
+        with self.assertRaises(ValueError):
+            with timer.stage("fetch"):
+                raise ValueError()
+
+        self.assertIn("fetch", timer.stages)
+
+    def test_histograms(self):
+        """Timings are counted in the bucket of the smallest bound they fit under"""
+        hist = TimingHistograms(buckets=(1, 10))
+        hist.record("Cutout.GET", [("fetch", 0.0005), ("total", 0.005)])
+        hist.record("Cutout.GET", [("fetch", 0.05), ("total", 0.06)])
+
+        stats = hist.get_stats()
+        self.assertEqual(stats["buckets_ms"], [1, 10])
+        fetch = stats["endpoints"]["Cutout.GET"]["fetch"]
+        self.assertEqual(fetch["count"], 2)
+        self.assertEqual(fetch["counts"], [1, 0, 1])
+        self.assertAlmostEqual(fetch["max_ms"], 50)
+        self.assertEqual(stats["endpoints"]["Cutout.GET"]["total"]["counts"], [0, 1, 1])
+
+    @override_settings(BOSS_TIMING_ENABLED=True, BOSS_TIMING_SINK="bosscore.test.test_timing.record_to_list")
+    def test_mixin_enabled(self):
+        """Timed views return a Server-Timing header and pass their timings to the sink"""
+        del recorded[:]
+        request = APIRequestFactory().get('/timed/')
+        response = TimedView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        stages = [part.split(";")[0] for part in response['Server-Timing'].split(", ")]
+        self.assertEqual(stages, ["fetch", "render", "total"])
+        self.assertTrue(re.match(r"^fetch;dur=\d+\.\d\d,", response['Server-Timing']))
+
+        self.assertEqual(len(recorded), 1)
+        self.assertEqual(recorded[0][0], "TimedView.GET")
+
+    @override_settings(BOSS_TIMING_ENABLED=False, BOSS_TIMING_SINK="bosscore.test.test_timing.record_to_list")
+    def test_mixin_disabled(self):
+        """Untimed views add no header and record nothing"""
+        del recorded[:]
+        request = APIRequestFactory().get('/timed/')
+        response = TimedView.as_view()(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(recorded, [])
@@ -0,0 +1,259 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Per-stage request timing
+#
+# Views using TimingMixin get a RequestTimer attached to the request. Code handling the request times its stages with
+#
+#     with get_timer(request).stage("fetch"):
+#         ...
+#
+# and the durations are returned to the client in a Server-Timing header and passed to a sink, which by default
+# aggregates them into per endpoint histograms. Stages may nest (eg. "validate" includes "permissions"). When timing is
+# disabled (settings.BOSS_TIMING_ENABLED) every request shares a timer that does nothing.
+
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from rest_framework.response import Response
+
+# Upper bounds, in milliseconds, of the histogram buckets. The last bucket holds everything slower.
+TIMING_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class NullStage(object):
+    """Context manager that does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+NULL_STAGE = NullStage()
+
+
+class Stage(object):
+    """Context manager that adds the time spent inside it to a stage of a RequestTimer"""
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class RequestTimer(object):
+    """Durations of the stages of one request"""
+
+    enabled = True
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    def stage(self, name):
+        """Method to time a stage
+
+        Args:
+            name (str): Name of the stage. Time spent in a stage that is entered several times is summed.
+
+        Returns:
+            (Stage): Context manager timing the code inside it
+        """
+        return Stage(self, name)
+
+    def add(self, name, seconds):
+        """Method to add time to a stage
+
+        Args:
+            name (str): Name of the stage
+            seconds (float): Time spent
+
+        Returns:
+            None
+        """
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def get_timings(self):
+        """Method to get the stage durations, including the total time since the timer was created
+
+        Returns:
+            (list((str, float))): Name and duration in seconds of each stage, in the order they were first entered
+        """
+        return list(self.stages.items()) + [("total", time.perf_counter() - self.start)]
+
+    def get_header(self):
+        """Method to format the durations as a Server-Timing header value
+
+        Returns:
+            (str): The header value, with durations in milliseconds
+        """
+        return ", ".join("{};dur={:.2f}".format(name, seconds * 1000) for name, seconds in self.get_timings())
+
+
+class NullTimer(object):
+    """Timer used when timing is disabled. Every stage is a shared no-op context manager."""
+
+    enabled = False
+
+    def stage(self, name):
+        return NULL_STAGE
+
+    def add(self, name, seconds):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def get_timer(request):
+    """Method to get the timer of a request
+
+    Args:
+        request (rest_framework.request.Request): DRF Request object
+
+    Returns:
+        (RequestTimer|NullTimer): The request's timer, or a timer that does nothing if the request is not timed
+    """
+    return getattr(request, 'boss_timer', NULL_TIMER)
+
+
+class TimingHistograms(object):
+    """Per endpoint, per stage histograms of request timings"""
+
+    def __init__(self, buckets=TIMING_BUCKETS):
+        """
+        Args:
+            buckets (tuple(float)): Upper bounds of the buckets in milliseconds
+        """
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, endpoint, timings):
+        """Method to add a request's timings to the histograms
+
+        Args:
+            endpoint (str): Name of the endpoint
+            timings (list((str, float))): Name and duration in seconds of each stage
+
+        Returns:
+            None
+        """
+        with self._lock:
+            stages = self._histograms.setdefault(endpoint, {})
+            for name, seconds in timings:
+                ms = seconds * 1000
+                hist = stages.get(name)
+                if hist is None:
+                    hist = stages[name] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                           "counts": [0] * (len(self.buckets) + 1)}
+                hist["count"] += 1
+                hist["total_ms"] += ms
+                hist["max_ms"] = max(hist["max_ms"], ms)
+                hist["counts"][self._get_bucket(ms)] += 1
+
+    def _get_bucket(self, ms):
+        for idx, bound in enumerate(self.buckets):
+            if ms <= bound:
+                return idx
+        return len(self.buckets)
+
+    def get_stats(self):
+        """Method to get a copy of the histograms
+
+        Returns:
+            (dict): Bucket bounds and, for each endpoint and stage, the count, total, max and bucket counts
+        """
+        with self._lock:
+            return {"buckets_ms": list(self.buckets),
+                    "endpoints": {endpoint: {name: dict(hist, counts=list(hist["counts"]))
+                                             for name, hist in stages.items()}
+                                  for endpoint, stages in self._histograms.items()}}
+
+
+timing_histograms = TimingHistograms()
+
+
+def record_histograms(endpoint, timings):
+    """Default timing sink, aggregating timings into the worker's histograms
+
+    Args:
+        endpoint (str): Name of the endpoint
+        timings (list((str, float))): Name and duration in seconds of each stage
+
+    Returns:
+        None
+    """
+    timing_histograms.record(endpoint, timings)
+
+
+_sink = {"path": None, "callable": None}
+
+
+def get_sink():
+    """Method to get the callable that settings.BOSS_TIMING_SINK names
+
+    Returns:
+        (callable|None): Called with the endpoint name and timings of each request, or None if there is no sink
+    """
+    path = settings.BOSS_TIMING_SINK
+    if _sink["path"] != path:
+        _sink["callable"] = import_string(path) if path else None
+        _sink["path"] = path
+    return _sink["callable"]
+
+
+class TimingMixin(object):
+    """APIView mixin that times requests
+
+    A timer is attached to the request before it is handled. When the response is finalized it is rendered in a
+    "render" stage, the timings are added as a Server-Timing header and they are passed to the sink. Streamed
+    responses only include the stages that ran before the first byte was sent.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        request.boss_timer = RequestTimer() if settings.BOSS_TIMING_ENABLED else NULL_TIMER
+        super().initial(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        timer = get_timer(request)
+        if not timer.enabled:
+            return response
+
+        if isinstance(response, Response) and not response.is_rendered:
+            with timer.stage("render"):
+                response.render()
+
+        response['Server-Timing'] = timer.get_header()
+
+        sink = get_sink()
+        if sink is not None:
+            sink("{}.{}".format(self.__class__.__name__, request.method), timer.get_timings())
+
+        return response
@@ -17,14 +17,14 @@ from rest_framework.response import Response
 
 from bosscore.request import BossRequest
 from bosscore.error import BossError, BossHTTPError, ErrorCodes
+from bosscore.timing import TimingMixin, get_timer
 
-from spdb.spatialdb.spatialdb import SpatialDB
 from spdb import project
 
-from django.conf import settings
+from bossspatialdb.pool import get_spatialdb
 
 
-class Reserve(APIView):
+class Reserve(TimingMixin, APIView):
     """
         View to reserve annotation object ids
 
@@ -66,15 +66,16 @@ class Reserve(APIView):
         resource = project.BossResourceDjango(req)
         try:
             # Reserve ids
-            spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
-            start_id = spdb.reserve_ids(resource, int(num_ids))
+            spdb = get_spatialdb()
+            with get_timer(request).stage("fetch"):
+                start_id = spdb.reserve_ids(resource, int(num_ids))
             data = {'start_id': start_id[0], 'count': num_ids}
             return Response(data, status=200)
         except (TypeError, ValueError)as e:
             return BossHTTPError("Type error in the reserve id view. {}".format(e), ErrorCodes.TYPE_ERROR)
 
 
-class Ids(APIView):
+class Ids(TimingMixin, APIView):
     """
         View to get the ids of all the annotation objects in a spatial region
 
@@ -124,14 +125,15 @@ class Ids(APIView):
 
         try:
             # Reserve ids
-            spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
-            ids = spdb.get_ids_in_region(resource, int(resolution), corner, extent)
+            spdb = get_spatialdb()
+            with get_timer(request).stage("fetch"):
+                ids = spdb.get_ids_in_region(resource, int(resolution), corner, extent)
             return Response(ids, status=200)
         except (TypeError, ValueError) as e:
             return BossHTTPError("Type error in the ids view. {}".format(e), ErrorCodes.TYPE_ERROR)
 
 
-class BoundingBox(APIView):
+class BoundingBox(TimingMixin, APIView):
     """
         View to reserve annotation object ids
 
@@ -184,8 +186,9 @@ class BoundingBox(APIView):
 
         try:
             # Get interface to SPDB cache
-            spdb = SpatialDB(settings.KVIO_SETTINGS, settings.STATEIO_CONFIG, settings.OBJECTIO_CONFIG)
-            data = spdb.get_bounding_box(resource, int(resolution), int(id), bb_type=bb_type)
+            spdb = get_spatialdb()
+            with get_timer(request).stage("fetch"):
+                data = spdb.get_bounding_box(resource, int(resolution), int(id), bb_type=bb_type)
             if data is None:
                 return BossHTTPError("The id does not exist. {}".format(id), ErrorCodes.OBJECT_NOT_FOUND)
             return Response(data, status=200)
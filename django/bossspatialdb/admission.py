@@ -0,0 +1,351 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Cross-worker admission control for large cutouts
+#
+# All workers on a node share a budget of uncompressed cutout bytes in flight, tracked in redis. A request takes a
+# lease on its bytes before any data is allocated and releases it once its response has been sent. When the budget is
+# exhausted a request waits for a short time and is then rejected so the client can retry later. Each lease also
+# records when it expires, so bytes held by a worker that died without releasing them are reclaimed. Streamed
+# responses renew their leases as they send data, so a long response never has its bytes reclaimed while it runs.
+
+import socket
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from rest_framework.response import Response
+
+from bosscore.timing import get_timer
+
+from .pool import get_spatialdb
+
+ADMISSION_PREFIX = "CUTOUT-ADMISSION"
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be admitted before its wait times out"""
+    pass
+
+
+class Lease(object):
+    """Bytes admitted for one request. Closing the lease releases them."""
+
+    def __init__(self, controller, token, nbytes):
+        """
+        Args:
+            controller (AdmissionController): Controller the lease was taken from
+            token (str): Unique id of the lease
+            nbytes (int): Number of bytes held
+        """
+        self.controller = controller
+        self.token = token
+        self.nbytes = nbytes
+        self._released = False
+
+    def close(self):
+        """Method to release the lease. Safe to call more than once.
+
+        Django calls close() on the objects attached to a response once the response has been sent.
+
+        Returns:
+            None
+        """
+        if not self._released:
+            self._released = True
+            self.controller.release(self)
+
+    def renew(self):
+        """Method to push back the lease's expiry, so it isn't reclaimed while it is still in use
+
+        Returns:
+            None
+        """
+        if not self._released:
+            self.controller.renew(self)
+
+
+class AdmissionController(object):
+    """Shared budget of bytes in flight, backed by a redis counter and a hash of leases"""
+
+    def __init__(self, client, name, budget, lease_ttl=900, poll_interval=0.1):
+        """
+        Args:
+            client (redis.StrictRedis): Redis client holding the budget
+            name (str): Name of the budget, shared by every worker that draws from it
+            budget (int): Maximum number of bytes in flight
+            lease_ttl (int): Number of seconds after which an unreleased lease is reclaimed
+            poll_interval (float): Number of seconds between attempts while waiting
+        """
+        self.client = client
+        self.budget = budget
+        self.lease_ttl = lease_ttl
+        self.poll_interval = poll_interval
+        self.counter_key = "{}&{}&BYTES".format(ADMISSION_PREFIX, name)
+        self.lease_key = "{}&{}&LEASES".format(ADMISSION_PREFIX, name)
+
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0, "reclaimed": 0}
+
+    def acquire(self, nbytes, timeout=0):
+        """Method to take a lease on bytes from the budget, waiting for them to become available
+
+        A request is always admitted when nothing else is in flight, even if it is larger than the budget, so a
+        budget smaller than the largest allowed request can't block that request forever.
+
+        Args:
+            nbytes (int): Number of bytes needed
+            timeout (float): Maximum number of seconds to wait
+
+        Returns:
+            (Lease): The lease
+
+        Raises:
+            (AdmissionRejected): If the bytes did not become available before the timeout
+        """
+        token = uuid.uuid4().hex
+        deadline = time.time() + timeout
+        queued = False
+
+        while True:
+            pipe = self.client.pipeline()
+            pipe.incrby(self.counter_key, nbytes)
+            pipe.hset(self.lease_key, token, "{}:{}".format(nbytes, time.time() + self.lease_ttl))
+            in_flight, _ = pipe.execute()
+
+            if int(in_flight) <= self.budget or int(in_flight) == nbytes:
+                with self._lock:
+                    self._stats["admitted"] += 1
+                return Lease(self, token, nbytes)
+
+            # Over budget, give the bytes back
+            self._remove_lease(token, nbytes)
+            self.reclaim_expired()
+
+            if time.time() >= deadline:
+                with self._lock:
+                    self._stats["rejected"] += 1
+                raise AdmissionRejected("{} bytes in flight, budget is {}".format(int(in_flight) - nbytes,
+                                                                                   self.budget))
+
+            if not queued:
+                queued = True
+                with self._lock:
+                    self._stats["queued"] += 1
+            time.sleep(self.poll_interval)
+
+    def release(self, lease):
+        """Method to return a lease's bytes to the budget
+
+        Args:
+            lease (Lease): The lease to release
+
+        Returns:
+            None
+        """
+        self._remove_lease(lease.token, lease.nbytes)
+
+    def renew(self, lease):
+        """Method to push back a lease's expiry by the lease TTL, unless it was already released or reclaimed
+
+        Args:
+            lease (Lease): The lease to renew
+
+        Returns:
+            (bool): True if the lease was renewed
+        """
+        if not self.client.hexists(self.lease_key, lease.token):
+            return False
+        self.client.hset(self.lease_key, lease.token, "{}:{}".format(lease.nbytes, time.time() + self.lease_ttl))
+        return True
+
+    def _remove_lease(self, token, nbytes):
+        """Method to remove a lease and subtract its bytes, unless it was already removed
+
+        Args:
+            token (str): Unique id of the lease
+            nbytes (int): Number of bytes held by the lease
+
+        Returns:
+            (bool): True if the lease was removed by this call
+        """
+        if self.client.hdel(self.lease_key, token):
+            self.client.decrby(self.counter_key, nbytes)
+            return True
+        return False
+
+    def reclaim_expired(self):
+        """Method to release leases that outlived their TTL, eg. because the worker holding them died
+
+        Returns:
+            (int): Number of leases reclaimed
+        """
+        now = time.time()
+        reclaimed = 0
+        for token, value in self.client.hgetall(self.lease_key).items():
+            nbytes, expires = value.decode().split(":")
+            if float(expires) < now and self._remove_lease(token, int(nbytes)):
+                reclaimed += 1
+
+        if reclaimed:
+            with self._lock:
+                self._stats["reclaimed"] += reclaimed
+        return reclaimed
+
+    def get_stats(self):
+        """Method to get the budget's usage and this worker's counters
+
+        Returns:
+            (dict): Usage and counter values
+        """
+        pipe = self.client.pipeline()
+        pipe.get(self.counter_key)
+        pipe.hlen(self.lease_key)
+        in_flight, leases = pipe.execute()
+
+        with self._lock:
+            stats = dict(self._stats)
+        stats["budget"] = self.budget
+        stats["in_flight_bytes"] = int(in_flight or 0)
+        stats["leases"] = leases
+        return stats
+
+
+_controller = {"instance": None}
+
+
+def get_admission_controller():
+    """Method to get the worker's admission controller
+
+    The budget is shared by every worker on the node, since they share its memory. It is kept in the cache's redis.
+
+    Returns:
+        (AdmissionController|None): The controller, or None if settings.CUTOUT_ADMISSION_BUDGET disables it
+    """
+    if not settings.CUTOUT_ADMISSION_BUDGET:
+        return None
+
+    client = get_spatialdb().kvio.cache_client
+    if _controller["instance"] is None or _controller["instance"].client is not client:
+        _controller["instance"] = AdmissionController(client, socket.gethostname(),
+                                                      settings.CUTOUT_ADMISSION_BUDGET,
+                                                      settings.CUTOUT_ADMISSION_LEASE_TTL)
+    return _controller["instance"]
+
+
+def admit(nbytes):
+    """Method to admit a request that will hold nbytes of uncompressed data
+
+    Requests smaller than settings.CUTOUT_ADMISSION_BYPASS_SIZE are not counted, so small reads are never queued
+    behind large ones.
+
+    Args:
+        nbytes (int): Number of uncompressed bytes the request will hold
+
+    Returns:
+        (Lease|None): The lease to close once the response has been sent, or None if the request bypassed admission
+
+    Raises:
+        (AdmissionRejected): If the budget stayed exhausted for settings.CUTOUT_ADMISSION_QUEUE_TIMEOUT seconds
+    """
+    if nbytes < settings.CUTOUT_ADMISSION_BYPASS_SIZE:
+        return None
+
+    controller = get_admission_controller()
+    if controller is None:
+        return None
+
+    return controller.acquire(int(nbytes), settings.CUTOUT_ADMISSION_QUEUE_TIMEOUT)
+
+
+def renew_while_streaming(chunks, leases, interval):
+    """Generator to pass through the chunks of a streamed response, renewing its leases as it goes
+
+    Args:
+        chunks (iterable(bytes)): The response's chunks
+        leases (list(Lease)): Leases held by the response
+        interval (float): Minimum number of seconds between renewals
+
+    Yields:
+        (bytes): Each chunk
+    """
+    renewed = time.monotonic()
+    for chunk in chunks:
+        if time.monotonic() - renewed >= interval:
+            for lease in leases:
+                lease.renew()
+            renewed = time.monotonic()
+        yield chunk
+
+
+class AdmissionMixin(object):
+    """View mixin that releases a request's admission leases once its response has been sent
+
+    Leases are taken either by the view (stored in self.admission_lease) or by a parser (stored in the parser context)
+    and are attached to the response, which closes them after the last byte is sent. Responses are rendered before
+    they are returned and leases are released if the view raises, so a failed request never holds its bytes until
+    they are reclaimed. Streamed responses renew their leases while they are sent. Rejected requests get a
+    Retry-After header.
+    """
+    admission_lease = None
+
+    def get_admission_leases(self, request):
+        """Method to get the leases held by the request
+
+        Args:
+            request (rest_framework.request.Request): The request
+
+        Returns:
+            (list(Lease)): The leases
+        """
+        parser_context = getattr(request, 'parser_context', None) or {}
+        return [lease for lease in (self.admission_lease, parser_context.get('admission_lease')) if lease is not None]
+
+    def handle_exception(self, exc):
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # DRF re-raises exceptions it doesn't handle without finalizing a response, which would close the leases
+            for lease in self.get_admission_leases(self.request):
+                lease.close()
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+
+        leases = self.get_admission_leases(request)
+        if leases and isinstance(response, Response) and not response.is_rendered:
+            # Render now, while a failing renderer can still release the leases
+            try:
+                with get_timer(request).stage("render"):
+                    response.render()
+            except Exception:
+                for lease in leases:
+                    lease.close()
+                raise
+
+        if leases and isinstance(response, StreamingHttpResponse):
+            response.streaming_content = renew_while_streaming(response.streaming_content, leases,
+                                                               settings.CUTOUT_ADMISSION_LEASE_TTL / 3.0)
+
+        for lease in leases:
+            response._closable_objects.append(lease)
+
+        if response.status_code == 503:
+            response['Retry-After'] = str(settings.CUTOUT_ADMISSION_RETRY_AFTER)
+
+        return response
@@ -17,3 +17,8 @@ from django.apps import AppConfig
 
 class BossspatialdbConfig(AppConfig):
     name = 'bossspatialdb'
+
+    def ready(self):
+        # Apply the asynchronous writes left by exited workers when a worker starts
+        from .writebehind import register_write_behind_start
+        register_write_behind_start()
@@ -0,0 +1,234 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Methods to read many small regions of one channel while reading each cuboid once
+#
+# Regions are produced in request order. The cuboids a region needs that have not been read yet are fetched in runs of
+# consecutive x indices, kept until the last region that uses them has been produced, and then dropped. Cuboids shared
+# by overlapping or neighbouring regions are therefore read once, and only the working set is held in memory. The size
+# of the working set depends on the order of the regions; get_batch_peak_size computes it from the same plan so the
+# request can be admitted for it.
+
+import numpy as np
+
+from bosscore.error import BossError, ErrorCodes
+
+from .cuboids import iter_cuboid_indices, get_cuboid_region, clip_to_region
+
+
+def parse_regions(regions):
+    """Method to validate and convert the regions of a batch request
+
+    Args:
+        regions (list(dict)): Regions with "x", "y" and "z" python style ranges (eg. {"x": "0:64", ...})
+
+    Returns:
+        (list(((int, int, int), (int, int, int)))): (x, y, z) corner and extent of each region
+
+    Raises:
+        BossError: If a region is invalid
+    """
+    if not isinstance(regions, list) or not regions:
+        raise BossError("A batch request requires a non-empty list of regions", ErrorCodes.INVALID_CUTOUT_ARGS)
+
+    parsed = []
+    for region in regions:
+        try:
+            bounds = [[int(v) for v in region[axis].split(":")] for axis in ("x", "y", "z")]
+            if any(len(b) != 2 or b[0] >= b[1] or b[0] < 0 for b in bounds):
+                raise ValueError()
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise BossError("Invalid region in batch request: {}".format(region), ErrorCodes.INVALID_CUTOUT_ARGS)
+
+        parsed.append((tuple(b[0] for b in bounds), tuple(b[1] - b[0] for b in bounds)))
+
+    return parsed
+
+
+def get_union(regions):
+    """Method to get the bounding box of a list of regions
+
+    Args:
+        regions (list(((int, int, int), (int, int, int)))): (x, y, z) corner and extent of each region
+
+    Returns:
+        ((int, int, int), (int, int, int)): (x, y, z) corner and extent of the bounding box
+    """
+    start = tuple(min(corner[d] for corner, _ in regions) for d in range(3))
+    stop = tuple(max(corner[d] + extent[d] for corner, extent in regions) for d in range(3))
+    return start, tuple(stop[d] - start[d] for d in range(3))
+
+
+def get_x_runs(indices):
+    """Method to group cuboid indices into runs of consecutive x indices
+
+    Args:
+        indices (iterable((int, int, int))): (x, y, z) cuboid indices
+
+    Returns:
+        (list((int, int, int, int))): x start, x stop, y and z of each run
+    """
+    runs = []
+    for x, y, z in sorted(indices, key=lambda idx: (idx[2], idx[1], idx[0])):
+        if runs and runs[-1][1] == x and runs[-1][2] == y and runs[-1][3] == z:
+            runs[-1][1] = x + 1
+        else:
+            runs.append([x, x + 1, y, z])
+    return [tuple(run) for run in runs]
+
+
+def plan_batch_regions(regions, resolution):
+    """Method to plan the cuboids read and dropped while producing each region of a batch
+
+    Args:
+        regions (list(((int, int, int), (int, int, int)))): (x, y, z) corner and extent of each region
+        resolution (int): Resolution level
+
+    Returns:
+        (list((list, list, list))): For each region, in order, the (x, y, z) indices of the cuboids it needs, the runs
+                                    of cuboids to read before producing it (see get_x_runs) and the indices of the
+                                    cuboids no later region needs
+    """
+    # Index of the last region that needs each cuboid, so it can be dropped once that region is produced
+    last_use = {}
+    for i, (corner, extent) in enumerate(regions):
+        for index in iter_cuboid_indices(corner, extent, resolution):
+            last_use[index] = i
+
+    plan = []
+    read = set()
+    for i, (corner, extent) in enumerate(regions):
+        indices = list(iter_cuboid_indices(corner, extent, resolution))
+        runs = get_x_runs(index for index in indices if index not in read)
+        read.update(indices)
+        plan.append((indices, runs, [index for index in indices if last_use[index] == i]))
+
+    return plan
+
+
+def get_run_region(run, resolution, union_corner, union_extent):
+    """Method to get the region read for a run of cuboids
+
+    Args:
+        run ((int, int, int, int)): x start, x stop, y and z of the run
+        resolution (int): Resolution level
+        union_corner ((int, int, int)): (x, y, z) corner of the bounding box of the batch
+        union_extent ((int, int, int)): (x, y, z) extent of the bounding box of the batch
+
+    Returns:
+        ((int, int, int), (int, int, int)): (x, y, z) corner and extent of the part of the run inside the bounding box
+    """
+    x_start, x_stop, y, z = run
+    run_corner, cuboid_extent = get_cuboid_region((x_start, y, z), resolution)
+    run_extent = ((x_stop - x_start) * cuboid_extent[0], cuboid_extent[1], cuboid_extent[2])
+    return clip_to_region(run_corner, run_extent, union_corner, union_extent)
+
+
+def get_batch_peak_size(regions, resolution, num_time, itemsize):
+    """Method to get the largest number of uncompressed bytes iter_batch_regions holds at once
+
+    A run stays in memory until every cuboid read with it has been dropped, since the cuboids are views of the run.
+    The region being assembled and the previous one, which may still be being compressed, are held as well.
+
+    Args:
+        regions (list(((int, int, int), (int, int, int)))): (x, y, z) corner and extent of each region
+        resolution (int): Resolution level
+        num_time (int): Number of time samples
+        itemsize (int): Number of bytes per voxel
+
+    Returns:
+        (int): Number of bytes
+    """
+    union_corner, union_extent = get_union(regions)
+
+    live = 0
+    peak = 0
+    previous = 0
+    run_of = {}
+    runs_left = {}
+    for (corner, extent), (_, runs, dropped) in zip(regions, plan_batch_regions(regions, resolution)):
+        for run in runs:
+            _, run_extent = get_run_region(run, resolution, union_corner, union_extent)
+            nbytes = num_time * run_extent[0] * run_extent[1] * run_extent[2] * itemsize
+            live += nbytes
+            runs_left[run] = [nbytes, run[1] - run[0]]
+            for x in range(run[0], run[1]):
+                run_of[(x, run[2], run[3])] = run
+
+        region = num_time * extent[0] * extent[1] * extent[2] * itemsize
+        peak = max(peak, live + region + previous)
+        previous = region
+
+        for index in dropped:
+            run = run_of.pop(index)
+            runs_left[run][1] -= 1
+            if runs_left[run][1] == 0:
+                live -= runs_left.pop(run)[0]
+
+    return peak
+
+
+def iter_batch_regions(cache, resource, regions, resolution, time_range, filter_ids=None, iso=False):
+    """Generator to read a list of regions, reading each cuboid they cover once
+
+    Cuboids are only read where they overlap the bounding box of all the regions.
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the spatial database
+        resource (spdb.project.BossResource): Resource for the channel being read
+        regions (list(((int, int, int), (int, int, int)))): (x, y, z) corner and extent of each region
+        resolution (int): Resolution level
+        time_range ([int, int]): Start and stop time samples
+        filter_ids (list(int)): Optional annotation ids to filter the regions on
+        iso (bool): Flag indicating if the isotropic data should be read
+
+    Yields:
+        (np.ndarray): (t, z, y, x) data of each region, in order
+    """
+    union_corner, union_extent = get_union(regions)
+    num_time = time_range[1] - time_range[0]
+    dtype = resource.get_numpy_data_type()
+
+    # Cuboid index -> ((x, y, z) corner, (t, z, y, x) data) of the part of the cuboid inside the bounding box
+    blocks = {}
+    for (corner, extent), (indices, runs, dropped) in zip(regions, plan_batch_regions(regions, resolution)):
+        for run in runs:
+            x_start, x_stop, y, z = run
+            run_corner, run_extent = get_run_region(run, resolution, union_corner, union_extent)
+
+            run_data = cache.cutout(resource, run_corner, run_extent, resolution, time_range,
+                                    filter_ids=filter_ids, iso=iso).data
+
+            for x in range(x_start, x_stop):
+                cuboid_corner, cuboid_extent = get_cuboid_region((x, y, z), resolution)
+                block_corner, block_extent = clip_to_region(cuboid_corner, cuboid_extent, run_corner, run_extent)
+                x_offset = block_corner[0] - run_corner[0]
+                blocks[(x, y, z)] = (block_corner, run_data[:, :, :, x_offset:x_offset + block_extent[0]])
+
+        data = np.zeros((num_time, extent[2], extent[1], extent[0]), dtype=dtype)
+        for index in indices:
+            block_corner, block = blocks[index]
+            block_extent = (block.shape[3], block.shape[2], block.shape[1])
+            overlap_corner, overlap_extent = clip_to_region(block_corner, block_extent, corner, extent)
+            src = [overlap_corner[d] - block_corner[d] for d in range(3)]
+            dst = [overlap_corner[d] - corner[d] for d in range(3)]
+            data[:, dst[2]:dst[2] + overlap_extent[2], dst[1]:dst[1] + overlap_extent[1],
+                 dst[0]:dst[0] + overlap_extent[0]] = block[:, src[2]:src[2] + overlap_extent[2],
+                                                            src[1]:src[1] + overlap_extent[1],
+                                                            src[0]:src[0] + overlap_extent[0]]
+
+        for index in dropped:
+            del blocks[index]
+
+        yield data
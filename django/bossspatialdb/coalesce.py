@@ -0,0 +1,204 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Single-flight coalescing of identical concurrent cutout reads
+#
+# Within a worker process, concurrent requests for the same region share one cache.cutout() call. Across workers an
+# optional redis lock makes only one worker page a cold region in at a time; the others wait for it and then read the
+# now warm cache.
+
+import copy
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+from .fetch import time_block_cutout
+
+
+class _Call(object):
+    """An in-flight call and the result handed to everyone waiting on it"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Run at most one call per key at a time and share its result with every concurrent caller of that key"""
+
+    def __init__(self, lock_prefix):
+        """
+        Args:
+            lock_prefix (str): Prefix of the redis keys used for cross-worker locks
+        """
+        self.lock_prefix = lock_prefix
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {"executed": 0, "coalesced": 0, "lock_waits": 0, "lock_timeouts": 0}
+
+    def do(self, key, fn, lock_client=None, lock_timeout=30):
+        """Method to run fn, or wait for an identical call already in progress and return its result
+
+        Args:
+            key (hashable): Identifies calls that produce the same result
+            fn (callable): Function with no arguments that produces the result
+            lock_client (redis.StrictRedis): If provided, also coalesce with other processes using a redis lock
+            lock_timeout (int): Maximum number of seconds to hold or wait on the redis lock
+
+        Returns:
+            (object, bool): The result and a flag indicating if it was shared from another caller's call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executed"] += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error:
+                raise call.error
+            return call.result, True
+
+        try:
+            if lock_client:
+                call.result = self._run_locked(key, fn, lock_client, lock_timeout)
+            else:
+                call.result = fn()
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+        return call.result, False
+
+    def _run_locked(self, key, fn, lock_client, lock_timeout):
+        """Method to run fn while holding a redis lock for the key
+
+        If another process holds the lock, wait for it to be released (or expire) before running fn, so that only
+        one process at a time does the expensive part of the work.
+
+        Args:
+            key (hashable): Identifies calls that produce the same result
+            fn (callable): Function with no arguments that produces the result
+            lock_client (redis.StrictRedis): Redis client used for the lock
+            lock_timeout (int): Maximum number of seconds to hold or wait on the lock
+
+        Returns:
+            (object): The result of fn
+        """
+        lock_name = "{}&{}".format(self.lock_prefix, hashlib.sha1(repr(key).encode()).hexdigest())
+        token = uuid.uuid4().hex
+        deadline = time.time() + lock_timeout
+        waited = False
+
+        while not lock_client.set(lock_name, token, nx=True, ex=lock_timeout):
+            if not waited:
+                waited = True
+                with self._lock:
+                    self._stats["lock_waits"] += 1
+            if time.time() > deadline:
+                with self._lock:
+                    self._stats["lock_timeouts"] += 1
+                return fn()
+            time.sleep(0.05)
+
+        try:
+            return fn()
+        finally:
+            current = lock_client.get(lock_name)
+            if current is not None and current.decode() == token:
+                lock_client.delete(lock_name)
+
+    def get_stats(self):
+        """Method to get the hit and coalesce counters
+
+        Returns:
+            (dict): Counter values
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+
+# Shared by all cutout style views in the worker
+cutout_flight = SingleFlight("COALESCE&CUTOUT")
+
+
+def get_cutout_key(resource, resolution, corner, extent, time_range, filter_ids=None, iso=False):
+    """Method to build the key that identifies identical cutout reads
+
+    Args:
+        resource (spdb.project.BossResource): Resource for the channel being read
+        resolution (int): Resolution level
+        corner ((int, int, int)): (x, y, z) start of the cutout
+        extent ((int, int, int)): (x, y, z) span of the cutout
+        time_range ([int, int]): Start and stop time samples
+        filter_ids (list(int)): Optional annotation ids the cutout is filtered on
+        iso (bool): Flag indicating if the isotropic data is read
+
+    Returns:
+        (tuple): The key
+    """
+    ids = tuple(int(x) for x in filter_ids) if filter_ids is not None else None
+    return (resource.get_lookup_key(), int(resolution), tuple(corner), tuple(extent), tuple(time_range), ids,
+            bool(iso))
+
+
+def coalesced_cutout(cache, resource, corner, extent, resolution, time_range, filter_ids=None, iso=False):
+    """Method to run SpatialDB.cutout(), sharing the result with identical concurrent reads
+
+    Renderers replace the data attribute of the Cube they are given, so every caller gets its own shallow copy of
+    the shared Cube. The underlying array is shared and must not be modified in place.
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the spatial database
+        resource (spdb.project.BossResource): Resource for the channel being read
+        corner ((int, int, int)): (x, y, z) start of the cutout
+        extent ((int, int, int)): (x, y, z) span of the cutout
+        resolution (int): Resolution level
+        time_range ([int, int]): Start and stop time samples
+        filter_ids (list(int)): Optional annotation ids to filter the cutout on
+        iso (bool): Flag indicating if the isotropic data should be read
+
+    Returns:
+        (spdb.spatialdb.Cube): The cutout
+    """
+    key = get_cutout_key(resource, resolution, corner, extent, time_range, filter_ids, iso)
+
+    def fetch():
+        # Long time series are read as blocks of time samples, several at a time
+        return time_block_cutout(cache, resource, corner, extent, resolution, time_range, filter_ids=filter_ids,
+                                 iso=iso, block_size=settings.CUTOUT_TIME_BLOCK_SIZE,
+                                 workers=settings.CUTOUT_TIME_WORKERS)
+
+    lock_client = None
+    if settings.CUTOUT_COALESCE_ACROSS_WORKERS:
+        lock_client = cache.kvio.cache_client
+
+    cube, _ = cutout_flight.do(key, fetch, lock_client, settings.CUTOUT_COALESCE_LOCK_TIMEOUT)
+    return copy.copy(cube)
@@ -0,0 +1,112 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Methods to map regions onto the cuboid grid
+
+import itertools
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+
+def get_cuboid_range(corner, extent, resolution):
+    """Method to get the range of cuboid indices that cover a region
+
+    Args:
+        corner ((int, int, int)): (x, y, z) start of the region
+        extent ((int, int, int)): (x, y, z) span of the region
+        resolution (int): Resolution level
+
+    Returns:
+        (list(range)): x, y and z cuboid index ranges
+    """
+    cuboid_size = CUBOIDSIZE[resolution]
+    return [range(corner[d] // cuboid_size[d], (corner[d] + extent[d] - 1) // cuboid_size[d] + 1) for d in range(3)]
+
+
+def iter_cuboid_indices(corner, extent, resolution):
+    """Generator of the (x, y, z) indices of the cuboids that cover a region
+
+    Args:
+        corner ((int, int, int)): (x, y, z) start of the region
+        extent ((int, int, int)): (x, y, z) span of the region
+        resolution (int): Resolution level
+
+    Yields:
+        ((int, int, int)): Cuboid index
+    """
+    x_range, y_range, z_range = get_cuboid_range(corner, extent, resolution)
+    for z, y, x in itertools.product(z_range, y_range, x_range):
+        yield x, y, z
+
+
+def get_num_cuboids(corner, extent, resolution):
+    """Method to count the cuboids that cover a region
+
+    Args:
+        corner ((int, int, int)): (x, y, z) start of the region
+        extent ((int, int, int)): (x, y, z) span of the region
+        resolution (int): Resolution level
+
+    Returns:
+        (int): Number of cuboids per time sample
+    """
+    x_range, y_range, z_range = get_cuboid_range(corner, extent, resolution)
+    return len(x_range) * len(y_range) * len(z_range)
+
+
+def get_cuboid_region(index, resolution):
+    """Method to get the region covered by a cuboid
+
+    Args:
+        index ((int, int, int)): (x, y, z) cuboid index
+        resolution (int): Resolution level
+
+    Returns:
+        ((int, int, int), (int, int, int)): (x, y, z) corner and extent of the cuboid
+    """
+    cuboid_size = CUBOIDSIZE[resolution]
+    corner = tuple(index[d] * cuboid_size[d] for d in range(3))
+    return corner, tuple(cuboid_size[:3])
+
+
+def clip_to_region(cuboid_corner, cuboid_extent, corner, extent):
+    """Method to intersect a cuboid with a region
+
+    Args:
+        cuboid_corner ((int, int, int)): (x, y, z) corner of the cuboid
+        cuboid_extent ((int, int, int)): (x, y, z) extent of the cuboid
+        corner ((int, int, int)): (x, y, z) start of the region
+        extent ((int, int, int)): (x, y, z) span of the region
+
+    Returns:
+        ((int, int, int), (int, int, int)): (x, y, z) corner and extent of the overlap, extents of 0 if none
+    """
+    start = tuple(max(cuboid_corner[d], corner[d]) for d in range(3))
+    stop = tuple(min(cuboid_corner[d] + cuboid_extent[d], corner[d] + extent[d]) for d in range(3))
+    return start, tuple(max(0, stop[d] - start[d]) for d in range(3))
+
+
+def is_cuboid_aligned(corner, extent, resolution):
+    """Method to check if a region starts and stops on cuboid boundaries
+
+    Args:
+        corner ((int, int, int)): (x, y, z) start of the region
+        extent ((int, int, int)): (x, y, z) span of the region
+        resolution (int): Resolution level
+
+    Returns:
+        (bool): True if the region is made of whole cuboids
+    """
+    cuboid_size = CUBOIDSIZE[resolution]
+    return all(corner[d] % cuboid_size[d] == 0 and extent[d] % cuboid_size[d] == 0 for d in range(3))
@@ -0,0 +1,164 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Cost estimates of cutouts, computed without reading any voxel data
+#
+# The cuboids covering a region are looked up in the redis cache with EXISTS, so only key metadata crosses the
+# network. Cuboids that are not cached have to be read from the object store, or are empty if they were never written.
+# Very large regions are probed on an evenly spaced sample of their cuboids and the counts are extrapolated.
+
+from spdb.c_lib import ndlib
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from .cuboids import iter_cuboid_indices, get_cuboid_range, is_cuboid_aligned
+
+
+def get_aligned_region(corner, extent, resolution):
+    """Method to get the smallest cuboid aligned region that contains a region
+
+    Args:
+        corner ((int, int, int)): (x, y, z) start of the region
+        extent ((int, int, int)): (x, y, z) span of the region
+        resolution (int): Resolution level
+
+    Returns:
+        ((int, int, int), (int, int, int)): (x, y, z) corner and extent of the aligned region
+    """
+    cuboid_size = CUBOIDSIZE[resolution]
+    ranges = get_cuboid_range(corner, extent, resolution)
+    aligned_corner = tuple(ranges[d].start * cuboid_size[d] for d in range(3))
+    aligned_extent = tuple(len(ranges[d]) * cuboid_size[d] for d in range(3))
+    return aligned_corner, aligned_extent
+
+
+def get_key_states(cache, keys):
+    """Method to look up whether cuboids are in the cache without reading them
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the spatial database
+        keys (list(str)): Cached cuboid keys
+
+    Returns:
+        (list(str)): "cached", "dirty" (writes not yet flushed to the object store) or "not_cached" for each key
+    """
+    pipe = cache.kvio.cache_client.pipeline()
+    for key in keys:
+        pipe.exists(key)
+    exists = pipe.execute()
+    dirty = cache.kvio.is_dirty(keys)
+    return ["dirty" if is_dirty else "cached" if key_exists else "not_cached"
+            for key_exists, is_dirty in zip(exists, dirty)]
+
+
+def get_cache_residency(cache, resource, corner, extent, resolution, time_range, iso=False, max_probes=None):
+    """Method to count the cuboids of a region that are cached, waiting in the write buffer or not cached
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the spatial database
+        resource (spdb.project.BossResource): Resource for the channel being read
+        corner ((int, int, int)): (x, y, z) start of the region
+        extent ((int, int, int)): (x, y, z) span of the region
+        resolution (int): Resolution level
+        time_range ([int, int]): Start and stop time samples
+        iso (bool): Flag indicating if the isotropic data would be read
+        max_probes (int): Maximum number of cuboid keys looked up, or None to look up every cuboid
+
+    Returns:
+        (dict): Number of cuboids that are cached, dirty (writes not yet flushed to the object store) and not cached,
+        and the number actually probed
+    """
+    indices = list(iter_cuboid_indices(corner, extent, resolution))
+    time_samples = list(range(time_range[0], time_range[1]))
+    total = len(indices) * len(time_samples)
+
+    # Probe every step-th cuboid of every time sample
+    step = 1
+    if max_probes and total > max_probes:
+        step = -(-total // max_probes)
+    probed_indices = indices[::step]
+    morton_ids = [ndlib.XYZMorton(list(index)) for index in probed_indices]
+
+    counts = {"cached": 0, "dirty": 0, "not_cached": 0}
+    for t in time_samples:
+        keys = cache.kvio.generate_cached_cuboid_keys(resource, resolution, [t], morton_ids, iso=iso)
+        for state in get_key_states(cache, keys):
+            counts[state] += 1
+
+    num_probed = len(probed_indices) * len(time_samples)
+    if num_probed and num_probed < total:
+        # Scale the sampled counts up to the whole region, keeping the total exact
+        scaled = {name: int(round(count * total / num_probed)) for name, count in counts.items()}
+        scaled["not_cached"] = total - scaled["cached"] - scaled["dirty"]
+        counts = scaled
+
+    counts["probed"] = num_probed
+    return counts
+
+
+def estimate_latency(num_cached, num_dirty, num_not_cached, num_bytes, model):
+    """Method to estimate how long a cutout would take to serve
+
+    Args:
+        num_cached (int): Number of cuboids in the cache
+        num_dirty (int): Number of cuboids with writes in the write buffer
+        num_not_cached (int): Number of cuboids not in the cache
+        num_bytes (int): Uncompressed size of the cutout
+        model (dict): Seconds per cached and per not cached cuboid ("cached_cuboid_s", "cold_cuboid_s") and
+            uncompressed bytes encoded per second ("bytes_per_s")
+
+    Returns:
+        (float): Estimated seconds
+    """
+    # Dirty cuboids are read from the write buffer, which costs about as much as reading the cache
+    return ((num_cached + num_dirty) * model["cached_cuboid_s"] + num_not_cached * model["cold_cuboid_s"] +
+            num_bytes / float(model["bytes_per_s"]))
+
+
+def estimate_cutout(cache, resource, corner, extent, resolution, time_range, iso=False, max_probes=None,
+                    model=None):
+    """Method to estimate the cost of a cutout without reading its data
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the spatial database
+        resource (spdb.project.BossResource): Resource for the channel being read
+        corner ((int, int, int)): (x, y, z) start of the cutout
+        extent ((int, int, int)): (x, y, z) span of the cutout
+        resolution (int): Resolution level
+        time_range ([int, int]): Start and stop time samples
+        iso (bool): Flag indicating if the isotropic data would be read
+        max_probes (int): Maximum number of cuboid keys looked up, or None to look up every cuboid
+        model (dict): Latency model (see estimate_latency), or None to not estimate the latency
+
+    Returns:
+        (dict): Size, cuboid grid and cache residency of the cutout and its estimated latency
+    """
+    num_time = time_range[1] - time_range[0]
+    num_bytes = extent[0] * extent[1] * extent[2] * num_time * resource.get_bit_depth() // 8
+    x_range, y_range, z_range = get_cuboid_range(corner, extent, resolution)
+    aligned_corner, aligned_extent = get_aligned_region(corner, extent, resolution)
+
+    residency = get_cache_residency(cache, resource, corner, extent, resolution, time_range, iso, max_probes)
+
+    estimate = {"uncompressed_bytes": num_bytes,
+                "cuboid_size": list(CUBOIDSIZE[resolution][:3]),
+                "cuboid_aligned": is_cuboid_aligned(corner, extent, resolution),
+                "aligned_region": {"corner": list(aligned_corner), "extent": list(aligned_extent)},
+                "cuboids_per_time_sample": len(x_range) * len(y_range) * len(z_range),
+                "time_samples": num_time,
+                "cuboids": residency}
+
+    if model:
+        estimate["estimated_seconds"] = estimate_latency(residency["cached"], residency["dirty"],
+                                                         residency["not_cached"], num_bytes, model)
+    return estimate
@@ -0,0 +1,218 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Methods to pull cutouts out of the spatial database in bounded pieces
+#
+# Long time series are read as blocks of time samples fetched concurrently on a bounded pool of threads. Cache and
+# object store reads spend their time waiting on the network, so the threads overlap them despite the GIL.
+
+import copy
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+# Target number of uncompressed bytes held per slab when streaming a cutout
+SLAB_TARGET_SIZE = 64 * 1048576
+
+
+def get_slab_offset(offset):
+    """Method to get the (t, z, y, x) offset of a slab
+
+    Args:
+        offset (int|(int, int)): z offset, or (t, z) offset of a slab of a time block, relative to the cutout
+
+    Returns:
+        ((int, int, int, int)): (t, z, y, x) offset relative to the start of the cutout
+    """
+    if isinstance(offset, tuple):
+        return offset[0], offset[1], 0, 0
+    return 0, offset, 0, 0
+
+
+def get_slab_ranges(corner, extent, resolution, num_time, bit_depth, target_size=SLAB_TARGET_SIZE):
+    """Method to split the z range of a cutout into cuboid aligned slabs
+
+    Args:
+        corner ((int, int, int)): (x, y, z) start of the cutout
+        extent ((int, int, int)): (x, y, z) span of the cutout
+        resolution (int): Resolution level
+        num_time (int): Number of time samples read with each slab
+        bit_depth (int): Bit depth of the channel
+        target_size (int): Approximate number of uncompressed bytes per slab
+
+    Returns:
+        (list((int, int))): Start and stop z of each slab, in order
+    """
+    z_cuboid = CUBOIDSIZE[resolution][2]
+    cuboid_slab_bytes = extent[0] * extent[1] * z_cuboid * num_time * bit_depth // 8
+    num_cuboids = max(1, target_size // max(1, cuboid_slab_bytes))
+
+    ranges = []
+    z = corner[2]
+    z_stop = corner[2] + extent[2]
+    while z < z_stop:
+        z_next = min((z // z_cuboid + num_cuboids) * z_cuboid, z_stop)
+        ranges.append((z, z_next))
+        z = z_next
+    return ranges
+
+
+def get_time_blocks(time_range, block_size):
+    """Method to split a time range into blocks
+
+    Args:
+        time_range ([int, int]): Start and stop time samples
+        block_size (int): Number of time samples per block
+
+    Returns:
+        (list([int, int])): Start and stop time samples of each block, in order
+    """
+    block_size = max(1, block_size)
+    return [[t, min(t + block_size, time_range[1])] for t in range(time_range[0], time_range[1], block_size)]
+
+
+def iter_ordered(fn, items, workers):
+    """Generator to apply a function to items on a pool of threads, yielding the results in order
+
+    At most workers items are in flight at a time, so the results held in memory are bounded even if the consumer is
+    slower than the fetches.
+
+    Args:
+        fn (callable): Function applied to each item
+        items (iterable): Arguments to the function
+        workers (int): Number of threads
+
+    Yields:
+        (object): Result of each item, in order
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = deque()
+        try:
+            for item in items:
+                futures.append(executor.submit(fn, item))
+                if len(futures) >= workers:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+        finally:
+            # Don't start the remaining fetches if the consumer stopped or a fetch failed
+            for future in futures:
+                future.cancel()
+
+
+def iter_z_slabs(cache, resource, corner, extent, resolution, time_range, filter_ids=None, iso=False,
+                 target_size=SLAB_TARGET_SIZE):
+    """Generator to fetch a cutout as a sequence of cuboid aligned z-slabs
+
+    Each slab spans the full x/y extent and time range of the request and is a whole number of cuboids thick
+    (except at the ends of the range) so no cuboid is read twice. Only one slab is held in memory at a time.
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the spatial database
+        resource (spdb.project.BossResource): Resource for the channel being read
+        corner ((int, int, int)): (x, y, z) start of the cutout
+        extent ((int, int, int)): (x, y, z) span of the cutout
+        resolution (int): Resolution level
+        time_range ([int, int]): Start and stop time samples
+        filter_ids (list(int)): Optional annotation ids to filter the cutout on
+        iso (bool): Flag indicating if the isotropic data should be read
+        target_size (int): Approximate number of uncompressed bytes per slab
+
+    Yields:
+        (int, spdb.spatialdb.Cube): The slab's z offset relative to the start of the cutout and its data
+    """
+    for z, z_next in get_slab_ranges(corner, extent, resolution, time_range[1] - time_range[0],
+                                     resource.get_bit_depth(), target_size):
+        cube = cache.cutout(resource, (corner[0], corner[1], z), (extent[0], extent[1], z_next - z), resolution,
+                            time_range, filter_ids=filter_ids, iso=iso)
+        yield z - corner[2], cube
+
+
+def iter_time_slabs(cache, resource, corner, extent, resolution, time_range, filter_ids=None, iso=False,
+                    block_size=1, workers=1, target_size=SLAB_TARGET_SIZE):
+    """Generator to fetch a time series cutout as z-slabs of blocks of time samples, several at a time
+
+    Slabs are yielded time block by time block, in order, as soon as they arrive, so the first time samples can be
+    sent before the last are read. At most workers slabs are held in memory at a time.
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the spatial database
+        resource (spdb.project.BossResource): Resource for the channel being read
+        corner ((int, int, int)): (x, y, z) start of the cutout
+        extent ((int, int, int)): (x, y, z) span of the cutout
+        resolution (int): Resolution level
+        time_range ([int, int]): Start and stop time samples
+        filter_ids (list(int)): Optional annotation ids to filter the cutout on
+        iso (bool): Flag indicating if the isotropic data should be read
+        block_size (int): Number of time samples per block
+        workers (int): Number of slabs fetched concurrently
+        target_size (int): Approximate number of uncompressed bytes per slab
+
+    Yields:
+        ((int, int), spdb.spatialdb.Cube): The slab's (t, z) offset relative to the start of the cutout and its data
+    """
+    blocks = get_time_blocks(time_range, block_size)
+    units = [(block, z_range) for block in blocks
+             for z_range in get_slab_ranges(corner, extent, resolution, block[1] - block[0],
+                                            resource.get_bit_depth(), target_size)]
+
+    def fetch(unit):
+        block, (z, z_next) = unit
+        return cache.cutout(resource, (corner[0], corner[1], z), (extent[0], extent[1], z_next - z), resolution,
+                            block, filter_ids=filter_ids, iso=iso)
+
+    for (block, (z, _)), cube in zip(units, iter_ordered(fetch, units, workers)):
+        yield (block[0] - time_range[0], z - corner[2]), cube
+
+
+def time_block_cutout(cache, resource, corner, extent, resolution, time_range, filter_ids=None, iso=False,
+                      block_size=1, workers=1):
+    """Method to fetch a cutout as blocks of time samples, several at a time
+
+    The blocks are copied into a preallocated 4D array as they arrive. A range that fits in a single block is read
+    with one cache.cutout() call.
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the spatial database
+        resource (spdb.project.BossResource): Resource for the channel being read
+        corner ((int, int, int)): (x, y, z) start of the cutout
+        extent ((int, int, int)): (x, y, z) span of the cutout
+        resolution (int): Resolution level
+        time_range ([int, int]): Start and stop time samples
+        filter_ids (list(int)): Optional annotation ids to filter the cutout on
+        iso (bool): Flag indicating if the isotropic data should be read
+        block_size (int): Number of time samples per block
+        workers (int): Number of blocks fetched concurrently
+
+    Returns:
+        (spdb.spatialdb.Cube): The cutout
+    """
+    blocks = get_time_blocks(time_range, block_size)
+    if len(blocks) < 2 or workers < 2:
+        return cache.cutout(resource, corner, extent, resolution, time_range, filter_ids=filter_ids, iso=iso)
+
+    def fetch(block):
+        return cache.cutout(resource, corner, extent, resolution, block, filter_ids=filter_ids, iso=iso)
+
+    result = None
+    for block, cube in zip(blocks, iter_ordered(fetch, blocks, workers)):
+        if result is None:
+            # Renderers only read the data, so the first block's Cube is reused to hold the whole range
+            result = copy.copy(cube)
+            result.data = np.empty((time_range[1] - time_range[0],) + cube.data.shape[1:], dtype=cube.data.dtype)
+        result.data[block[0] - time_range[0]:block[1] - time_range[0]] = cube.data
+    return result
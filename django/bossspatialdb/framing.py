@@ -0,0 +1,375 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Framed binary container used by cutout responses that are made of several independently encoded pieces.
+
+A framed response is a sequence of frames. Each frame is a fixed size, little-endian header followed by
+`nbytes` of payload:
+
+    magic    4s   b'BOSF'
+    version  B    FRAME_VERSION
+    codec    B    How the payload is encoded (CODEC_*)
+    ndim     B    Number of dimensions of the full response (3 for zyx, 4 for tzyx)
+    flags    B    FLAG_* bits
+    dtype    8s   Numpy dtype string of the decoded payload, null padded (eg. b'<u2')
+    offset   4Q   (t, z, y, x) offset of the frame's data relative to the start of the response
+    shape    4Q   (t, z, y, x) shape of the frame's data
+    nbytes   Q    Number of payload bytes following the header
+
+The last frame of a response has FLAG_END set, no payload, a zero offset and the shape of the full response.
+A client that does not receive it knows the response was truncated.
+
+Batch responses hold one data frame per requested region, in request order. Those frames have FLAG_REGION set and
+their offset is the region's absolute (t, z, y, x) corner instead of a position within the response. The end frame
+of a batch response has the shape (number of regions, 0, 0, 0).
+
+Stacked responses hold one data frame per requested channel, in request order. Those frames have FLAG_CHANNEL set,
+their offset is the absolute (t, z, y, x) corner of the cutout and their dtype is the channel's, so channels of
+different data types can share a response. The end frame of a stacked response has the shape
+(number of channels, 0, 0, 0).
+
+The zstd and lz4 codecs hold the raw, C-ordered bytes of the frame's data as a single zstd or lz4 frame. They are
+only available when the zstandard and lz4 packages are installed (see codec_available()).
+"""
+
+from collections import namedtuple
+import struct
+
+import blosc
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
+FRAME_MAGIC = b'BOSF'
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('<4sBBBB8s4Q4QQ')
+
+# Payload codecs
+CODEC_RAW = 0
+CODEC_BLOSC = 1
+CODEC_BLOSC_PACKED = 2
+CODEC_ZSTD = 3
+CODEC_LZ4 = 4
+
+# Frame flags
+FLAG_END = 0x01
+FLAG_REGION = 0x02
+FLAG_CHANNEL = 0x04
+
+FrameHeader = namedtuple('FrameHeader', ['codec', 'ndim', 'flags', 'dtype', 'offset', 'shape', 'nbytes'])
+
+
+def pack_frame_header(codec, ndim, dtype, offset, shape, nbytes, flags=0):
+    """Method to build a frame header
+
+    Args:
+        codec (int): Payload codec (CODEC_*)
+        ndim (int): Number of dimensions of the full response (3 or 4)
+        dtype (np.dtype): Data type of the decoded payload
+        offset (tuple(int)): (t, z, y, x) offset of the frame's data
+        shape (tuple(int)): (t, z, y, x) shape of the frame's data
+        nbytes (int): Number of payload bytes following the header
+        flags (int): FLAG_* bits
+
+    Returns:
+        (bytes): The encoded header
+    """
+    return FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, codec, ndim, flags, np.dtype(dtype).str.encode(),
+                             *offset, *shape, nbytes)
+
+
+def unpack_frame_header(buf, pos=0):
+    """Method to decode a frame header
+
+    Args:
+        buf (bytes-like): Buffer containing the header
+        pos (int): Position of the header in the buffer
+
+    Returns:
+        (FrameHeader): The decoded header
+
+    Raises:
+        (ValueError): If the buffer does not contain a valid frame header
+    """
+    if len(buf) - pos < FRAME_HEADER.size:
+        raise ValueError("Frame header is truncated")
+
+    fields = FRAME_HEADER.unpack_from(buf, pos)
+    if fields[0] != FRAME_MAGIC:
+        raise ValueError("Invalid frame magic {}".format(fields[0]))
+    if fields[1] != FRAME_VERSION:
+        raise ValueError("Unsupported frame version {}".format(fields[1]))
+
+    return FrameHeader(codec=fields[2], ndim=fields[3], flags=fields[4],
+                       dtype=np.dtype(fields[5].rstrip(b'\0').decode()),
+                       offset=tuple(fields[6:10]), shape=tuple(fields[10:14]), nbytes=fields[14])
+
+
+def end_frame(ndim, dtype, shape):
+    """Method to build the frame that terminates a framed response
+
+    Args:
+        ndim (int): Number of dimensions of the full response (3 or 4)
+        dtype (np.dtype): Data type of the response
+        shape (tuple(int)): (t, z, y, x) shape of the full response
+
+    Returns:
+        (bytes): The encoded frame
+    """
+    return pack_frame_header(CODEC_RAW, ndim, dtype, (0, 0, 0, 0), shape, 0, flags=FLAG_END)
+
+
+def blosc_frame(data, offset, ndim, flags=0):
+    """Method to blosc compress a 4D block of data into a frame
+
+    Args:
+        data (np.ndarray): (t, z, y, x) block of data
+        offset (tuple(int)): (t, z, y, x) offset of the block relative to the start of the response
+        ndim (int): Number of dimensions of the full response (3 or 4)
+        flags (int): FLAG_* bits
+
+    Returns:
+        (bytes, bytes): The frame header and the compressed payload
+    """
+    data = np.ascontiguousarray(data)
+    payload = blosc.compress(data, typesize=data.dtype.itemsize)
+    return pack_frame_header(CODEC_BLOSC, ndim, data.dtype, offset, data.shape, len(payload), flags=flags), payload
+
+
+def codec_available(codec):
+    """Method to check if the library a codec needs is installed
+
+    Args:
+        codec (int): Payload codec (CODEC_*)
+
+    Returns:
+        (bool): True if payloads can be encoded and decoded with the codec
+    """
+    if codec == CODEC_ZSTD:
+        return zstandard is not None
+    if codec == CODEC_LZ4:
+        return lz4frame is not None
+    return codec in (CODEC_RAW, CODEC_BLOSC, CODEC_BLOSC_PACKED)
+
+
+def codec_frame(codec, data, offset, ndim, level, flags=0):
+    """Method to compress a 4D block of data into a zstd or lz4 frame
+
+    Args:
+        codec (int): CODEC_ZSTD or CODEC_LZ4
+        data (np.ndarray): (t, z, y, x) block of data
+        offset (tuple(int)): (t, z, y, x) offset of the block relative to the start of the response
+        ndim (int): Number of dimensions of the full response (3 or 4)
+        level (int): Compression level of the codec
+        flags (int): FLAG_* bits
+
+    Returns:
+        (bytes, bytes): The frame header and the compressed payload
+
+    Raises:
+        (ValueError): If the codec is not supported
+    """
+    data = np.ascontiguousarray(data)
+    raw = memoryview(data.reshape(-1).view(np.uint8))
+    if codec == CODEC_ZSTD and zstandard is not None:
+        payload = zstandard.ZstdCompressor(level=level).compress(raw)
+    elif codec == CODEC_LZ4 and lz4frame is not None:
+        payload = lz4frame.compress(raw, compression_level=level, store_size=True)
+    else:
+        raise ValueError("Unsupported frame codec {}".format(codec))
+    return pack_frame_header(codec, ndim, data.dtype, offset, data.shape, len(payload), flags=flags), payload
+
+
+def iter_frames(buf):
+    """Generator to walk the frames of a framed response
+
+    Args:
+        buf (bytes-like): A complete framed response
+
+    Yields:
+        (FrameHeader, memoryview): Each frame's header and payload, including the end frame
+
+    Raises:
+        (ValueError): If a frame is truncated or invalid
+    """
+    view = memoryview(buf)
+    pos = 0
+    while pos < len(view):
+        header = unpack_frame_header(view, pos)
+        pos += FRAME_HEADER.size
+        if len(view) - pos < header.nbytes:
+            raise ValueError("Frame payload is truncated")
+        yield header, view[pos:pos + header.nbytes]
+        pos += header.nbytes
+
+
+def get_frame_size(header):
+    """Method to get the number of bytes of decoded data a frame header describes
+
+    Args:
+        header (FrameHeader): The frame's header
+
+    Returns:
+        (int): Number of bytes
+    """
+    t, z, y, x = header.shape
+    return t * z * y * x * header.dtype.itemsize
+
+
+def decode_frame_payload(header, payload):
+    """Method to decode the payload of a data frame
+
+    Args:
+        header (FrameHeader): The frame's header
+        payload (bytes-like): The frame's payload
+
+    Returns:
+        (np.ndarray): The (t, z, y, x) block of data
+
+    Raises:
+        (ValueError): If the codec is not supported or the payload does not decode to the header's shape
+    """
+    if header.codec == CODEC_BLOSC:
+        block = np.frombuffer(blosc.decompress(bytes(payload)), dtype=header.dtype)
+    elif header.codec == CODEC_BLOSC_PACKED:
+        block = blosc.unpack_array(bytes(payload))
+        if block.dtype != header.dtype:
+            raise ValueError("Frame data type {} does not match header {}".format(block.dtype, header.dtype))
+    elif header.codec == CODEC_ZSTD and zstandard is not None:
+        # Never decompress more than the header describes
+        try:
+            if zstandard.frame_content_size(payload) > get_frame_size(header):
+                raise ValueError("zstd frame is larger than its header describes")
+            raw = zstandard.ZstdDecompressor().decompress(payload, max_output_size=get_frame_size(header))
+        except zstandard.ZstdError as err:
+            raise ValueError("Failed to decompress zstd frame: {}".format(err))
+        block = np.frombuffer(raw, dtype=header.dtype)
+    elif header.codec == CODEC_LZ4 and lz4frame is not None:
+        decompressor = lz4frame.LZ4FrameDecompressor()
+        try:
+            raw = decompressor.decompress(payload, max_length=get_frame_size(header))
+        except RuntimeError as err:
+            raise ValueError("Failed to decompress lz4 frame: {}".format(err))
+        if not decompressor.eof:
+            raise ValueError("lz4 frame is truncated or larger than its header describes")
+        block = np.frombuffer(raw, dtype=header.dtype)
+    elif header.codec == CODEC_RAW:
+        block = np.frombuffer(payload, dtype=header.dtype)
+    else:
+        raise ValueError("Unsupported frame codec {}".format(header.codec))
+
+    if block.nbytes != get_frame_size(header):
+        raise ValueError("Frame holds {} bytes, header describes {}".format(block.nbytes, get_frame_size(header)))
+    return block.reshape(header.shape)
+
+
+def decode_frames(buf):
+    """Method to assemble a framed blosc response back into a single array
+
+    Args:
+        buf (bytes-like): A complete framed response
+
+    Returns:
+        (np.ndarray): The assembled data, 3D or 4D depending on the response
+
+    Raises:
+        (ValueError): If the response is invalid or has no end frame
+    """
+    blocks = []
+    for header, payload in iter_frames(buf):
+        if header.flags & FLAG_END:
+            data = np.zeros(header.shape, dtype=header.dtype)
+            for block_header, block in blocks:
+                t, z, y, x = block_header.offset
+                dt, dz, dy, dx = block_header.shape
+                data[t:t + dt, z:z + dz, y:y + dy, x:x + dx] = block
+            if header.ndim == 3:
+                data = np.squeeze(data, axis=(0,))
+            return data
+
+        blocks.append((header, decode_frame_payload(header, payload)))
+
+    raise ValueError("Framed response is missing its end frame")
+
+
+def decode_regions(buf):
+    """Method to decode a framed batch response into its regions
+
+    Args:
+        buf (bytes-like): A complete framed batch response
+
+    Returns:
+        (list((tuple(int), np.ndarray))): The (t, z, y, x) corner and data of each region, in request order. The
+        data is 3D or 4D depending on the response.
+
+    Raises:
+        (ValueError): If the response is invalid or has no end frame
+    """
+    regions = []
+    for header, payload in iter_frames(buf):
+        if header.flags & FLAG_END:
+            if header.shape[0] != len(regions):
+                raise ValueError("Batch response has {} regions, expected {}".format(len(regions), header.shape[0]))
+            return regions
+
+        if not header.flags & FLAG_REGION:
+            raise ValueError("Frame is not a batch region")
+
+        data = decode_frame_payload(header, payload)
+        if header.ndim == 3:
+            data = np.squeeze(data, axis=(0,))
+        regions.append((header.offset, data))
+
+    raise ValueError("Framed response is missing its end frame")
+
+
+def decode_channels(buf):
+    """Method to decode a framed stacked response into its channels
+
+    Args:
+        buf (bytes-like): A complete framed stacked response
+
+    Returns:
+        (list(np.ndarray)): The data of each channel, in request order. The data is 3D or 4D depending on the
+        response and each channel keeps its own data type.
+
+    Raises:
+        (ValueError): If the response is invalid or has no end frame
+    """
+    channels = []
+    for header, payload in iter_frames(buf):
+        if header.flags & FLAG_END:
+            if header.shape[0] != len(channels):
+                raise ValueError("Stacked response has {} channels, expected {}".format(len(channels),
+                                                                                       header.shape[0]))
+            return channels
+
+        if not header.flags & FLAG_CHANNEL:
+            raise ValueError("Frame is not a stacked channel")
+
+        data = decode_frame_payload(header, payload)
+        if header.ndim == 3:
+            data = np.squeeze(data, axis=(0,))
+        channels.append(data)
+
+    raise ValueError("Framed response is missing its end frame")
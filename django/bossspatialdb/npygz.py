@@ -0,0 +1,353 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Incremental encoding and decoding of the npygz format (a zlib compressed npy file)
+#
+# The encoder splits the array into blocks and deflates them on a thread pool, pigz style. Each block is compressed
+# independently, primed with the 32KB of data before it, and ends on a byte boundary (Z_SYNC_FLUSH), so the blocks
+# concatenate into a single valid deflate stream. The per block adler32 checksums are combined into the checksum of
+# the whole stream. The output is a standard zlib stream, readable by zlib.decompress().
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import io
+import zlib
+
+import numpy as np
+
+# Number of uncompressed bytes deflated per block
+NPYGZ_BLOCK_SIZE = 1048576
+
+# Maximum number of decompressed bytes produced by one decompress call before they are copied into the array
+DECODE_CHUNK_SIZE = 4 * 1048576
+
+# Number of compressed bytes read before the first decompress call, enough to hold any practical npy header
+HEADER_READ_SIZE = 4096
+
+# Size of the deflate window, and of the dictionary each block is primed with
+DEFLATE_WINDOW = 32768
+
+ADLER_BASE = 65521
+
+
+def adler32_combine(adler1, adler2, len2):
+    """Method to get the adler32 checksum of two concatenated buffers from the checksums of each buffer
+
+    Args:
+        adler1 (int): Checksum of the first buffer
+        adler2 (int): Checksum of the second buffer
+        len2 (int): Length of the second buffer
+
+    Returns:
+        (int): Checksum of the concatenated buffers
+    """
+    rem = len2 % ADLER_BASE
+    sum1 = adler1 & 0xffff
+    sum2 = (rem * sum1) % ADLER_BASE
+    sum1 = (sum1 + (adler2 & 0xffff) + ADLER_BASE - 1) % ADLER_BASE
+    sum2 = (sum2 + (adler1 >> 16) + (adler2 >> 16) + ADLER_BASE - rem) % ADLER_BASE
+    return sum1 | (sum2 << 16)
+
+
+def zlib_header(level):
+    """Method to build the 2 byte zlib stream header for a compression level
+
+    Args:
+        level (int): Compression level (0-9, -1 for the default)
+
+    Returns:
+        (bytes): The header
+    """
+    if level < 0:
+        level = 6
+    if level < 2:
+        flevel = 0
+    elif level < 6:
+        flevel = 1
+    elif level == 6:
+        flevel = 2
+    else:
+        flevel = 3
+
+    cmf = 0x78
+    flg = flevel << 6
+    flg += 31 - ((cmf << 8) + flg) % 31
+    return bytes([cmf, flg])
+
+
+def npy_header(data):
+    """Method to build the npy file header of an array
+
+    Args:
+        data (np.ndarray): C-contiguous array
+
+    Returns:
+        (bytes): The header, as written by np.save()
+    """
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, np.lib.format.header_data_from_array_1_0(data))
+    return header.getvalue()
+
+
+def _deflate_block(block, zdict, level, last):
+    """Method to deflate one block of the stream
+
+    Args:
+        block (memoryview): Uncompressed bytes
+        zdict (memoryview|None): Up to 32KB of data preceding the block
+        level (int): Compression level
+        last (bool): Flag indicating if this is the final block of the stream
+
+    Returns:
+        (bytes, int): The raw deflate data and the adler32 checksum of the block
+    """
+    if zdict is not None and len(zdict):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=bytes(zdict))
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+
+    deflated = compressor.compress(block) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return deflated, zlib.adler32(block)
+
+
+def iter_npygz(data, level=6, threads=4, block_size=NPYGZ_BLOCK_SIZE):
+    """Generator to encode an array as a zlib compressed npy file
+
+    At most 2 * threads blocks are in flight, so the compressed output can be sent while later blocks are still
+    being compressed.
+
+    Args:
+        data (np.ndarray): Array to encode
+        level (int): Compression level (0-9)
+        threads (int): Number of threads compressing blocks
+        block_size (int): Number of uncompressed bytes per block
+
+    Yields:
+        (bytes): Pieces of the zlib stream, in order
+    """
+    data = np.ascontiguousarray(data)
+    header = npy_header(data)
+    body = memoryview(data.reshape(-1).view(np.uint8))
+
+    # The npy header is small, so it is deflated with the first block of data
+    pieces = [memoryview(header)]
+    pieces.extend(body[offset:offset + block_size] for offset in range(0, len(body), block_size))
+
+    yield zlib_header(level)
+
+    checksum = 1
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        in_flight = deque()
+        previous = None
+        for idx, piece in enumerate(pieces):
+            # Prime each block with the end of the data before it, as a single compressor would see it
+            zdict = previous[-DEFLATE_WINDOW:] if previous is not None else None
+            in_flight.append((len(piece), executor.submit(_deflate_block, piece, zdict, level,
+                                                          idx == len(pieces) - 1)))
+            previous = piece
+
+            while len(in_flight) >= 2 * max(1, threads):
+                length, future = in_flight.popleft()
+                deflated, adler = future.result()
+                checksum = adler32_combine(checksum, adler, length)
+                yield deflated
+
+        while in_flight:
+            length, future = in_flight.popleft()
+            deflated, adler = future.result()
+            checksum = adler32_combine(checksum, adler, length)
+            yield deflated
+
+    yield checksum.to_bytes(4, 'big')
+
+
+class NpygzDecoder(object):
+    """Incremental decoder of a zlib compressed npy file
+
+    Compressed data is fed in pieces. The npy header is parsed as soon as it has been decompressed and the rest of the
+    data is copied into the final array in bounded chunks, so the decompressed file is never held separately.
+    """
+
+    def __init__(self, max_size=None, shapes=None, dtype=None):
+        """
+        Args:
+            max_size (int): Maximum number of bytes of array data accepted, or None for no limit
+            shapes (list(tuple(int))): Shapes the array may have, or None to accept any shape
+            dtype (np.dtype): Data type the array must have, or None to accept any type
+        """
+        self.max_size = max_size
+        self.shapes = [tuple(shape) for shape in shapes] if shapes is not None else None
+        self.dtype = np.dtype(dtype) if dtype is not None else None
+        self._decompressor = zlib.decompressobj()
+        self._prefix = b''
+        self._flat = None
+        self._buffer = None
+        self._offset = 0
+        self._shape = None
+        self._fortran_order = False
+
+    def feed(self, compressed):
+        """Method to decompress the next piece of the stream
+
+        Args:
+            compressed (bytes-like): The next piece of the zlib stream
+
+        Returns:
+            None
+
+        Raises:
+            (ValueError): If the data is not a valid npy file, has an unexpected shape or holds more data than its
+                header describes
+            (TypeError): If the npy header describes an unexpected data type
+            (zlib.error): If the data is not a valid zlib stream
+        """
+        if self._decompressor.eof:
+            if len(compressed):
+                raise ValueError("Data found after the end of the compressed stream")
+            return
+
+        # Bound each decompress call so a small, highly compressed input can't allocate an unbounded buffer
+        pending = compressed
+        while True:
+            if self._buffer is None:
+                limit = 65536
+            else:
+                # Ask for one byte more than needed so excess data is detected
+                limit = min(len(self._buffer) - self._offset + 1, DECODE_CHUNK_SIZE)
+            chunk = self._decompressor.decompress(pending, limit)
+            pending = self._decompressor.unconsumed_tail
+            if chunk:
+                self._write(chunk)
+            if self._decompressor.eof or (not pending and len(chunk) < limit):
+                break
+
+        if self._decompressor.unused_data:
+            raise ValueError("Data found after the end of the compressed stream")
+
+    def _write(self, chunk):
+        """Method to place decompressed bytes, parsing the npy header first
+
+        Args:
+            chunk (bytes): Decompressed bytes
+
+        Returns:
+            None
+        """
+        if self._buffer is None:
+            self._prefix += chunk
+            header_len = self._get_header_length()
+            if header_len is None or len(self._prefix) < header_len:
+                return
+            self._allocate(self._prefix[:header_len])
+            chunk = self._prefix[header_len:]
+            self._prefix = b''
+
+        if self._offset + len(chunk) > len(self._buffer):
+            raise ValueError("Compressed npy file holds more data than its header describes")
+        self._buffer[self._offset:self._offset + len(chunk)] = chunk
+        self._offset += len(chunk)
+
+    def _get_header_length(self):
+        """Method to get the total length of the npy header once enough of it is available
+
+        Returns:
+            (int|None): Length of the header including the magic string, or None if not known yet
+        """
+        if len(self._prefix) < 10:
+            return None
+        if self._prefix[:6] != b'\x93NUMPY':
+            raise ValueError("Data is not an npy file")
+        major = self._prefix[6]
+        if major == 1:
+            return 10 + int.from_bytes(self._prefix[8:10], 'little')
+        if len(self._prefix) < 12:
+            return None
+        return 12 + int.from_bytes(self._prefix[8:12], 'little')
+
+    def _allocate(self, header):
+        """Method to parse the npy header and allocate the array
+
+        Args:
+            header (bytes): The complete npy header
+
+        Returns:
+            None
+        """
+        fp = io.BytesIO(header)
+        version = np.lib.format.read_magic(fp)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+
+        if dtype.hasobject:
+            raise ValueError("Object arrays are not supported")
+        if self.dtype is not None and dtype != self.dtype:
+            raise TypeError("Compressed npy file holds {} data, expected {}".format(dtype.name, self.dtype.name))
+        if self.shapes is not None and tuple(shape) not in self.shapes:
+            raise ValueError("Compressed npy file holds an array of shape {}".format(tuple(shape)))
+
+        count = int(np.prod(shape)) if shape else 1
+        if self.max_size is not None and count * dtype.itemsize > self.max_size:
+            raise ValueError("Compressed npy file is larger than allowed")
+
+        self._shape = shape
+        self._fortran_order = fortran_order
+        self._flat = np.empty(count, dtype=dtype)
+        self._buffer = memoryview(self._flat.view(np.uint8))
+
+    def finish(self):
+        """Method to get the decoded array once the whole stream has been fed
+
+        Returns:
+            (np.ndarray): The decoded array
+
+        Raises:
+            (ValueError): If the stream or the array data is incomplete
+        """
+        if not self._decompressor.eof:
+            raise ValueError("Compressed stream is truncated")
+        if self._buffer is None or self._offset != len(self._buffer):
+            raise ValueError("Compressed npy file is missing data")
+
+        self._buffer.release()
+        self._buffer = None
+        return self._flat.reshape(self._shape, order='F' if self._fortran_order else 'C')
+
+
+def decode_npygz(stream, chunk_size=4 * 1048576, max_size=None, shapes=None, dtype=None):
+    """Method to decode a zlib compressed npy file from a stream, reading it in bounded chunks
+
+    The first read is small and the shape and type in the npy header are checked as soon as the header has been
+    decompressed, so an unexpected array is rejected before most of the stream has been read.
+
+    Args:
+        stream (stream-like object): The stream to read
+        chunk_size (int): Maximum number of compressed bytes to read at once
+        max_size (int): Maximum number of bytes of array data accepted, or None for no limit
+        shapes (list(tuple(int))): Shapes the array may have, or None to accept any shape
+        dtype (np.dtype): Data type the array must have, or None to accept any type
+
+    Returns:
+        (np.ndarray): The decoded array
+    """
+    decoder = NpygzDecoder(max_size, shapes, dtype)
+    read_size = min(chunk_size, HEADER_READ_SIZE)
+    while True:
+        chunk = stream.read(read_size)
+        if not chunk:
+            break
+        decoder.feed(chunk)
+        read_size = chunk_size
+    return decoder.finish()
@@ -17,35 +17,327 @@ from django.conf import settings
 
 import blosc
 import numpy as np
+import mmap
+import pickle
+import tempfile
 import zlib
-import io
+import struct
+
+from .npygz import decode_npygz
+from .rle import decode_rle
+from .framing import iter_frames, decode_frames, codec_available, FLAG_END, CODEC_ZSTD, CODEC_LZ4
+from .admission import admit, AdmissionRejected
 
 from bosscore.request import BossRequest
 from bosscore.error import BossParserError, BossError, ErrorCodes
 
 import spdb
 
+# Maximum number of bytes pulled off the request stream in a single read
+STREAM_CHUNK_SIZE = 4 * 1048576
+
+# Blosc chunk header: version, versionlz, flags, typesize, nbytes, blocksize, cbytes
+BLOSC_HEADER = struct.Struct('<BBBBiii')
+
+# Number of bytes a blosc.pack_array() body can be larger than the array's data: the pickle header and the blosc
+# chunk header
+BLOSC_PACKED_OVERHEAD = 65536
+
+# Blosc typesizes that can only come from a 16, 32 or 64 bit type, given either in bytes or, as the boss renderers
+# and most clients do, in bits. 1 and 8 are also the python-blosc default and the uint64 size in bytes, so they are
+# accepted for any channel.
+BLOSC_TYPED_SIZES = (2, 4, 16, 32, 64)
+
 
-def is_too_large(request_obj, bit_depth):
+def get_cutout_size(request_obj, bit_depth):
+    """Method to get the number of uncompressed bytes in a request's region
+
+    Args:
+        request_obj (bosscore.request.BossRequest): The validated request
+        bit_depth (int): Bit depth of the channel
+
+    Returns:
+        (int): Number of bytes
+    """
+    t_span = request_obj.get_time().stop - request_obj.get_time().start
+    return request_obj.get_x_span() * request_obj.get_y_span() * request_obj.get_z_span() * t_span * bit_depth // 8
+
+
+def is_too_large(request_obj, bit_depth, max_size=None):
     """Method to check if a request is too large to handle
 
     Args:
         request_obj:
+        bit_depth:
+        max_size (int): Maximum number of uncompressed bytes allowed. Defaults to settings.CUTOUT_MAX_SIZE
 
     Returns:
         bool
     """
-    t_span = request_obj.get_time().stop - request_obj.get_time().start
-    total_bytes = request_obj.get_x_span() * request_obj.get_y_span() * request_obj.get_z_span() * t_span * bit_depth/8
+    if max_size is None:
+        max_size = settings.CUTOUT_MAX_SIZE
+
+    total_bytes = get_cutout_size(request_obj, bit_depth)
     if bit_depth == 64:
         # Allow larger annotation posts since things compress so well
         total_bytes /= 4
-    if total_bytes > settings.CUTOUT_MAX_SIZE:
+    if total_bytes > max_size:
         return True
     else:
         return False
 
 
+def get_content_length(parser_context):
+    """Method to get the length of the request body, if the client provided it
+
+    Args:
+        parser_context (dict): DRF parser context
+
+    Returns:
+        (int|None): Number of bytes in the body or None if unknown
+    """
+    try:
+        return int(parser_context['request'].META['CONTENT_LENGTH'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def read_exactly(stream, size):
+    """Method to read a fixed number of bytes from the start of a stream
+
+    Args:
+        stream (stream-like object): The stream to read
+        size (int): Number of bytes to read
+
+    Returns:
+        (bytes): The bytes read, shorter than size only if the stream ended early
+    """
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def read_request_body(stream, content_length, chunk_size=STREAM_CHUNK_SIZE, prefix=b'', max_size=None):
+    """Method to read a request body into a single preallocated buffer using bounded reads
+
+    Reading in chunks into one buffer avoids the intermediate copies made when growing a bytes object from a
+    single unbounded read.
+
+    Args:
+        stream (stream-like object): The stream to read
+        content_length (int|None): Number of bytes in the body. If None the stream is read in one call, or in
+            chunks if max_size is given.
+        chunk_size (int): Maximum number of bytes to read at once
+        prefix (bytes): Start of the body, already read from the stream
+        max_size (int): Maximum number of bytes a body of unknown length may have
+
+    Returns:
+        (bytearray|bytes): The request body, truncated if the stream ended early
+
+    Raises:
+        (ValueError): If a body of unknown length is larger than max_size
+    """
+    if content_length is None:
+        if max_size is None:
+            return prefix + stream.read()
+
+        body = bytearray(prefix)
+        while len(body) <= max_size:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                return body
+            body += chunk
+        raise ValueError("Request body is larger than {} bytes".format(max_size))
+
+    body = bytearray(max(content_length, len(prefix)))
+    view = memoryview(body)
+    view[:len(prefix)] = prefix
+    offset = len(prefix)
+    content_length = len(body)
+    while offset < content_length:
+        chunk = stream.read(min(chunk_size, content_length - offset))
+        if not chunk:
+            break
+        view[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+    view.release()
+
+    if offset < content_length:
+        del body[offset:]
+    return body
+
+
+class SpooledBody(object):
+    """A request body held either in memory or in an unlinked temp file mapped read-only into memory
+
+    The buffer supports the buffer protocol in both cases, so decoders read it the same way. Close the body once the
+    data has been decoded, to unmap and delete the temp file.
+    """
+
+    def __init__(self, buffer, spool_file=None):
+        """
+        Args:
+            buffer (bytes-like): The body
+            spool_file (file-like object): Temp file backing the buffer, if it was spooled to disk
+        """
+        self.buffer = buffer
+        self.spool_file = spool_file
+
+    @property
+    def spooled(self):
+        return self.spool_file is not None
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def close(self):
+        """Method to release the body
+
+        Returns:
+            None
+        """
+        if self.spool_file is None:
+            self.buffer = b''
+            return
+
+        try:
+            self.buffer.close()
+        except BufferError:
+            # A decoded array still references the mapping. It is unmapped when that array is freed.
+            pass
+        self.buffer = b''
+        self.spool_file.close()
+        self.spool_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_spooled_body(stream, content_length, threshold=None, spool_dir=None, chunk_size=STREAM_CHUNK_SIZE,
+                      prefix=b'', max_size=None):
+    """Method to read a request body, spooling it to disk if it is large
+
+    Bodies over the threshold are copied to a temp file in bounded chunks and memory mapped, so they are read from the
+    page cache and never count against the worker's heap. Smaller bodies, and bodies of unknown length, are read
+    into memory with read_request_body().
+
+    Args:
+        stream (stream-like object): The stream to read
+        content_length (int|None): Number of bytes in the body, or None if unknown
+        threshold (int): Bodies larger than this many bytes are spooled. Defaults to settings.CUTOUT_SPOOL_THRESHOLD
+        spool_dir (str): Directory temp files are created in. Defaults to settings.CUTOUT_SPOOL_DIR
+        chunk_size (int): Maximum number of bytes to read at once
+        prefix (bytes): Start of the body, already read from the stream
+        max_size (int): Maximum number of bytes in the body, or None for no limit
+
+    Returns:
+        (SpooledBody): The request body, truncated if the stream ended early
+
+    Raises:
+        (ValueError): If the body is larger than max_size. Bodies of known length are rejected before anything is
+            read.
+    """
+    if threshold is None:
+        threshold = settings.CUTOUT_SPOOL_THRESHOLD
+    if spool_dir is None:
+        spool_dir = settings.CUTOUT_SPOOL_DIR
+
+    if max_size is not None and content_length is not None and content_length > max_size:
+        raise ValueError("Request body is larger than {} bytes".format(max_size))
+
+    if content_length is None or not threshold or content_length <= threshold:
+        return SpooledBody(read_request_body(stream, content_length, chunk_size, prefix, max_size))
+
+    spool_file = tempfile.TemporaryFile(dir=spool_dir)
+    try:
+        spool_file.write(prefix)
+        size = len(prefix)
+        while size < content_length:
+            chunk = stream.read(min(chunk_size, content_length - size))
+            if not chunk:
+                break
+            spool_file.write(chunk)
+            size += len(chunk)
+        spool_file.flush()
+
+        if size == 0:
+            # Empty files can't be mapped
+            spool_file.close()
+            return SpooledBody(b'')
+        return SpooledBody(mmap.mmap(spool_file.fileno(), size, access=mmap.ACCESS_READ), spool_file)
+    except:
+        spool_file.close()
+        raise
+
+
+def check_blosc_header(header, shape, dtype, content_length=None):
+    """Method to check a blosc chunk header against the array a POST has to contain
+
+    Only the 16 byte header is needed, so a mismatched upload can be rejected before its body is read.
+
+    Args:
+        header (bytes-like): Start of the blosc chunk, at least BLOSC_HEADER.size bytes
+        shape (tuple(int)): Shape of the expected array
+        dtype (np.dtype): Data type of the expected array
+        content_length (int|None): Number of bytes in the whole chunk, if known
+
+    Returns:
+        None
+
+    Raises:
+        (ValueError): If the header is truncated or describes an array or chunk of the wrong size
+        (TypeError): If the typesize of the header belongs to a different data type
+    """
+    if len(header) < BLOSC_HEADER.size:
+        raise ValueError("Blosc header is truncated")
+
+    _, _, _, typesize, nbytes, _, cbytes = BLOSC_HEADER.unpack_from(header)
+    if content_length is not None and cbytes != content_length:
+        raise ValueError("Blosc compressed size {} does not match the {} bytes received".format(cbytes,
+                                                                                               content_length))
+
+    dtype = np.dtype(dtype)
+    expected_nbytes = int(np.prod(shape)) * dtype.itemsize
+    if nbytes != expected_nbytes:
+        raise ValueError("Blosc uncompressed size {} does not match the expected size {}".format(nbytes,
+                                                                                                expected_nbytes))
+
+    if typesize in BLOSC_TYPED_SIZES and typesize not in (dtype.itemsize, dtype.itemsize * 8):
+        raise TypeError("Blosc typesize {} does not match the data type {}".format(typesize, dtype.name))
+
+
+def decompress_blosc_into(compressed, shape, dtype):
+    """Method to decompress a blosc chunk directly into a newly allocated, correctly shaped array
+
+    The uncompressed size is taken from the blosc header and checked before anything is allocated, so the
+    decompressor can write straight into the array's memory instead of returning an intermediate bytes object.
+
+    Args:
+        compressed (bytes-like): Blosc compressed, C-ordered matrix data
+        shape (tuple(int)): Shape of the array to create
+        dtype (np.dtype): Data type of the array to create
+
+    Returns:
+        (np.ndarray): The decompressed data
+
+    Raises:
+        (ValueError): If the compressed data does not describe an array of the requested shape and size
+        (TypeError): If the compressed data was compressed with the typesize of a different data type
+    """
+    check_blosc_header(compressed, shape, dtype, len(compressed))
+
+    data = np.empty(shape, dtype=dtype)
+    blosc.decompress_ptr(compressed, data.__array_interface__['data'][0])
+    return data
+
+
 class ConsumeReqMixin:
     """
     Provides a method to ensure a request is entirely consumed by a parser
@@ -57,11 +349,14 @@ class ConsumeReqMixin:
         """
         Consume the request and do not allow exceptions.
 
+        The request is read and dropped in bounded chunks, so rejecting a large body doesn't buffer it.
+
         Args:
             stream (stream-like object): The stream to consume.
         """
         try:
-            stream.read()
+            while stream.read(STREAM_CHUNK_SIZE):
+                pass
         except:
             pass
 
@@ -115,41 +410,62 @@ class BloscParser(BaseParser, ConsumeReqMixin):
         try:
             bit_depth = resource.get_bit_depth()
         except ValueError:
+            self.consume_request(stream)
             return BossParserError("Unsupported data type provided to parser: {}".format(resource.get_data_type()),
                                    ErrorCodes.TYPE_ERROR)
 
         # Make sure cutout request is under 500MB UNCOMPRESSED
         if is_too_large(req, bit_depth):
+            self.consume_request(stream)
             return BossParserError("Cutout request is over 500MB when uncompressed. Reduce cutout dimensions.",
                                    ErrorCodes.REQUEST_TOO_LARGE)
 
+        # Wait for room in the node's budget of bytes in flight before allocating anything
         try:
-            # Decompress
-            raw_data = blosc.decompress(stream.read())
-            data_mat = np.fromstring(raw_data, dtype=resource.get_numpy_data_type())
-        except MemoryError:
-            return BossParserError("Ran out of memory decompressing data.",
-                                    ErrorCodes.BOSS_SYSTEM_ERROR)
-        except:
+            parser_context['admission_lease'] = admit(get_cutout_size(req, bit_depth))
+        except AdmissionRejected:
+            self.consume_request(stream)
+            return BossParserError("Server is busy. Retry the request later.", ErrorCodes.SERVER_BUSY)
+
+        if req.time_request:
+            # Time series request (even if single time point) - Get 4D matrix
+            shape = (len(req.get_time()), req.get_z_span(), req.get_y_span(), req.get_x_span())
+        else:
+            # Not a time series request (time range [0,1] auto-populated) - Get 3D matrix
+            shape = (req.get_z_span(), req.get_y_span(), req.get_x_span())
+
+        # Check the blosc header against the POST URL and channel before reading the rest of the body
+        content_length = get_content_length(parser_context)
+        header = read_exactly(stream, BLOSC_HEADER.size)
+        try:
+            check_blosc_header(header, shape, resource.get_numpy_data_type(), content_length)
+        except ValueError:
+            self.consume_request(stream)
+            return BossParserError("Failed to unpack data. Verify the datatype of your POSTed data and "
+                                   "xyz dimensions used in the POST URL.", ErrorCodes.DATA_DIMENSION_MISMATCH)
+        except TypeError:
+            self.consume_request(stream)
             return BossParserError("Failed to decompress data. Verify the datatype/bitdepth of your data "
                                    "matches the channel.", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
 
-        # Reshape and return
+        # Read the rest of the body in bounded chunks, spooling large bodies to disk, and decompress straight into
+        # the final array
         try:
-            if req.time_request:
-                # Time series request (even if single time point) - Get 4D matrix
-                parsed_data = np.reshape(data_mat,
-                                         (len(req.get_time()),
-                                          req.get_z_span(),
-                                          req.get_y_span(),
-                                          req.get_x_span()),
-                                         order='C')
-            else:
-                # Not a time series request (time range [0,1] auto-populated) - Get 3D matrix
-                parsed_data = np.reshape(data_mat, (req.get_z_span(), req.get_y_span(), req.get_x_span()), order='C')
+            with read_spooled_body(stream, content_length, prefix=header) as compressed:
+                parsed_data = decompress_blosc_into(compressed.buffer, shape, resource.get_numpy_data_type())
+                body_allocated = 0 if compressed.spooled else len(compressed)
+        except MemoryError:
+            return BossParserError("Ran out of memory decompressing data.",
+                                    ErrorCodes.BOSS_SYSTEM_ERROR)
         except ValueError:
             return BossParserError("Failed to unpack data. Verify the datatype of your POSTed data and "
                                    "xyz dimensions used in the POST URL.", ErrorCodes.DATA_DIMENSION_MISMATCH)
+        except:
+            return BossParserError("Failed to decompress data. Verify the datatype/bitdepth of your data "
+                                   "matches the channel.", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+        # Record peak allocation so the view can report it
+        parser_context['bytes_allocated'] = body_allocated + parsed_data.nbytes
 
         return req, resource, parsed_data
 
@@ -212,15 +528,39 @@ class BloscPythonParser(BaseParser, ConsumeReqMixin):
             return BossParserError("Cutout request is over 500MB when uncompressed. Reduce cutout dimensions.",
                                    ErrorCodes.REQUEST_TOO_LARGE)
 
-        # Decompress and return
+        # Wait for room in the node's budget of bytes in flight before allocating anything
+        try:
+            parser_context['admission_lease'] = admit(get_cutout_size(req, bit_depth))
+        except AdmissionRejected:
+            self.consume_request(stream)
+            return BossParserError("Server is busy. Retry the request later.", ErrorCodes.SERVER_BUSY)
+
+        # A packed array is the pickled array compressed as one blosc chunk, so neither the body nor the chunk can
+        # be much larger than the region in the POST URL
+        max_size = get_cutout_size(req, bit_depth) + BLOSC_PACKED_OVERHEAD
+        content_length = get_content_length(parser_context)
+        if content_length is not None and content_length > max_size:
+            self.consume_request(stream)
+            return BossParserError("Failed to unpack data. Verify the datatype of your POSTed data and "
+                                   "xyz dimensions used in the POST URL.", ErrorCodes.DATA_DIMENSION_MISMATCH)
+
+        # Read the body in bounded chunks, spooling large bodies to disk, and decompress it
         try:
-            parsed_data = blosc.unpack_array(stream.read())
+            with read_spooled_body(stream, content_length, max_size=max_size) as body:
+                if len(body) < BLOSC_HEADER.size or BLOSC_HEADER.unpack_from(body.buffer)[4] > max_size:
+                    raise ValueError("Packed array is larger than the POST URL region")
+                parsed_data = pickle.loads(blosc.decompress(body.buffer))
+            if not isinstance(parsed_data, np.ndarray):
+                raise ValueError("Packed data is not an array")
         except MemoryError:
             return BossParserError("Ran out of memory decompressing data.",
                                     ErrorCodes.BOSS_SYSTEM_ERROR)
-        except EOFError:
+        except (EOFError, ValueError, pickle.UnpicklingError):
             return BossParserError("Failed to unpack data. Verify the datatype of your POSTed data and "
                                    "xyz dimensions used in the POST URL.", ErrorCodes.DATA_DIMENSION_MISMATCH)
+        except Exception:
+            return BossParserError("Failed to decompress data. Verify the data was packed with blosc.pack_array().",
+                                   ErrorCodes.DATATYPE_DOES_NOT_MATCH)
 
         return req, resource, parsed_data
 
@@ -281,18 +621,278 @@ class NpygzParser(BaseParser, ConsumeReqMixin):
             return BossParserError("Cutout request is over 500MB when uncompressed. Reduce cutout dimensions.",
                                    ErrorCodes.REQUEST_TOO_LARGE)
 
-        # Decompress and return
+        # Wait for room in the node's budget of bytes in flight before allocating anything
         try:
-            data_bytes = zlib.decompress(stream.read())
+            parser_context['admission_lease'] = admit(get_cutout_size(req, bit_depth))
+        except AdmissionRejected:
+            self.consume_request(stream)
+            return BossParserError("Server is busy. Retry the request later.", ErrorCodes.SERVER_BUSY)
 
-            # Open
-            data_obj = io.BytesIO(data_bytes)
-            parsed_data = np.load(data_obj)
+        # The npy header has to describe the region in the POST URL and the channel's data type. It is checked as
+        # soon as it has been decompressed, before the array is allocated.
+        shape = (req.get_z_span(), req.get_y_span(), req.get_x_span())
+        shapes = [(len(req.get_time()),) + shape]
+        if len(req.get_time()) == 1:
+            shapes.append(shape)
+
+        # Decompress while reading the body in bounded chunks, straight into the final array
+        try:
+            parsed_data = decode_npygz(stream, STREAM_CHUNK_SIZE, shapes=shapes,
+                                       dtype=resource.get_numpy_data_type())
         except MemoryError:
+            self.consume_request(stream)
             return BossParserError("Ran out of memory decompressing data.",
                                     ErrorCodes.BOSS_SYSTEM_ERROR)
-        except EOFError:
+        except (EOFError, ValueError):
+            self.consume_request(stream)
             return BossParserError("Failed to unpack data. Verify the datatype of your POSTed data and "
                                    "xyz dimensions used in the POST URL.", ErrorCodes.DATA_DIMENSION_MISMATCH)
+        except TypeError:
+            self.consume_request(stream)
+            return BossParserError("Failed to decompress data. Verify the datatype/bitdepth of your data "
+                                   "matches the channel.", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+        except zlib.error:
+            self.consume_request(stream)
+            return BossParserError("Failed to decompress data. Verify the data is a zlib compressed npy file.",
+                                   ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+        return req, resource, parsed_data
+
+
+class RleParser(BaseParser, ConsumeReqMixin):
+    """
+    Parser that handles sparse run-length encoded uint64 annotation data
+    """
+    media_type = 'application/uint64-rle'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """Method to decode bytes from a POST that contains run-length encoded annotation data
+
+        :param stream: Request stream
+        stream type: django.core.handlers.wsgi.WSGIRequest
+        :param media_type:
+        :param parser_context:
+        :return:
+        """
+        try:
+            request_args = {
+                "service": "cutout",
+                "collection_name": parser_context['kwargs']['collection'],
+                "experiment_name": parser_context['kwargs']['experiment'],
+                "channel_name": parser_context['kwargs']['channel'],
+                "resolution": parser_context['kwargs']['resolution'],
+                "x_args": parser_context['kwargs']['x_range'],
+                "y_args": parser_context['kwargs']['y_range'],
+                "z_args": parser_context['kwargs']['z_range'],
+            }
+            if 't_range' in parser_context['kwargs']:
+                request_args["time_args"] = parser_context['kwargs']['t_range']
+            else:
+                request_args["time_args"] = None
+
+            req = BossRequest(parser_context['request'], request_args)
+        except BossError as err:
+            self.consume_request(stream)
+            return BossParserError(err.message, err.error_code)
+        except Exception as err:
+            self.consume_request(stream)
+            return BossParserError(str(err), ErrorCodes.UNHANDLED_EXCEPTION)
+
+        # Convert to Resource
+        resource = spdb.project.BossResourceDjango(req)
+
+        # Get bit depth
+        try:
+            bit_depth = resource.get_bit_depth()
+        except ValueError:
+            self.consume_request(stream)
+            return BossParserError("Unsupported data type provided to parser: {}".format(resource.get_data_type()),
+                                   ErrorCodes.TYPE_ERROR)
+
+        if bit_depth != 64:
+            self.consume_request(stream)
+            return BossParserError("Run-length encoded data can only be written to uint64 channels.",
+                                   ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+        # Make sure cutout request is under 500MB UNCOMPRESSED
+        if is_too_large(req, bit_depth):
+            self.consume_request(stream)
+            return BossParserError("Cutout request is over 500MB when uncompressed. Reduce cutout dimensions.",
+                                   ErrorCodes.REQUEST_TOO_LARGE)
+
+        # Wait for room in the node's budget of bytes in flight before allocating anything
+        try:
+            parser_context['admission_lease'] = admit(get_cutout_size(req, bit_depth))
+        except AdmissionRejected:
+            self.consume_request(stream)
+            return BossParserError("Server is busy. Retry the request later.", ErrorCodes.SERVER_BUSY)
+
+        # The data can't be larger than the region in the POST URL
+        max_size = req.get_x_span() * req.get_y_span() * req.get_z_span() * len(req.get_time())
+
+        try:
+            with read_spooled_body(stream, get_content_length(parser_context)) as body:
+                parsed_data = decode_rle(body.buffer, max_size)
+        except MemoryError:
+            return BossParserError("Ran out of memory decoding data.", ErrorCodes.BOSS_SYSTEM_ERROR)
+        except ValueError:
+            return BossParserError("Failed to decode run-length data. Verify the encoding and the xyz dimensions "
+                                   "used in the POST URL.", ErrorCodes.DATA_DIMENSION_MISMATCH)
 
         return req, resource, parsed_data
+
+
+def check_frames(body, codec, shape, dtype):
+    """Method to check the frame headers of a framed POST before any data is decompressed
+
+    Args:
+        body (bytes-like): The framed request body
+        codec (int): Codec every data frame has to use
+        shape (tuple(int)): Expected (t, z, y, x) shape of the data
+        dtype (np.dtype): Expected data type of the data
+
+    Returns:
+        None
+
+    Raises:
+        (ValueError): If the frames don't describe data of the expected codec, shape and type or don't cover the
+                      POST URL region exactly once
+    """
+    frames = list(iter_frames(body))
+    if not frames or not frames[-1][0].flags & FLAG_END:
+        raise ValueError("Framed data is missing its end frame")
+
+    end = frames[-1][0]
+    if end.shape != shape or end.dtype != dtype:
+        raise ValueError("Framed data does not match the POST URL and channel")
+
+    headers = [header for header, _ in frames[:-1]]
+    for header in headers:
+        if header.codec != codec or header.dtype != dtype or header.flags & FLAG_END:
+            raise ValueError("Invalid data frame")
+        if any(o + s > e for o, s, e in zip(header.offset, header.shape, shape)):
+            raise ValueError("Data frame is outside of the POST URL region")
+
+    # decode_frames zero fills whatever the frames leave out, so they have to tile the region exactly once. Check
+    # that on a grid of the frames' edges instead of the full region.
+    edges = [np.unique([0, e] + [h.offset[axis] for h in headers] + [h.offset[axis] + h.shape[axis] for h in headers])
+             for axis, e in enumerate(shape)]
+    covered = np.zeros([len(axis_edges) - 1 for axis_edges in edges], dtype=bool)
+    for header in headers:
+        cells = tuple(slice(np.searchsorted(axis_edges, o), np.searchsorted(axis_edges, o + s))
+                      for axis_edges, o, s in zip(edges, header.offset, header.shape))
+        if covered[cells].any():
+            raise ValueError("Data frames overlap")
+        covered[cells] = True
+
+    if not covered.all():
+        raise ValueError("Data frames do not cover the POST URL region")
+
+
+class CodecParser(BaseParser, ConsumeReqMixin):
+    """
+    Base parser for data compressed with a general purpose codec into a framed container (see bossspatialdb.framing)
+    """
+    codec = None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """Method to decompress bytes from a POST that contains framed, compressed matrix data
+
+        :param stream: Request stream
+        stream type: django.core.handlers.wsgi.WSGIRequest
+        :param media_type:
+        :param parser_context:
+        :return:
+        """
+        try:
+            request_args = {
+                "service": "cutout",
+                "collection_name": parser_context['kwargs']['collection'],
+                "experiment_name": parser_context['kwargs']['experiment'],
+                "channel_name": parser_context['kwargs']['channel'],
+                "resolution": parser_context['kwargs']['resolution'],
+                "x_args": parser_context['kwargs']['x_range'],
+                "y_args": parser_context['kwargs']['y_range'],
+                "z_args": parser_context['kwargs']['z_range'],
+            }
+            if 't_range' in parser_context['kwargs']:
+                request_args["time_args"] = parser_context['kwargs']['t_range']
+            else:
+                request_args["time_args"] = None
+
+            req = BossRequest(parser_context['request'], request_args)
+        except BossError as err:
+            self.consume_request(stream)
+            return BossParserError(err.message, err.error_code)
+        except Exception as err:
+            self.consume_request(stream)
+            return BossParserError(str(err), ErrorCodes.UNHANDLED_EXCEPTION)
+
+        # Convert to Resource
+        resource = spdb.project.BossResourceDjango(req)
+
+        # Get bit depth
+        try:
+            bit_depth = resource.get_bit_depth()
+        except ValueError:
+            self.consume_request(stream)
+            return BossParserError("Unsupported data type provided to parser: {}".format(resource.get_data_type()),
+                                   ErrorCodes.TYPE_ERROR)
+
+        # Make sure cutout request is under 500MB UNCOMPRESSED
+        if is_too_large(req, bit_depth):
+            self.consume_request(stream)
+            return BossParserError("Cutout request is over 500MB when uncompressed. Reduce cutout dimensions.",
+                                   ErrorCodes.REQUEST_TOO_LARGE)
+
+        # Wait for room in the node's budget of bytes in flight before allocating anything
+        try:
+            parser_context['admission_lease'] = admit(get_cutout_size(req, bit_depth))
+        except AdmissionRejected:
+            self.consume_request(stream)
+            return BossParserError("Server is busy. Retry the request later.", ErrorCodes.SERVER_BUSY)
+
+        shape = (len(req.get_time()), req.get_z_span(), req.get_y_span(), req.get_x_span())
+
+        try:
+            body = read_spooled_body(stream, get_content_length(parser_context))
+        except MemoryError:
+            return BossParserError("Ran out of memory reading data.", ErrorCodes.BOSS_SYSTEM_ERROR)
+
+        with body:
+            # Check the frame headers against the POST URL before decompressing anything
+            try:
+                check_frames(body.buffer, self.codec, shape, np.dtype(resource.get_numpy_data_type()))
+            except ValueError:
+                return BossParserError("Failed to unpack data. Verify the datatype of your POSTed data and "
+                                       "xyz dimensions used in the POST URL.", ErrorCodes.DATA_DIMENSION_MISMATCH)
+
+            try:
+                parsed_data = decode_frames(body.buffer)
+            except MemoryError:
+                return BossParserError("Ran out of memory decompressing data.", ErrorCodes.BOSS_SYSTEM_ERROR)
+            except ValueError:
+                return BossParserError("Failed to decompress data. Verify the datatype/bitdepth of your data "
+                                       "matches the channel.", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+        return req, resource, parsed_data
+
+
+class ZstdParser(CodecParser):
+    """
+    Parser that handles zstd compressed binary data
+    """
+    media_type = 'application/zstd-array'
+    codec = CODEC_ZSTD
+
+
+class Lz4Parser(CodecParser):
+    """
+    Parser that handles lz4 compressed binary data
+    """
+    media_type = 'application/lz4-array'
+    codec = CODEC_LZ4
+
+
+# Codec parsers whose library is installed
+CODEC_PARSERS = tuple(parser for parser in (ZstdParser, Lz4Parser) if codec_available(parser.codec))
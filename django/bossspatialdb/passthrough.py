@@ -0,0 +1,141 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Methods to send cuboids to the client in the compressed form they are stored in
+#
+# The cache holds each cuboid as a blosc packed array. When a cutout is aligned to cuboid boundaries, those buffers can
+# be sent to the client as they are, without decompressing them into a Cube and compressing the Cube again. Cuboids
+# that are not in the cache, or that have writes waiting in the write buffer, are read through SpatialDB.cutout() and
+# packed the same way.
+
+import threading
+
+import blosc
+import numpy as np
+
+from spdb.c_lib import ndlib
+
+from .cuboids import get_cuboid_range, get_cuboid_region
+from .fetch import get_slab_offset
+
+
+class PassthroughStats(object):
+    """Counters of how many cuboids were sent as stored and how many had to be encoded"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"passed_through": 0, "encoded": 0}
+
+    def add(self, passed_through, encoded):
+        """Method to record the cuboids of one z layer
+
+        Args:
+            passed_through (int): Number of cuboids sent as stored
+            encoded (int): Number of cuboids read and packed
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._stats["passed_through"] += passed_through
+            self._stats["encoded"] += encoded
+
+    def get_stats(self):
+        """Method to get the counters
+
+        Returns:
+            (dict): Counter values
+        """
+        with self._lock:
+            return dict(self._stats)
+
+
+passthrough_stats = PassthroughStats()
+
+
+def iter_cuboid_blocks(cache, resource, corner, extent, resolution, time_range, iso=False):
+    """Generator of the blosc packed cuboids of a cuboid aligned cutout
+
+    Cuboids are produced one z layer at a time, so only one layer of compressed cuboids is held in memory. Each layer's
+    cached cuboids are read in one round trip.
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the spatial database
+        resource (spdb.project.BossResource): Resource for the channel being read
+        corner ((int, int, int)): (x, y, z) start of the cutout, on cuboid boundaries
+        extent ((int, int, int)): (x, y, z) span of the cutout, a whole number of cuboids
+        resolution (int): Resolution level
+        time_range ([int, int]): Start and stop time samples
+        iso (bool): Flag indicating if the isotropic data should be read
+
+    Yields:
+        ((int, int, int, int), (int, int, int, int), bytes): (t, z, y, x) offset relative to the start of the cutout,
+        (t, z, y, x) shape and blosc packed data of each cuboid
+    """
+    x_range, y_range, z_range = get_cuboid_range(corner, extent, resolution)
+    time_samples = list(range(time_range[0], time_range[1]))
+
+    for z in z_range:
+        indices = [(x, y, z) for y in y_range for x in x_range]
+        morton_ids = [ndlib.XYZMorton(list(index)) for index in indices]
+
+        # (time sample, cuboid index) -> stored blosc packed data
+        layer = {}
+        for t in time_samples:
+            keys = cache.kvio.generate_cached_cuboid_keys(resource, resolution, [t], morton_ids, iso=iso)
+            blobs = cache.kvio.cache_client.mget(keys)
+            dirty = cache.kvio.is_dirty(keys)
+            for index, blob, is_dirty in zip(indices, blobs, dirty):
+                if blob is not None and not is_dirty:
+                    layer[(t, index)] = blob
+
+        # Read and pack the cuboids that can't be sent as stored
+        num_encoded = 0
+        for index in indices:
+            missing = [t for t in time_samples if (t, index) not in layer]
+            if not missing:
+                continue
+
+            cuboid_corner, cuboid_extent = get_cuboid_region(index, resolution)
+            cube = cache.cutout(resource, cuboid_corner, cuboid_extent, resolution, [missing[0], missing[-1] + 1],
+                                iso=iso)
+            for t in missing:
+                data = np.ascontiguousarray(cube.data[t - missing[0]:t - missing[0] + 1])
+                layer[(t, index)] = blosc.pack_array(data)
+                num_encoded += 1
+
+        passthrough_stats.add(len(layer) - num_encoded, num_encoded)
+
+        for index in indices:
+            cuboid_corner, cuboid_extent = get_cuboid_region(index, resolution)
+            offset = [cuboid_corner[d] - corner[d] for d in range(3)]
+            for t in time_samples:
+                yield ((t - time_range[0], offset[2], offset[1], offset[0]),
+                       (1, cuboid_extent[2], cuboid_extent[1], cuboid_extent[0]),
+                       layer[(t, index)])
+
+
+def iter_slab_blocks(slabs):
+    """Generator to blosc pack the z-slabs of a cutout that is not cuboid aligned
+
+    Args:
+        slabs (iterable((int|(int, int), spdb.spatialdb.Cube))): z or (t, z) offset and data of each slab, in order
+
+    Yields:
+        ((int, int, int, int), (int, int, int, int), bytes): (t, z, y, x) offset relative to the start of the cutout,
+        (t, z, y, x) shape and blosc packed data of each slab
+    """
+    for offset, cube in slabs:
+        data = np.ascontiguousarray(cube.data)
+        yield get_slab_offset(offset), data.shape, blosc.pack_array(data)
@@ -0,0 +1,119 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Process-wide SpatialDB instances
+#
+# Building a SpatialDB opens new redis connection pools and AWS clients. Views get a shared instance per worker
+# process from get_spatialdb() instead so those are reused across requests. The instance is created lazily on first
+# use and rebuilt whenever the process id changes, so an instance created before uwsgi forks its workers is never
+# shared between processes.
+
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from spdb.spatialdb.spatialdb import SpatialDB
+
+try:
+    from uwsgidecorators import postfork
+except ImportError:
+    # Not running under uwsgi
+    postfork = None
+
+_lock = threading.Lock()
+_state = {"pid": None,
+          "instance": None,
+          "created_at": None,
+          "instances_created": 0,
+          "lookups": 0}
+
+
+def get_spatialdb():
+    """Method to get the SpatialDB instance for the current worker process
+
+    Returns:
+        (spdb.spatialdb.SpatialDB): Interface to the spatial database
+    """
+    pid = os.getpid()
+    with _lock:
+        if _state["instance"] is None or _state["pid"] != pid:
+            _state["instance"] = SpatialDB(settings.KVIO_SETTINGS,
+                                           settings.STATEIO_CONFIG,
+                                           settings.OBJECTIO_CONFIG)
+            _state["pid"] = pid
+            _state["created_at"] = time.time()
+            _state["instances_created"] += 1
+        _state["lookups"] += 1
+        return _state["instance"]
+
+
+def reset_spatialdb():
+    """Method to drop the current worker's SpatialDB instance so the next request builds a new one
+
+    Returns:
+        None
+    """
+    with _lock:
+        _state["instance"] = None
+        _state["pid"] = None
+        _state["created_at"] = None
+
+
+if postfork:
+    # Never let workers inherit an instance (and its sockets) from the uwsgi master
+    postfork(reset_spatialdb)
+
+
+def _connection_pool_stats(client):
+    """Method to summarize a redis client's connection pool
+
+    Args:
+        client (redis.StrictRedis): Redis client
+
+    Returns:
+        (dict|None): Connection counts, or None if the client has no connection pool
+    """
+    pool = getattr(client, "connection_pool", None)
+    if pool is None:
+        return None
+
+    return {"created": getattr(pool, "_created_connections", None),
+            "available": len(getattr(pool, "_available_connections", [])),
+            "in_use": len(getattr(pool, "_in_use_connections", []))}
+
+
+def get_pool_stats():
+    """Method to get statistics about the current worker's SpatialDB instance
+
+    lookups counts calls to get_spatialdb(). Some views call it more than once per request, so it is not a request
+    count.
+
+    Returns:
+        (dict): Pool statistics
+    """
+    with _lock:
+        instance = _state["instance"]
+        stats = {"pid": os.getpid(),
+                 "active": instance is not None and _state["pid"] == os.getpid(),
+                 "instances_created": _state["instances_created"],
+                 "lookups": _state["lookups"],
+                 "age": time.time() - _state["created_at"] if _state["created_at"] else None}
+
+    if stats["active"]:
+        stats["cache_connections"] = _connection_pool_stats(getattr(instance.kvio, "cache_client", None))
+        stats["state_connections"] = _connection_pool_stats(getattr(instance.cache_state, "status_client", None))
+
+    return stats
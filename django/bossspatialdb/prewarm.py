@@ -0,0 +1,261 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Background page-in of the cuboids of regions a client is going to read
+#
+# A job looks up the cuboids covering its regions in the cache and reads the ones that are not cached, in runs of
+# consecutive x indices, through SpatialDB.cutout(). That pages them in from the object store exactly like a cutout
+# would, and the data read is dropped. Jobs run on a small pool of threads per worker process. Their progress is kept
+# in a redis hash, so any worker can report it.
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+from spdb.c_lib import ndlib
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+from .batch import get_x_runs
+from .cuboids import iter_cuboid_indices, get_cuboid_region
+from .estimate import get_key_states
+from .fetch import SLAB_TARGET_SIZE
+from .pool import get_spatialdb
+
+PREWARM_PREFIX = "PREWARM"
+
+# Integer fields of a job's progress
+JOB_COUNTERS = ("total", "cached", "paged_in")
+
+
+def get_job_key(job_id):
+    """Method to get the redis key of a job's progress
+
+    Args:
+        job_id (str): Job id
+
+    Returns:
+        (str): Redis key
+    """
+    return "{}&{}".format(PREWARM_PREFIX, job_id)
+
+
+def create_job(client, username, total, ttl):
+    """Method to record a new job
+
+    Args:
+        client (redis.StrictRedis): Redis client progress is kept in
+        username (str): User that started the job
+        total (int): Number of cuboids covered by the job, counting each time sample separately
+        ttl (int): Number of seconds the job's progress is kept
+
+    Returns:
+        (str): Job id
+    """
+    job_id = uuid.uuid4().hex
+    key = get_job_key(job_id)
+    pipe = client.pipeline()
+    pipe.hmset(key, {"status": "queued", "user": username, "total": total, "cached": 0, "paged_in": 0,
+                     "created": time.time()})
+    pipe.expire(key, ttl)
+    pipe.execute()
+    return job_id
+
+
+def get_job(client, job_id):
+    """Method to get a job's progress
+
+    Args:
+        client (redis.StrictRedis): Redis client progress is kept in
+        job_id (str): Job id
+
+    Returns:
+        (dict|None): status, user, cuboid counters, fraction done and error of the job, or None if it doesn't exist
+    """
+    fields = client.hgetall(get_job_key(job_id))
+    if not fields:
+        return None
+
+    job = {k.decode() if isinstance(k, bytes) else k: v.decode() if isinstance(v, bytes) else v
+           for k, v in fields.items()}
+    for name in JOB_COUNTERS:
+        job[name] = int(job[name])
+    for name in ("created", "finished"):
+        if name in job:
+            job[name] = float(job[name])
+    job["job_id"] = job_id
+    job["progress"] = (job["cached"] + job["paged_in"]) / job["total"] if job["total"] else 1.0
+    return job
+
+
+def prewarm_regions(cache, resource, regions, resolution, time_range, iso=False, progress=None,
+                    target_size=SLAB_TARGET_SIZE):
+    """Method to page the cuboids covering a list of regions into the cache
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the spatial database
+        resource (spdb.project.BossResource): Resource for the channel
+        regions (list(((int, int, int), (int, int, int)))): (x, y, z) corner and extent of each region
+        resolution (int): Resolution level
+        time_range ([int, int]): Start and stop time samples
+        iso (bool): Flag indicating if the isotropic data should be paged in
+        progress (callable): Called with the number of cuboids found in the cache and the number paged in, as work
+            is done
+        target_size (int): Approximate number of uncompressed bytes read at once
+
+    Returns:
+        (int, int): Number of cuboids that were already cached and number paged in
+    """
+    indices = sorted(set(index for corner, extent in regions
+                         for index in iter_cuboid_indices(corner, extent, resolution)))
+    morton_ids = [ndlib.XYZMorton(list(index)) for index in indices]
+
+    cuboid_size = CUBOIDSIZE[resolution]
+    cuboid_bytes = cuboid_size[0] * cuboid_size[1] * cuboid_size[2] * resource.get_bit_depth() // 8
+    max_run = max(1, target_size // max(1, cuboid_bytes))
+
+    num_cached = 0
+    num_paged_in = 0
+    for t in range(time_range[0], time_range[1]):
+        keys = cache.kvio.generate_cached_cuboid_keys(resource, resolution, [t], morton_ids, iso=iso)
+        states = get_key_states(cache, keys)
+
+        # Cuboids with writes in the write buffer are read from there, so they count as warm
+        missing = [index for index, state in zip(indices, states) if state == "not_cached"]
+        num_cached += len(indices) - len(missing)
+        if progress:
+            progress(len(indices) - len(missing), 0)
+
+        for x_start, x_stop, y, z in get_x_runs(missing):
+            for run_start in range(x_start, x_stop, max_run):
+                run_stop = min(run_start + max_run, x_stop)
+                run_corner, run_extent = get_cuboid_region((run_start, y, z), resolution)
+                run_extent = ((run_stop - run_start) * run_extent[0], run_extent[1], run_extent[2])
+                cache.cutout(resource, run_corner, run_extent, resolution, [t, t + 1], iso=iso)
+
+                num_paged_in += run_stop - run_start
+                if progress:
+                    progress(0, run_stop - run_start)
+
+    return num_cached, num_paged_in
+
+
+def run_job(job_id, resource, regions, resolution, time_range, iso=False):
+    """Method to run a job, recording its progress
+
+    Args:
+        job_id (str): Job id
+        resource (spdb.project.BossResource): Resource for the channel
+        regions (list(((int, int, int), (int, int, int)))): (x, y, z) corner and extent of each region
+        resolution (int): Resolution level
+        time_range ([int, int]): Start and stop time samples
+        iso (bool): Flag indicating if the isotropic data should be paged in
+
+    Returns:
+        None
+    """
+    cache = get_spatialdb()
+    client = cache.kvio.cache_client
+    key = get_job_key(job_id)
+
+    def progress(cached, paged_in):
+        pipe = client.pipeline()
+        if cached:
+            pipe.hincrby(key, "cached", cached)
+        if paged_in:
+            pipe.hincrby(key, "paged_in", paged_in)
+        pipe.execute()
+
+    client.hset(key, "status", "running")
+    try:
+        prewarm_regions(cache, resource, regions, resolution, time_range, iso=iso, progress=progress)
+        client.hmset(key, {"status": "done", "finished": time.time()})
+    except Exception as err:
+        client.hmset(key, {"status": "failed", "error": str(err), "finished": time.time()})
+    finally:
+        # Threads outside the request cycle have to close their own database connections
+        connection.close()
+
+
+class PrewarmExecutor(object):
+    """Pool of threads running the worker's jobs, with a limit on the number of jobs waiting or running"""
+
+    def __init__(self, workers, max_jobs):
+        """
+        Args:
+            workers (int): Number of jobs run at once
+            max_jobs (int): Maximum number of jobs waiting or running
+        """
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """Method to start a job in the background
+
+        Args:
+            fn (callable): The job
+            *args: Arguments to the job
+            **kwargs: Keyword arguments to the job
+
+        Returns:
+            (bool): False if the worker already has the maximum number of jobs and the job was not started
+        """
+        with self._lock:
+            if self._pending >= self.max_jobs:
+                return False
+            self._pending += 1
+
+        future = self._executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._done)
+        return True
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def get_stats(self):
+        """Method to get the number of jobs waiting or running
+
+        Returns:
+            (dict): Counter values
+        """
+        with self._lock:
+            return {"pending": self._pending, "max_jobs": self.max_jobs}
+
+
+_lock = threading.Lock()
+_state = {"pid": None, "executor": None}
+
+
+def get_prewarm_executor():
+    """Method to get the job pool of the current worker process
+
+    The pool is rebuilt whenever the process id changes, so threads started before uwsgi forks its workers are never
+    expected to run in a worker.
+
+    Returns:
+        (PrewarmExecutor): The worker's job pool
+    """
+    pid = os.getpid()
+    with _lock:
+        if _state["executor"] is None or _state["pid"] != pid:
+            _state["executor"] = PrewarmExecutor(settings.CUTOUT_PREWARM_WORKERS, settings.CUTOUT_PREWARM_MAX_JOBS)
+            _state["pid"] = pid
+        return _state["executor"]
@@ -0,0 +1,102 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Max, min and mean intensity projections of a region along one axis
+#
+# The region is read as a sequence of z-slabs (see bossspatialdb.fetch) and each slab is reduced into an accumulator
+# as soon as it arrives, so only one slab and the projection are held in memory. A projection keeps the reduced axis
+# with a length of 1, so it has the same (t, z, y, x) layout as a cutout.
+
+import numpy as np
+
+PROJECTION_AXES = {"z": 1, "y": 2, "x": 3}
+PROJECTION_OPS = ("max", "min", "mean")
+
+
+class Projection(object):
+    """Projected data, in the form the cutout renderers expect a Cube in"""
+
+    def __init__(self, data):
+        """
+        Args:
+            data (np.ndarray): (t, z, y, x) projected data, with a length of 1 along the reduced axis
+        """
+        self.data = data
+
+
+def get_projection_shape(shape, axis):
+    """Method to get the shape of a projection
+
+    Args:
+        shape ((int, int, int, int)): (t, z, y, x) shape of the region
+        axis (str): Axis reduced, one of "z", "y" or "x"
+
+    Returns:
+        ((int, int, int, int)): (t, z, y, x) shape of the projection
+    """
+    projected = list(shape)
+    projected[PROJECTION_AXES[axis]] = 1
+    return tuple(projected)
+
+
+def project_slabs(slabs, shape, dtype, axis, op):
+    """Method to reduce the z-slabs of a region along an axis
+
+    Args:
+        slabs (iterable((int, spdb.spatialdb.Cube))): z offset and data of each slab, in order
+        shape ((int, int, int, int)): (t, z, y, x) shape of the region
+        dtype (np.dtype): Data type of the region
+        axis (str): Axis reduced, one of "z", "y" or "x"
+        op (str): Reduction, one of "max", "min" or "mean"
+
+    Returns:
+        (np.ndarray): (t, z, y, x) projection, in the region's data type. Means are rounded to the nearest integer.
+    """
+    dim = PROJECTION_AXES[axis]
+    out_shape = get_projection_shape(shape, axis)
+
+    if op == "mean":
+        acc = np.zeros(out_shape, dtype=np.float64)
+    elif op == "max":
+        acc = np.full(out_shape, np.iinfo(dtype).min, dtype=dtype)
+    else:
+        acc = np.full(out_shape, np.iinfo(dtype).max, dtype=dtype)
+
+    for z_offset, cube in slabs:
+        data = cube.data
+        if op == "mean":
+            reduced = data.sum(axis=dim, keepdims=True, dtype=np.float64)
+        elif op == "max":
+            reduced = data.max(axis=dim, keepdims=True)
+        else:
+            reduced = data.min(axis=dim, keepdims=True)
+
+        if axis == "z":
+            # Every slab covers the whole projection
+            target = acc
+        else:
+            # Slabs cover disjoint z ranges of the projection
+            target = acc[:, z_offset:z_offset + data.shape[1]]
+
+        if op == "mean":
+            target += reduced
+        elif op == "max":
+            np.maximum(target, reduced, out=target)
+        else:
+            np.minimum(target, reduced, out=target)
+
+    if op == "mean":
+        acc /= shape[dim]
+        return np.rint(acc).astype(dtype)
+    return acc
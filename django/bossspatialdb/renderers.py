@@ -16,10 +16,17 @@ from rest_framework import renderers
 from rest_framework.renderers import JSONRenderer
 import blosc
 import numpy as np
-import zlib
 import io
 from PIL import Image
 
+from django.conf import settings
+
+from .npygz import iter_npygz
+from .fetch import get_slab_offset
+from .rle import encode_rle
+from .framing import blosc_frame, codec_frame, codec_available, end_frame, pack_frame_header, FLAG_REGION, \
+    FLAG_CHANNEL, CODEC_BLOSC_PACKED, CODEC_ZSTD, CODEC_LZ4
+
 
 class BloscPythonRenderer(renderers.BaseRenderer):
     """ A DRF renderer for a blosc encoded cube of data using the numpy interface
@@ -65,36 +72,228 @@ class BloscRenderer(renderers.BaseRenderer):
                                   typesize=renderer_context['view'].bit_depth)
 
 
+class BloscStreamRenderer(renderers.BaseRenderer):
+    """ A DRF renderer for a multi-frame blosc container (see bossspatialdb.framing)
+
+    The cutout view streams this format slab by slab through a StreamingHttpResponse using stream(). render() is
+    used when a whole Cube is already in memory and produces the same container with a single data frame.
+    """
+    media_type = 'application/blosc-stream'
+    format = 'bin'
+    charset = None
+    render_style = 'binary'
+
+    def stream(self, slabs, time_request, shape, dtype):
+        """Generator to encode z-slabs of a cutout as frames
+
+        Args:
+            slabs (iterable((int|(int, int), spdb.spatialdb.Cube))): z or (t, z) offset and data of each slab, in order
+            time_request (bool): Flag indicating if the request contained a time range
+            shape ((int, int, int, int)): (t, z, y, x) shape of the full cutout
+            dtype (np.dtype): Data type of the cutout
+
+        Yields:
+            (bytes): Frame headers and payloads
+        """
+        ndim = 4 if time_request else 3
+        for offset, cube in slabs:
+            header, payload = blosc_frame(cube.data, get_slab_offset(offset), ndim)
+            yield header
+            yield payload
+
+        yield end_frame(ndim, dtype, shape)
+
+    def stream_regions(self, regions, data, time_request, time_start, dtype):
+        """Generator to encode the regions of a batch cutout as frames
+
+        Args:
+            regions (list(((int, int, int), (int, int, int)))): (x, y, z) corner and extent of each region
+            data (iterable(np.ndarray)): (t, z, y, x) data of each region, in order
+            time_request (bool): Flag indicating if the request contained a time range
+            time_start (int): First time sample of the regions
+            dtype (np.dtype): Data type of the regions
+
+        Yields:
+            (bytes): Frame headers and payloads
+        """
+        ndim = 4 if time_request else 3
+        for (corner, _), block in zip(regions, data):
+            header, payload = blosc_frame(block, (time_start, corner[2], corner[1], corner[0]), ndim,
+                                          flags=FLAG_REGION)
+            yield header
+            yield payload
+
+        yield end_frame(ndim, dtype, (len(regions), 0, 0, 0))
+
+    def stream_channels(self, data, time_request, time_start, corner, num_channels, dtype):
+        """Generator to encode the channels of a stacked cutout as frames
+
+        Args:
+            data (iterable(spdb.spatialdb.Cube)): (t, z, y, x) data of each channel, in order
+            time_request (bool): Flag indicating if the request contained a time range
+            time_start (int): First time sample of the cutout
+            corner ((int, int, int)): (x, y, z) start of the cutout
+            num_channels (int): Number of channels
+            dtype (np.dtype): Data type of the first channel, used for the end frame
+
+        Yields:
+            (bytes): Frame headers and payloads
+        """
+        ndim = 4 if time_request else 3
+        for cube in data:
+            header, payload = blosc_frame(cube.data, (time_start, corner[2], corner[1], corner[0]), ndim,
+                                          flags=FLAG_CHANNEL)
+            yield header
+            yield payload
+
+        yield end_frame(ndim, dtype, (num_channels, 0, 0, 0))
+
+    def render(self, data, media_type=None, renderer_context=None):
+        return b''.join(self.stream([(0, data["data"])], data["time_request"], data["data"].data.shape,
+                                    data["data"].data.dtype))
+
+
+class BloscCuboidsRenderer(renderers.BaseRenderer):
+    """ A DRF renderer for a multi-frame container of blosc packed arrays (see bossspatialdb.framing)
+
+    For cuboid aligned cutouts each frame is one cuboid, sent in the form it is stored in the cache, so the frame
+    headers form an index of the cuboids' positions. The cutout view streams this format using stream(). render() is
+    used when a whole Cube is already in memory and produces the same container with a single data frame.
+    """
+    media_type = 'application/blosc-cuboids'
+    format = 'bin'
+    charset = None
+    render_style = 'binary'
+
+    def stream(self, blocks, time_request, shape, dtype):
+        """Generator to encode blosc packed blocks of a cutout as frames
+
+        Args:
+            blocks (iterable(((int, int, int, int), (int, int, int, int), bytes))): (t, z, y, x) offset, (t, z, y, x)
+                shape and blosc packed data of each block
+            time_request (bool): Flag indicating if the request contained a time range
+            shape ((int, int, int, int)): (t, z, y, x) shape of the full cutout
+            dtype (np.dtype): Data type of the cutout
+
+        Yields:
+            (bytes): Frame headers and payloads
+        """
+        ndim = 4 if time_request else 3
+        for offset, block_shape, payload in blocks:
+            yield pack_frame_header(CODEC_BLOSC_PACKED, ndim, dtype, offset, block_shape, len(payload))
+            yield payload
+
+        yield end_frame(ndim, dtype, shape)
+
+    def render(self, data, media_type=None, renderer_context=None):
+        cube_data = np.ascontiguousarray(data["data"].data)
+        return b''.join(self.stream([((0, 0, 0, 0), cube_data.shape, blosc.pack_array(cube_data))],
+                                    data["time_request"], cube_data.shape, cube_data.dtype))
+
+
 class NpygzRenderer(renderers.BaseRenderer):
     """ A DRF renderer for a gzip compressed npy encoded cube of data, following a similar method as ndstore for
     compatibility with existing tools
 
+    The output is a zlib stream, as produced by zlib.compress(), compressed in parallel blocks (see
+    bossspatialdb.npygz) at the level selected by the view's gzlevel attribute.
+
+    Views send it through a StreamingHttpResponse using stream(), so each block goes out as soon as it is compressed.
+    render() is only used where the whole body is needed, eg. to store it in the response cache.
     """
     media_type = 'application/npygz'
     format = 'bin'
     charset = None
     render_style = 'binary'
 
-    def render(self, data, media_type=None, renderer_context=None):
+    def stream(self, data, renderer_context=None):
+        """Generator to encode a cube of data as it is compressed
 
-        if not data["data"].data.flags['C_CONTIGUOUS']:
-            data["data"].data = np.ascontiguousarray(data["data"].data, dtype=data["data"].data.dtype)
+        Args:
+            data (dict): "time_request" flag and "data" object with the array, as passed to render()
+            renderer_context (dict): DRF renderer context, holding the view
 
+        Yields:
+            (bytes): Pieces of the zlib stream, in order
+        """
         # Return data, squeezing time dimension if only a single point
+        cube_data = data["data"].data
         if not data["time_request"]:
-            data["data"].data = np.squeeze(data["data"].data, axis=(0,))
+            cube_data = np.squeeze(cube_data, axis=(0,))
 
-        # Save Data to npy
-        npy_file = io.BytesIO()
-        np.save(npy_file, data["data"].data, allow_pickle=False)
+        level = getattr(renderer_context['view'], 'gzlevel', None)
+        if level is None:
+            level = settings.NPYGZ_DEFAULT_LEVEL
 
-        # Compress npy
-        npy_gz = zlib.compress(npy_file.getvalue())
+        return iter_npygz(cube_data, level, threads=settings.NPYGZ_THREADS)
 
-        # Send file
-        npy_gz_file = io.BytesIO(npy_gz)
-        npy_gz_file.seek(0)
-        return npy_gz_file.read()
+    def render(self, data, media_type=None, renderer_context=None):
+        return b''.join(self.stream(data, renderer_context))
+
+
+class CodecRenderer(renderers.BaseRenderer):
+    """ Base DRF renderer for a cube of data compressed with a general purpose codec into a framed container (see
+    bossspatialdb.framing)
+
+    The response is a single data frame, whose header carries the shape and data type, followed by the end frame.
+    The compression level is taken from the view's level attribute and has to be in the renderer's levels.
+    """
+    format = 'bin'
+    charset = None
+    render_style = 'binary'
+
+    codec = None
+    levels = range(0)
+    default_level_setting = None
+
+    def render(self, data, media_type=None, renderer_context=None):
+        cube_data = data["data"].data
+        ndim = 4 if data["time_request"] else 3
+
+        level = getattr(renderer_context['view'], 'level', None)
+        if level is None:
+            level = getattr(settings, self.default_level_setting)
+
+        header, payload = codec_frame(self.codec, cube_data, (0, 0, 0, 0), ndim, level)
+        return b''.join((header, payload, end_frame(ndim, cube_data.dtype, cube_data.shape)))
+
+
+class ZstdRenderer(CodecRenderer):
+    """ A DRF renderer for a zstd compressed cube of data
+
+    """
+    media_type = 'application/zstd-array'
+    codec = CODEC_ZSTD
+    levels = range(1, 23)
+    default_level_setting = 'CUTOUT_ZSTD_LEVEL'
+
+
+class Lz4Renderer(CodecRenderer):
+    """ A DRF renderer for an lz4 compressed cube of data
+
+    """
+    media_type = 'application/lz4-array'
+    codec = CODEC_LZ4
+    levels = range(0, 17)
+    default_level_setting = 'CUTOUT_LZ4_LEVEL'
+
+
+# Codec renderers whose library is installed
+CODEC_RENDERERS = tuple(renderer for renderer in (ZstdRenderer, Lz4Renderer) if codec_available(renderer.codec))
+
+
+class RleRenderer(renderers.BaseRenderer):
+    """ A DRF renderer for a sparse run-length encoded cube of annotation data (see bossspatialdb.rle)
+
+    Only works with uint64 channels. The cutout view rejects requests for other channels.
+    """
+    media_type = 'application/uint64-rle'
+    format = 'bin'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        return encode_rle(data["data"].data, 4 if data["time_request"] else 3)
 
 
 class JpegRenderer(renderers.BaseRenderer):
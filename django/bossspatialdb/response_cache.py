@@ -0,0 +1,139 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Per-worker cache of encoded cutout responses
+#
+# Entries are keyed by region and media type and remember the cuboid write counters (see bossspatialdb.versions)
+# they were rendered from. A lookup with different counters is a miss and drops the entry, so a write anywhere in the
+# region invalidates it in every worker.
+
+from collections import OrderedDict
+import threading
+import time
+
+from django.conf import settings
+
+
+class ResponseCache(object):
+    """Size bounded LRU cache of encoded responses"""
+
+    def __init__(self, max_size, ttl=None):
+        """
+        Args:
+            max_size (int): Maximum number of bytes of responses held
+            ttl (int): Maximum number of seconds an entry is served, or None for no limit
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def get(self, key, versions):
+        """Method to look up a response
+
+        Args:
+            key (hashable): Identifies the region and encoding
+            versions (tuple(int)): The region's current cuboid write counters
+
+        Returns:
+            (bytes|None): The encoded response or None if not cached or out of date
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            body, entry_versions, expires = entry
+            if entry_versions != versions or (expires is not None and expires < time.time()):
+                self._remove(key)
+                self._stats["invalidations"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return body
+
+    def put(self, key, versions, body):
+        """Method to store a response, evicting the least recently used entries to stay under the size budget
+
+        Responses larger than a quarter of the budget are not cached so one request can't flush the whole cache.
+
+        Args:
+            key (hashable): Identifies the region and encoding
+            versions (tuple(int)): The cuboid write counters read before the response's data was fetched
+            body (bytes): The encoded response
+
+        Returns:
+            None
+        """
+        if len(body) > self.max_size // 4:
+            return
+
+        expires = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            while self._entries and self.size + len(body) > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+            self._entries[key] = (body, versions, expires)
+            self.size += len(body)
+
+    def _remove(self, key):
+        """Method to drop an entry. The caller must hold the lock.
+
+        Args:
+            key (hashable): Entry to remove
+
+        Returns:
+            None
+        """
+        body, _, _ = self._entries.pop(key)
+        self.size -= len(body)
+
+    def get_stats(self):
+        """Method to get the cache's counters and usage
+
+        Returns:
+            (dict): Cache statistics
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["size"] = self.size
+            stats["max_size"] = self.max_size
+        return stats
+
+
+_cache = {"instance": None}
+
+
+def get_response_cache():
+    """Method to get the worker's response cache
+
+    Returns:
+        (ResponseCache|None): The cache, or None if settings.CUTOUT_RESPONSE_CACHE_SIZE disables it
+    """
+    if not settings.CUTOUT_RESPONSE_CACHE_SIZE:
+        return None
+
+    if _cache["instance"] is None:
+        _cache["instance"] = ResponseCache(settings.CUTOUT_RESPONSE_CACHE_SIZE, settings.CUTOUT_RESPONSE_CACHE_TTL)
+    return _cache["instance"]
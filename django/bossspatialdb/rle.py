@@ -0,0 +1,128 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Sparse run-length encoding of uint64 annotation cutouts.
+
+Annotation data is mostly zeros and long runs of the same id, so only the runs of non-zero ids are sent. The array is
+flattened in C order over (t, z, y, x) and each run is described by its start index, its length and its id. An
+encoded cutout is a fixed size, little-endian header followed by three arrays of `num_runs` little-endian uint64s:
+
+    magic     4s   b'BOSR'
+    version   B    RLE_VERSION
+    ndim      B    Number of dimensions of the cutout (3 for zyx, 4 for tzyx)
+    padding   2x
+    shape     4Q   (t, z, y, x) shape of the cutout
+    num_runs  Q    Number of runs
+
+    starts    num_runs x uint64   Flat index of the first voxel of each run, increasing
+    lengths   num_runs x uint64   Number of voxels in each run
+    ids       num_runs x uint64   Id of each run
+
+Runs don't overlap. Voxels not covered by a run are 0.
+"""
+
+import struct
+
+import numpy as np
+
+RLE_MAGIC = b'BOSR'
+RLE_VERSION = 1
+RLE_HEADER = struct.Struct('<4sBB2x4QQ')
+
+
+def encode_rle(data, ndim):
+    """Method to run-length encode the non-zero voxels of a uint64 cutout
+
+    Args:
+        data (np.ndarray): (t, z, y, x) uint64 data
+        ndim (int): Number of dimensions of the response (3 or 4)
+
+    Returns:
+        (bytes): The encoded cutout
+    """
+    flat = np.ascontiguousarray(data, dtype=np.uint64).reshape(-1)
+
+    # A run starts wherever the id differs from the previous voxel
+    starts = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    starts = np.concatenate((np.zeros(1 if flat.size else 0, dtype=starts.dtype), starts))
+    lengths = np.diff(np.append(starts, flat.size))
+    ids = flat[starts]
+
+    # Zero runs are implied
+    keep = ids != 0
+    starts = starts[keep].astype('<u8')
+    lengths = lengths[keep].astype('<u8')
+    ids = ids[keep].astype('<u8')
+
+    header = RLE_HEADER.pack(RLE_MAGIC, RLE_VERSION, ndim, *data.shape, len(ids))
+    return b''.join((header, starts.tobytes(), lengths.tobytes(), ids.tobytes()))
+
+
+def decode_rle(buf, max_size=None):
+    """Method to decode a run-length encoded cutout
+
+    Args:
+        buf (bytes-like): The encoded cutout
+        max_size (int): Maximum number of voxels accepted, or None for no limit
+
+    Returns:
+        (np.ndarray): The uint64 data, 3D or 4D depending on the encoded cutout
+
+    Raises:
+        (ValueError): If the data is not a valid encoded cutout
+    """
+    if len(buf) < RLE_HEADER.size:
+        raise ValueError("Run-length header is truncated")
+
+    fields = RLE_HEADER.unpack_from(buf)
+    if fields[0] != RLE_MAGIC:
+        raise ValueError("Invalid run-length magic {}".format(fields[0]))
+    if fields[1] != RLE_VERSION:
+        raise ValueError("Unsupported run-length version {}".format(fields[1]))
+
+    ndim = fields[2]
+    shape = tuple(fields[3:7])
+    num_runs = fields[7]
+    size = shape[0] * shape[1] * shape[2] * shape[3]
+    if ndim not in (3, 4) or (ndim == 3 and shape[0] != 1):
+        raise ValueError("Invalid run-length shape {}".format(shape))
+    if max_size is not None and size > max_size:
+        raise ValueError("Run-length encoded cutout is larger than allowed")
+    if len(buf) != RLE_HEADER.size + 3 * 8 * num_runs:
+        raise ValueError("Run-length data holds {} bytes, header describes {} runs".format(len(buf), num_runs))
+
+    runs = np.frombuffer(buf, dtype='<u8', offset=RLE_HEADER.size).reshape(3, num_runs)
+    starts, lengths, ids = runs[0], runs[1], runs[2]
+
+    # Bound each run before adding, so starts + lengths can't wrap around
+    size_u8 = np.uint64(size)
+    if np.any(starts >= size_u8) or np.any(lengths > size_u8 - starts):
+        raise ValueError("Run-length runs are outside of the cutout")
+    ends = starts + lengths
+
+    if num_runs and (np.any(lengths == 0) or np.any(starts[1:] < ends[:-1])):
+        raise ValueError("Run-length runs overlap or are outside of the cutout")
+
+    # Mark the change in id at the start and end of each run and integrate. uint64 arithmetic wraps, so
+    # the running sum is exactly the id inside each run and 0 between runs.
+    data = np.zeros(size + 1, dtype=np.uint64)
+    data[starts] = ids
+    data[ends] -= ids
+    np.cumsum(data, out=data)
+
+    data = data[:size].reshape(shape)
+    if ndim == 3:
+        data = np.squeeze(data, axis=(0,))
+    return data
@@ -0,0 +1,108 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Methods to read the same region of several channels of one experiment
+#
+# Every channel's cutout is fetched on a pool of threads, so the cuboids of all the channels are read concurrently.
+# Channels of the same data type can be stacked into a single (c, t, z, y, x) array. Channels of different data types
+# are returned one frame per channel (see bossspatialdb.framing).
+
+import copy
+
+import numpy as np
+
+from bosscore.error import BossError, ErrorCodes
+
+from .fetch import iter_ordered
+
+
+def parse_channels(channels, max_channels):
+    """Method to split the comma separated channels of a stacked cutout request
+
+    Args:
+        channels (str): Channel names, eg. "em,membranes,synapses"
+        max_channels (int): Maximum number of channels
+
+    Returns:
+        (list(str)): The channel names, in request order
+
+    Raises:
+        BossError: If there are too many channels
+    """
+    names = [name for name in channels.split(",") if name]
+    if len(names) > max_channels:
+        raise BossError("Stacked cutout request has {} channels. The maximum is {}.".format(len(names), max_channels),
+                        ErrorCodes.REQUEST_TOO_LARGE)
+    return names
+
+
+def get_stack_dtype(resources):
+    """Method to get the data type the channels of a stacked cutout share
+
+    Args:
+        resources (list(spdb.project.BossResource)): Resources of the channels
+
+    Returns:
+        (np.dtype|None): The common data type, or None if the channels have different data types
+    """
+    dtypes = set(np.dtype(resource.get_numpy_data_type()) for resource in resources)
+    if len(dtypes) != 1:
+        return None
+    return dtypes.pop()
+
+
+def iter_channel_cutouts(cache, resources, corner, extent, resolution, time_range, iso=False, workers=1):
+    """Generator to fetch the same region of several channels, several at a time
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the spatial database
+        resources (list(spdb.project.BossResource)): Resources of the channels being read
+        corner ((int, int, int)): (x, y, z) start of the cutout
+        extent ((int, int, int)): (x, y, z) span of the cutout
+        resolution (int): Resolution level
+        time_range ([int, int]): Start and stop time samples
+        iso (bool): Flag indicating if the isotropic data should be read
+        workers (int): Number of channels fetched concurrently
+
+    Yields:
+        (spdb.spatialdb.Cube): Each channel's cutout, in order
+    """
+    def fetch(resource):
+        return cache.cutout(resource, corner, extent, resolution, time_range, iso=iso)
+
+    return iter_ordered(fetch, resources, workers)
+
+
+def stack_cutouts(cubes, num_channels, time_request):
+    """Method to stack the cutouts of channels of the same data type into a single array
+
+    Args:
+        cubes (iterable(spdb.spatialdb.Cube)): (t, z, y, x) cutout of each channel, in order
+        num_channels (int): Number of channels
+        time_request (bool): Flag indicating if the request contained a time range. If not, the time axis is dropped.
+
+    Returns:
+        (spdb.spatialdb.Cube): The first channel's Cube, holding the (c, t, z, y, x) or (c, z, y, x) stacked data
+    """
+    result = None
+    for c, cube in enumerate(cubes):
+        if result is None:
+            # Renderers only read the data, so the first channel's Cube is reused to hold the stack
+            result = copy.copy(cube)
+            result.data = np.empty((num_channels,) + cube.data.shape, dtype=cube.data.dtype)
+        result.data[c] = cube.data
+
+    if not time_request:
+        result.data = result.data[:, 0]
+    return result
@@ -0,0 +1,239 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Statistics of the data in a region, computed cuboid by cuboid
+#
+# Every statistic is derived from a histogram with one bin per possible value, so uint8 and uint16 data is summarized
+# exactly. The region is read in blocks of time samples and runs of cuboids, and each cuboid's histogram is added to
+# the total, so only one bounded run is held in memory. Histograms of cuboids fully inside the region are cached in
+# redis, tagged with the cuboid write counters (see bossspatialdb.versions) they were computed from. A write through
+# the cutout service bumps the counters, so cached histograms of changed cuboids are never reused.
+
+import struct
+
+import blosc
+import numpy as np
+
+from .batch import get_x_runs
+from .fetch import SLAB_TARGET_SIZE, get_time_blocks
+from .cuboids import iter_cuboid_indices, get_cuboid_region, clip_to_region
+from .versions import CuboidVersions, get_versions_ttl
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+STATS_PREFIX = "CUTOUT-STATS"
+
+# Percentiles returned when the request does not select any
+DEFAULT_PERCENTILES = (1, 5, 50, 95, 99)
+
+# Epoch and write counter the cached histogram was computed from
+STATS_HEADER = struct.Struct('<QQ')
+
+
+def get_histogram(data, bit_depth):
+    """Method to count the occurrences of every possible value in a block of data
+
+    Args:
+        data (np.ndarray): uint8 or uint16 data
+        bit_depth (int): Bit depth of the data
+
+    Returns:
+        (np.ndarray): int64 counts, one per possible value
+    """
+    return np.bincount(np.ravel(data), minlength=2 ** bit_depth).astype(np.int64)
+
+
+def pack_histogram(hist, epoch, version):
+    """Method to encode a cuboid's histogram for the cache
+
+    Only the non-zero bins are stored.
+
+    Args:
+        hist (np.ndarray): Counts, one per possible value
+        epoch (int): Channel downsample epoch the histogram was computed from
+        version (int): Cuboid write counter the histogram was computed from
+
+    Returns:
+        (bytes): The encoded histogram
+    """
+    values = np.flatnonzero(hist)
+    pairs = np.concatenate((values, hist[values])).astype(np.uint64)
+    return STATS_HEADER.pack(epoch, version) + blosc.compress(pairs.tobytes(), typesize=8)
+
+
+def unpack_histogram(blob, size):
+    """Method to decode a cached histogram
+
+    Args:
+        blob (bytes): The encoded histogram
+        size (int): Number of possible values
+
+    Returns:
+        (int, int, np.ndarray): Epoch, write counter and counts of the histogram
+    """
+    epoch, version = STATS_HEADER.unpack_from(blob)
+    pairs = np.frombuffer(blosc.decompress(blob[STATS_HEADER.size:]), dtype=np.uint64)
+    values, counts = np.split(pairs, 2)
+    hist = np.zeros(size, dtype=np.int64)
+    hist[values.astype(np.int64)] = counts.astype(np.int64)
+    return epoch, version, hist
+
+
+def get_stats_key(lookup_key, resolution, iso, t, index):
+    """Method to get the redis key of a cuboid's cached histogram
+
+    Args:
+        lookup_key (str): Channel lookup key
+        resolution (int): Resolution level
+        iso (bool): Flag indicating if the isotropic data was read
+        t (int): Time sample
+        index ((int, int, int)): (x, y, z) cuboid index
+
+    Returns:
+        (str): Redis key
+    """
+    return "{}&{}&{}&{}&{}&{}&{}&{}".format(STATS_PREFIX, lookup_key, resolution, "ISO" if iso else "ANISO", t,
+                                            *index)
+
+
+def get_region_histogram(cache, resource, corner, extent, resolution, time_range, iso=False, ttl=None,
+                         target_size=SLAB_TARGET_SIZE):
+    """Method to get the histogram of a region, reusing the cached histograms of unchanged cuboids
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the spatial database
+        resource (spdb.project.BossResource): Resource for the channel being read
+        corner ((int, int, int)): (x, y, z) start of the region
+        extent ((int, int, int)): (x, y, z) span of the region
+        resolution (int): Resolution level
+        time_range ([int, int]): Start and stop time samples
+        iso (bool): Flag indicating if the isotropic data should be read
+        ttl (int): Number of seconds cuboid histograms are cached for, or None to not cache them
+        target_size (int): Approximate number of uncompressed bytes read at once
+
+    Returns:
+        (np.ndarray, int, int): Counts of the region, number of cuboid histograms taken from the cache and number
+        computed from data
+    """
+    bit_depth = resource.get_bit_depth()
+    client = cache.kvio.cache_client
+    lookup_key = resource.get_lookup_key()
+    time_samples = list(range(time_range[0], time_range[1]))
+    indices = list(iter_cuboid_indices(corner, extent, resolution))
+
+    # Counters are in the order of CuboidVersions.get_fields(): time major, then cuboid
+    counters = CuboidVersions(client, get_versions_ttl()).get(lookup_key, resolution, corner, extent, time_range)
+    epoch = counters[0]
+    versions = {(t, index): counters[1 + i * len(indices) + j]
+                for i, t in enumerate(time_samples) for j, index in enumerate(indices)}
+
+    full = set(index for index in indices
+               if clip_to_region(*get_cuboid_region(index, resolution), corner, extent)[1] ==
+               tuple(CUBOIDSIZE[resolution][:3]))
+
+    hist = np.zeros(2 ** bit_depth, dtype=np.int64)
+    num_cached = 0
+
+    # Reuse the cached histograms of whole cuboids that have not been written since they were computed
+    missing = set((t, index) for t in time_samples for index in indices)
+    cached_keys = [(t, index) for t in time_samples for index in indices if index in full]
+    if ttl and cached_keys:
+        blobs = client.mget([get_stats_key(lookup_key, resolution, iso, t, index) for t, index in cached_keys])
+        for key, blob in zip(cached_keys, blobs):
+            if blob is None:
+                continue
+            cached_epoch, cached_version, cached_hist = unpack_histogram(blob, len(hist))
+            if cached_epoch == epoch and cached_version == versions[key]:
+                hist += cached_hist
+                missing.discard(key)
+                num_cached += 1
+
+    # Read the rest in blocks of time samples and runs along x, so a bounded number of cuboids is held at a time
+    cuboid_size = CUBOIDSIZE[resolution]
+    sample_bytes = cuboid_size[0] * cuboid_size[1] * cuboid_size[2] * bit_depth // 8
+    num_computed = 0
+
+    pipe = client.pipeline()
+    for block in get_time_blocks(time_range, target_size // max(1, sample_bytes)):
+        block_samples = range(block[0], block[1])
+        max_run = max(1, target_size // max(1, sample_bytes * len(block_samples)))
+
+        block_missing = set(index for t, index in missing if block[0] <= t < block[1])
+        for x_start, x_stop, y, z in get_x_runs(block_missing):
+            for run_start in range(x_start, x_stop, max_run):
+                run_stop = min(run_start + max_run, x_stop)
+                run_corner, run_extent = get_cuboid_region((run_start, y, z), resolution)
+                run_extent = ((run_stop - run_start) * run_extent[0], run_extent[1], run_extent[2])
+                read_corner, read_extent = clip_to_region(run_corner, run_extent, corner, extent)
+                cube = cache.cutout(resource, read_corner, read_extent, resolution, block, iso=iso)
+
+                for x in range(run_start, run_stop):
+                    index = (x, y, z)
+                    part_corner, part_extent = clip_to_region(*get_cuboid_region(index, resolution), corner,
+                                                              extent)
+                    x0 = part_corner[0] - read_corner[0]
+                    for i, t in enumerate(block_samples):
+                        if (t, index) not in missing:
+                            continue
+                        cuboid_hist = get_histogram(cube.data[i, :, :, x0:x0 + part_extent[0]], bit_depth)
+                        hist += cuboid_hist
+                        num_computed += 1
+                        if ttl and index in full:
+                            pipe.set(get_stats_key(lookup_key, resolution, iso, t, index),
+                                     pack_histogram(cuboid_hist, epoch, versions[(t, index)]), ex=ttl)
+    if ttl:
+        pipe.execute()
+
+    return hist, num_cached, num_computed
+
+
+def summarize_histogram(hist, bins=256, percentiles=DEFAULT_PERCENTILES):
+    """Method to compute the statistics of a region from its histogram
+
+    Percentiles use the nearest rank method, so they are always values that occur in the data.
+
+    Args:
+        hist (np.ndarray): Counts, one per possible value
+        bins (int): Number of equal width bins in the returned histogram, spanning the data's min to max
+        percentiles (iterable(float)): Percentiles to compute, between 0 and 100
+
+    Returns:
+        (dict): count, min, max, mean, std, percentiles and histogram of the region
+    """
+    count = int(hist.sum())
+    if count == 0:
+        return {"count": 0, "min": None, "max": None, "mean": None, "std": None,
+                "percentiles": {"{:g}".format(p): None for p in percentiles},
+                "histogram": {"bin_edges": [], "counts": []}}
+
+    nonzero = np.flatnonzero(hist)
+    min_value = int(nonzero[0])
+    max_value = int(nonzero[-1])
+
+    values = np.arange(min_value, max_value + 1, dtype=np.float64)
+    counts = hist[min_value:max_value + 1]
+    mean = float(np.dot(counts, values)) / count
+    std = float(np.sqrt(np.dot(counts, (values - mean) ** 2) / count))
+
+    cumulative = np.cumsum(hist)
+    percentile_values = {}
+    for p in percentiles:
+        rank = max(1, int(np.ceil(p / 100.0 * count)))
+        percentile_values["{:g}".format(p)] = int(np.searchsorted(cumulative, rank))
+
+    binned, edges = np.histogram(values, bins=bins, range=(min_value, max_value + 1), weights=counts)
+
+    return {"count": count, "min": min_value, "max": max_value, "mean": mean, "std": std,
+            "percentiles": percentile_values,
+            "histogram": {"bin_edges": [float(e) for e in edges], "counts": [int(c) for c in binned]}}
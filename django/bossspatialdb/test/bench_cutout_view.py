@@ -0,0 +1,303 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Benchmark of the cutout service, run against the same mocked redis cache as the cutout view unit tests
+#
+# Every combination of data type, cutout size, cuboid alignment and time range is POSTed and read back in every media
+# type the view supports for it. The wall time of each request and the stage timings reported by bosscore.timing are
+# written to a JSON file, so runs of different releases can be compared without AWS. Run it with
+#
+#     python manage.py test bossspatialdb.test.bench_cutout_view
+#
+# or with the benchtest.cfg nose2 config. Environment variables select what is run:
+#
+#     BOSS_BENCH_OUTPUT     File results are written to (default cutout_benchmark.json)
+#     BOSS_BENCH_SIZES      Comma separated names of the cutout sizes in BENCH_SIZES (default small,medium)
+#     BOSS_BENCH_REPEAT     Number of times each request is timed (default 3)
+#     BOSS_BENCH_BASELINE   Results of an earlier run. Cases whose median time grew by more than BOSS_BENCH_TOLERANCE
+#                           (default 0.25) are listed under "regressions".
+
+import io
+import json
+import os
+import platform
+import statistics
+import time
+import zlib
+
+import blosc
+import numpy as np
+
+from django.conf import settings
+from django.test import override_settings
+
+from rest_framework.test import APITestCase, APIRequestFactory
+from rest_framework.test import force_authenticate
+from rest_framework import status
+
+from unittest.mock import patch
+
+from bossspatialdb.views import Cutout
+from bossspatialdb.framing import codec_frame, codec_available, end_frame, CODEC_ZSTD, CODEC_LZ4
+from bossspatialdb.rle import encode_rle
+
+from bosscore.test.setup_db import SetupTestDB
+
+from .cutout_view_uint8 import mock_init_
+
+version = settings.BOSS_VERSION
+
+# Channels of the spatialdb test data, by data type
+BENCH_CHANNELS = {"uint8": "channel1", "uint16": "channel2", "uint64": "layer1"}
+
+# (x, y, z) cutout sizes
+BENCH_SIZES = {"small": (128, 128, 16), "medium": (512, 512, 16), "large": (1024, 1024, 32)}
+
+# (x, y, z) start of cuboid aligned and unaligned cutouts
+BENCH_CORNERS = {True: (0, 0, 0), False: (100, 150, 3)}
+
+# Time ranges, None for a 3D cutout
+BENCH_TIME_RANGES = (None, (0, 3))
+
+# Stage timings of the requests made so far, filled in by record_timings
+_timings = []
+
+
+def record_timings(endpoint, timings):
+    """Timing sink keeping the stage timings of each request"""
+    _timings.append(dict(timings))
+
+
+def get_test_data(dtype, shape):
+    """Method to generate data that compresses about as well as real data
+
+    Image channels get noise over a gradient, annotation channels large regions of a few ids and background.
+    """
+    rng = np.random.RandomState(0)
+    if dtype == "uint64":
+        data = np.zeros(shape, dtype=np.uint64)
+        data[..., shape[-2] // 4:, :shape[-1] // 2] = 2 ** 40 + 7
+        data[..., :shape[-2] // 2, shape[-1] // 2:] = 1234
+        return data
+    max_value = np.iinfo(dtype).max
+    data = rng.randint(0, max_value // 8, shape) + np.linspace(0, max_value // 2, shape[-1]).astype(np.int64)
+    return data.astype(dtype)
+
+
+def encode_body(media_type, data):
+    """Method to encode data for upload in a media type
+
+    Args:
+        media_type (str): Content type of the upload
+        data (np.ndarray): 3D or 4D data
+
+    Returns:
+        (bytes): The request body
+    """
+    if media_type == 'application/blosc':
+        return blosc.compress(data.tobytes(), typesize=data.dtype.itemsize * 8)
+    if media_type == 'application/blosc-python':
+        return blosc.pack_array(data)
+    if media_type == 'application/npygz':
+        npy_file = io.BytesIO()
+        np.save(npy_file, data, allow_pickle=False)
+        return zlib.compress(npy_file.getvalue())
+    if media_type == 'application/uint64-rle':
+        return encode_rle(data.reshape((-1,) + data.shape[-3:]), data.ndim)
+
+    codec = CODEC_ZSTD if media_type == 'application/zstd-array' else CODEC_LZ4
+    block = data.reshape((-1,) + data.shape[-3:])
+    header, payload = codec_frame(codec, block, (0, 0, 0, 0), data.ndim, 1)
+    return header + payload + end_frame(data.ndim, data.dtype, block.shape)
+
+
+def get_post_media_types(dtype):
+    """Method to get the upload media types supported for a data type"""
+    media_types = ['application/blosc', 'application/blosc-python', 'application/npygz']
+    if codec_available(CODEC_ZSTD):
+        media_types.append('application/zstd-array')
+    if codec_available(CODEC_LZ4):
+        media_types.append('application/lz4-array')
+    if dtype == "uint64":
+        media_types.append('application/uint64-rle')
+    return media_types
+
+
+def get_get_media_types(dtype, time_range):
+    """Method to get the download media types supported for a data type and time range"""
+    media_types = get_post_media_types(dtype) + ['application/blosc-stream', 'application/blosc-cuboids']
+    if dtype == "uint8" and time_range is None:
+        media_types.append('image/jpeg')
+    return media_types
+
+
+def summarize_times(times, num_bytes):
+    """Method to summarize the wall times of a case
+
+    Args:
+        times (list(float)): Seconds taken by each repeat
+        num_bytes (int): Uncompressed size of the cutout
+
+    Returns:
+        (dict): min, median and mean seconds and the throughput at the median in MB/s
+    """
+    median = statistics.median(times)
+    return {"min_s": min(times), "median_s": median, "mean_s": statistics.mean(times),
+            "mb_per_s": num_bytes / 1048576 / median if median > 0 else None}
+
+
+def summarize_stages(timings):
+    """Method to average the stage timings of a case's repeats
+
+    Returns:
+        (dict): Mean seconds of each stage
+    """
+    names = set(name for timing in timings for name in timing)
+    return {name: statistics.mean(timing.get(name, 0.0) for timing in timings) for name in sorted(names)}
+
+
+def find_regressions(baseline, results, tolerance):
+    """Method to find the cases that got slower than in an earlier run
+
+    Args:
+        baseline (list(dict)): Results of the earlier run
+        results (list(dict)): Results of this run
+        tolerance (float): Fraction the median time may grow by
+
+    Returns:
+        (list(dict)): Case, baseline and current median of each regression
+    """
+    previous = {result["case"]: result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(result["case"])
+        if old is None:
+            continue
+        if result["median_s"] > old["median_s"] * (1 + tolerance):
+            regressions.append({"case": result["case"], "baseline_median_s": old["median_s"],
+                                "median_s": result["median_s"]})
+    return regressions
+
+
+@patch('spdb.spatialdb.SpatialDB.__init__', mock_init_)
+@override_settings(BOSS_TIMING_ENABLED=True, BOSS_TIMING_SINK="bossspatialdb.test.bench_cutout_view.record_timings")
+class BenchCutoutView(APITestCase):
+
+    def setUp(self):
+        """
+        Initialize the database
+        :return:
+        """
+        # Create a user
+        self.dbsetup = SetupTestDB()
+        self.user = self.dbsetup.create_user('testuser')
+
+        # Populate DB
+        self.dbsetup.insert_spatialdb_test_data()
+
+        self.factory = APIRequestFactory()
+        self.repeat = int(os.environ.get("BOSS_BENCH_REPEAT", 3))
+        self.sizes = os.environ.get("BOSS_BENCH_SIZES", "small,medium").split(",")
+
+    def call(self, method, dtype, corner, extent, time_range, media_type, body=None):
+        """Method to make one cutout request and read the whole response
+
+        Returns:
+            (float, int): Seconds taken and number of bytes in the request or response body
+        """
+        ranges = ["{}:{}".format(start, start + span) for start, span in zip(corner, extent)]
+        t_range = "{}:{}".format(*time_range) if time_range else None
+        url = '/' + version + '/cutout/col1/exp1/{}/0/{}/'.format(BENCH_CHANNELS[dtype], "/".join(ranges))
+        if t_range:
+            url += t_range + '/'
+
+        if method == "POST":
+            request = self.factory.post(url, body, content_type=media_type)
+        else:
+            request = self.factory.get(url, HTTP_ACCEPT=media_type)
+        force_authenticate(request, user=self.user)
+
+        start = time.perf_counter()
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel=BENCH_CHANNELS[dtype],
+                                    resolution='0', x_range=ranges[0], y_range=ranges[1], z_range=ranges[2],
+                                    t_range=t_range)
+        if method == "GET":
+            if response.streaming:
+                content = b"".join(response.streaming_content)
+            else:
+                content = response.render().content
+        seconds = time.perf_counter() - start
+
+        expected = status.HTTP_201_CREATED if method == "POST" else status.HTTP_200_OK
+        self.assertEqual(response.status_code, expected, "{} {} {}".format(method, url, media_type))
+        return seconds, len(body) if method == "POST" else len(content)
+
+    def bench(self, method, dtype, size, aligned, time_range, media_type, body=None):
+        """Method to time the repeats of one case
+
+        Returns:
+            (dict): Description, body size, wall times and stage timings of the case
+        """
+        extent = BENCH_SIZES[size]
+        corner = BENCH_CORNERS[aligned]
+        num_time = time_range[1] - time_range[0] if time_range else 1
+        num_bytes = extent[0] * extent[1] * extent[2] * num_time * np.dtype(dtype).itemsize
+
+        del _timings[:]
+        times = []
+        for _ in range(self.repeat):
+            seconds, body_bytes = self.call(method, dtype, corner, extent, time_range, media_type, body)
+            times.append(seconds)
+
+        result = {"case": "{} {} {} {} {} {}".format(method, dtype, size, "aligned" if aligned else "unaligned",
+                                                     "time" if time_range else "notime", media_type),
+                  "method": method, "dtype": dtype, "size": size, "extent": list(extent), "aligned": aligned,
+                  "time_samples": num_time, "media_type": media_type, "uncompressed_bytes": num_bytes,
+                  "body_bytes": body_bytes, "repeat": self.repeat, "stages_s": summarize_stages(_timings)}
+        result.update(summarize_times(times, num_bytes))
+        return result
+
+    def test_cutout_benchmark(self):
+        """Benchmark uploads and downloads of every supported case and write the results"""
+        results = []
+        for dtype in sorted(BENCH_CHANNELS):
+            for size in self.sizes:
+                extent = BENCH_SIZES[size]
+                for aligned in (True, False):
+                    for time_range in BENCH_TIME_RANGES:
+                        shape = (extent[2], extent[1], extent[0])
+                        if time_range:
+                            shape = (time_range[1] - time_range[0],) + shape
+                        data = get_test_data(dtype, shape)
+
+                        for media_type in get_post_media_types(dtype):
+                            results.append(self.bench("POST", dtype, size, aligned, time_range, media_type,
+                                                      encode_body(media_type, data)))
+
+                        for media_type in get_get_media_types(dtype, time_range):
+                            results.append(self.bench("GET", dtype, size, aligned, time_range, media_type))
+
+        report = {"platform": {"python": platform.python_version(), "numpy": np.__version__,
+                               "blosc": blosc.__version__},
+                  "results": results}
+
+        baseline_file = os.environ.get("BOSS_BENCH_BASELINE")
+        if baseline_file:
+            with open(baseline_file) as fh:
+                baseline = json.load(fh)["results"]
+            report["regressions"] = find_regressions(baseline, results,
+                                                     float(os.environ.get("BOSS_BENCH_TOLERANCE", 0.25)))
+
+        with open(os.environ.get("BOSS_BENCH_OUTPUT", "cutout_benchmark.json"), "w") as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
@@ -20,6 +20,7 @@ from rest_framework.test import force_authenticate
 from rest_framework import status
 
 from bossspatialdb.views import Cutout
+from bossspatialdb.window import Window
 
 from bosscore.test.setup_db import SetupTestDB
 from bosscore.error import BossError
@@ -204,6 +205,57 @@ class CutoutInterfaceViewUint16TestMixin(object):
         # Test for data equality (what you put in is what you got back!)
         np.testing.assert_array_equal(data_mat, test_mat)
 
+    def test_channel_uint16_cuboid_aligned_no_offset_no_time_window(self):
+        """ Test uint16 data, cuboid aligned, no offset, no time samples, windowed into uint8"""
+
+        test_mat = np.random.randint(1, 2**16-1, (16, 128, 128))
+        test_mat = test_mat.astype(np.uint16)
+        h = test_mat.tobytes()
+        bb = blosc.compress(h, typesize=16)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel2/0/0:128/0:128/0:16/', bb,
+                               content_type='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel2',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:16', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Get the data windowed into uint8
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel2/0/0:128/0:128/0:16/'
+                              '?window=1000:40000&gamma=0.8&dtype=uint8', HTTP_ACCEPT='application/blosc')
+        force_authenticate(request, user=self.user)
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel2',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:16',
+                                    t_range=None).render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data_mat = np.frombuffer(blosc.decompress(response.content), dtype=np.uint8).reshape(16, 128, 128)
+        expected = Window(np.uint16, 1000, 40000, 0.8, np.uint8).apply(test_mat)
+        np.testing.assert_array_equal(data_mat, expected)
+
+        # The jpeg interface accepts the windowed uint16 data
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel2/0/0:128/0:128/0:16/'
+                              '?window=1000:40000&dtype=uint8', HTTP_ACCEPT='image/jpeg')
+        force_authenticate(request, user=self.user)
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel2',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:16',
+                                    t_range=None).render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # An invalid window is rejected
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel2/0/0:128/0:128/0:16/?window=5:1',
+                              HTTP_ACCEPT='application/blosc')
+        force_authenticate(request, user=self.user)
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel2',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:16',
+                                    t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_channel_uint16_cuboid_aligned_offset_no_time_blosc(self):
         """ Test uint16 data, cuboid aligned, offset, no time samples, blosc interface"""
 
@@ -20,6 +20,7 @@ from rest_framework.test import force_authenticate
 from rest_framework import status
 
 from bossspatialdb.views import Cutout
+from bossspatialdb.rle import encode_rle, decode_rle
 
 from bosscore.test.setup_db import SetupTestDB
 from bosscore.error import BossError
@@ -733,11 +734,11 @@ class CutoutInterfaceViewUint64TestMixin(object):
         # Make request
         response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='layer1',
                                     resolution='0', x_range='0:128', y_range='0:128', z_range='0:4',
-                                    t_range=None).render()
+                                    t_range=None)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Decompress
-        data_bytes = zlib.decompress(response.content)
+        data_bytes = zlib.decompress(b''.join(response.streaming_content))
 
         # Open
         data_obj = io.BytesIO(data_bytes)
@@ -777,11 +778,11 @@ class CutoutInterfaceViewUint64TestMixin(object):
         # Make request
         response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='layer1',
                                     resolution='0', x_range='0:128', y_range='0:128', z_range='0:4',
-                                    t_range='10:13').render()
+                                    t_range='10:13')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Decompress
-        data_bytes = zlib.decompress(response.content)
+        data_bytes = zlib.decompress(b''.join(response.streaming_content))
 
         # Open
         data_obj = io.BytesIO(data_bytes)
@@ -790,6 +791,42 @@ class CutoutInterfaceViewUint64TestMixin(object):
         # Test for data equality (what you put in is what you got back!)
         np.testing.assert_array_equal(data_mat, test_mat)
 
+    def test_channel_uint64_time_rle(self):
+        """ Test uint64 data, using the run-length interface to upload and download time series data
+        """
+        test_mat = np.zeros((3, 4, 128, 128), dtype=np.uint64)
+        test_mat[0, 1:3, 10:50, 20:60] = 1234
+        test_mat[2, :, 64:, :] = 2 ** 40
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/layer1/0/0:128/0:128/0:4/10:13',
+                               encode_rle(test_mat, 4), content_type='application/uint64-rle')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='layer1',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:4',
+                                    t_range='10:13')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Create Request to get data you posted
+        request = factory.get('/' + version + '/cutout/col1/exp1/layer1/0/0:128/0:128/0:4/10:13',
+                              HTTP_ACCEPT='application/uint64-rle')
+
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='layer1',
+                                    resolution='0', x_range='0:128', y_range='0:128', z_range='0:4',
+                                    t_range='10:13').render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Test for data equality (what you put in is what you got back!)
+        np.testing.assert_array_equal(decode_rle(response.content), test_mat)
+
     def test_channel_uint64_notime_npygz_upload(self):
         """ Test uint8 data, using the npygz interface while uploading in that format as well
         """
@@ -829,11 +866,11 @@ class CutoutInterfaceViewUint64TestMixin(object):
         # Make request
         response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='layer1',
                                     resolution='0', x_range='0:128', y_range='0:128', z_range='0:4',
-                                    t_range=None).render()
+                                    t_range=None)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Decompress
-        data_bytes = zlib.decompress(response.content)
+        data_bytes = zlib.decompress(b''.join(response.streaming_content))
 
         # Open
         data_obj = io.BytesIO(data_bytes)
@@ -883,11 +920,11 @@ class CutoutInterfaceViewUint64TestMixin(object):
         # Make request
         response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='layer1',
                                     resolution='0', x_range='0:128', y_range='0:128', z_range='0:4',
-                                    t_range='10:13').render()
+                                    t_range='10:13')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Decompress
-        data_bytes = zlib.decompress(response.content)
+        data_bytes = zlib.decompress(b''.join(response.streaming_content))
 
         # Open
         data_obj = io.BytesIO(data_bytes)
@@ -19,7 +19,10 @@ from rest_framework.test import APITestCase, APIRequestFactory
 from rest_framework.test import force_authenticate
 from rest_framework import status
 
-from bossspatialdb.views import Cutout
+from bossspatialdb.views import Cutout, CutoutStats, CutoutProjection, CutoutEstimate, CutoutUpload, \
+    CutoutUploadPart, CutoutUploadCommit, CutoutStack
+from bossspatialdb.framing import decode_frames, decode_channels, iter_frames, codec_frame, codec_available, \
+    end_frame, CODEC_ZSTD, CODEC_LZ4
 
 from bosscore.test.setup_db import SetupTestDB
 from bosscore.error import BossError
@@ -400,6 +403,122 @@ class CutoutInterfaceViewUint8TestMixin(object):
         # Test for data equality (what you put in is what you got back!)
         np.testing.assert_array_equal(data_mat, test_mat)
 
+    def test_channel_uint8_cuboid_unaligned_offset_no_time_blosc_stream(self):
+        """ Test uint8 data, not cuboid aligned, offset, no time samples, streamed blosc interface"""
+
+        test_mat = np.random.randint(1, 254, (40, 300, 500))
+        test_mat = test_mat.astype(np.uint8)
+        h = test_mat.tobytes()
+        bb = blosc.compress(h, typesize=8)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/10:50/', bb,
+                               content_type='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='10:50', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Create Request to get data you posted
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/10:50/',
+                              HTTP_ACCEPT='application/blosc-stream')
+
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='10:50', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+
+        # Reassemble frames
+        data_mat = decode_frames(b''.join(response.streaming_content))
+
+        # Test for data equality (what you put in is what you got back!)
+        np.testing.assert_array_equal(data_mat, test_mat)
+
+    def test_channel_uint8_cuboid_aligned_offset_no_time_blosc_cuboids(self):
+        """ Test uint8 data, cuboid aligned, offset, no time samples, stored cuboid passthrough interface"""
+
+        test_mat = np.random.randint(1, 254, (32, 512, 1024))
+        test_mat = test_mat.astype(np.uint8)
+        h = test_mat.tobytes()
+        bb = blosc.compress(h, typesize=8)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/0:1024/512:1024/16:48/', bb,
+                               content_type='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='0:1024', y_range='512:1024', z_range='16:48', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Read the data twice so the second read finds the cuboids in the cache
+        for _ in range(2):
+            request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/0:1024/512:1024/16:48/',
+                                  HTTP_ACCEPT='application/blosc-cuboids')
+
+            # log in user
+            force_authenticate(request, user=self.user)
+
+            # Make request
+            response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                        resolution='0', x_range='0:1024', y_range='512:1024', z_range='16:48',
+                                        t_range=None)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.streaming)
+
+            # One frame per cuboid plus the end frame
+            content = b''.join(response.streaming_content)
+            self.assertEqual(len(list(iter_frames(content))), 5)
+
+            # Test for data equality (what you put in is what you got back!)
+            np.testing.assert_array_equal(decode_frames(content), test_mat)
+
+    def test_channel_uint8_cuboid_unaligned_offset_no_time_blosc_cuboids(self):
+        """ Test uint8 data, not cuboid aligned, offset, no time samples, stored cuboid passthrough interface"""
+
+        test_mat = np.random.randint(1, 254, (40, 300, 500))
+        test_mat = test_mat.astype(np.uint8)
+        h = test_mat.tobytes()
+        bb = blosc.compress(h, typesize=8)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/10:50/', bb,
+                               content_type='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='10:50', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Create Request to get data you posted
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/10:50/',
+                              HTTP_ACCEPT='application/blosc-cuboids')
+
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='10:50', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Test for data equality (what you put in is what you got back!)
+        np.testing.assert_array_equal(decode_frames(b''.join(response.streaming_content)), test_mat)
+
     def test_channel_uint8_cuboid_aligned_no_offset_no_time_blosc_numpy(self):
         """ Test uint8 data, cuboid aligned, no offset, no time samples"""
 
@@ -662,11 +781,11 @@ class CutoutInterfaceViewUint8TestMixin(object):
         # Make request to GET data
         response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
                                     resolution='0', x_range='100:600', y_range='450:750', z_range='20:37',
-                                    t_range=None).render()
+                                    t_range=None)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Decompress
-        data_bytes = zlib.decompress(response.content)
+        data_bytes = zlib.decompress(b''.join(response.streaming_content))
 
         # Open
         data_obj = io.BytesIO(data_bytes)
@@ -707,11 +826,11 @@ class CutoutInterfaceViewUint8TestMixin(object):
         # Make request
         response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
                                     resolution='0', x_range='100:600', y_range='450:750', z_range='20:37',
-                                    t_range='100:103').render()
+                                    t_range='100:103')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Decompress
-        data_bytes = zlib.decompress(response.content)
+        data_bytes = zlib.decompress(b''.join(response.streaming_content))
 
         # Open
         data_obj = io.BytesIO(data_bytes)
@@ -760,11 +879,11 @@ class CutoutInterfaceViewUint8TestMixin(object):
         # Make request to GET data
         response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
                                     resolution='0', x_range='100:600', y_range='450:750', z_range='20:37',
-                                    t_range=None).render()
+                                    t_range=None)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Decompress
-        data_bytes = zlib.decompress(response.content)
+        data_bytes = zlib.decompress(b''.join(response.streaming_content))
 
         # Open
         data_obj = io.BytesIO(data_bytes)
@@ -815,11 +934,11 @@ class CutoutInterfaceViewUint8TestMixin(object):
         # Make request
         response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
                                     resolution='0', x_range='100:600', y_range='450:750', z_range='20:37',
-                                    t_range='150:153').render()
+                                    t_range='150:153')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Decompress
-        data_bytes = zlib.decompress(response.content)
+        data_bytes = zlib.decompress(b''.join(response.streaming_content))
 
         # Open
         data_obj = io.BytesIO(data_bytes)
@@ -828,6 +947,332 @@ class CutoutInterfaceViewUint8TestMixin(object):
         # Test for data equality (what you put in is what you got back!)
         np.testing.assert_array_equal(data_mat, test_mat)
 
+    def test_channel_uint8_cuboid_unaligned_offset_no_time_npygz_level(self):
+        """ Test uint8 data, not cuboid aligned, offset, no time samples, npygz interface with a compression level"""
+        test_mat = np.random.randint(1, 254, (17, 300, 500))
+        test_mat = test_mat.astype(np.uint8)
+
+        # Save Data to npy
+        npy_file = io.BytesIO()
+        np.save(npy_file, test_mat, allow_pickle=False)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37/',
+                               zlib.compress(npy_file.getvalue()),
+                               content_type='application/npygz')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='20:37')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        for level in ('0', '1', '9'):
+            # Create Request to get data you posted
+            request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37/?gzlevel=' +
+                                  level, HTTP_ACCEPT='application/npygz')
+
+            # log in user
+            force_authenticate(request, user=self.user)
+
+            # Make request
+            response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                        resolution='0', x_range='100:600', y_range='450:750',
+                                        z_range='20:37')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            # Test for data equality (what you put in is what you got back!)
+            data_mat = np.load(io.BytesIO(zlib.decompress(b''.join(response.streaming_content))))
+            np.testing.assert_array_equal(data_mat, test_mat)
+
+        # An invalid level is rejected
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37/?gzlevel=10',
+                              HTTP_ACCEPT='application/npygz')
+        force_authenticate(request, user=self.user)
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='20:37')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_channel_uint8_cuboid_unaligned_offset_time_zstd_lz4(self):
+        """ Test uint8 data, not cuboid aligned, offset, time samples, zstd and lz4 interfaces"""
+        for codec, media_type in ((CODEC_ZSTD, 'application/zstd-array'), (CODEC_LZ4, 'application/lz4-array')):
+            if not codec_available(codec):
+                continue
+
+            test_mat = np.random.randint(1, 254, (3, 17, 300, 500))
+            test_mat = test_mat.astype(np.uint8)
+            header, payload = codec_frame(codec, test_mat, (0, 0, 0, 0), 4, 1)
+
+            # Create request
+            factory = APIRequestFactory()
+            request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37/0:3',
+                                   header + payload + end_frame(4, np.uint8, test_mat.shape),
+                                   content_type=media_type)
+            # log in user
+            force_authenticate(request, user=self.user)
+
+            # Make request
+            response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                        resolution='0', x_range='100:600', y_range='450:750', z_range='20:37',
+                                        t_range='0:3')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+            # Create Request to get data you posted
+            request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37/0:3/?level=9',
+                                  HTTP_ACCEPT=media_type)
+
+            # log in user
+            force_authenticate(request, user=self.user)
+
+            # Make request
+            response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                        resolution='0', x_range='100:600', y_range='450:750', z_range='20:37',
+                                        t_range='0:3').render()
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            # Test for data equality (what you put in is what you got back!)
+            self.assertEqual(next(iter_frames(response.content))[0].codec, codec)
+            np.testing.assert_array_equal(decode_frames(response.content), test_mat)
+
+            # A level the codec doesn't support is rejected
+            request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37/0:3/?level=99',
+                                  HTTP_ACCEPT=media_type)
+            force_authenticate(request, user=self.user)
+            response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                        resolution='0', x_range='100:600', y_range='450:750', z_range='20:37',
+                                        t_range='0:3')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_channel_uint8_cuboid_unaligned_offset_no_time_stats(self):
+        """ Test uint8 data, not cuboid aligned, offset, no time samples, statistics interface"""
+        test_mat = np.random.randint(1, 254, (17, 300, 500))
+        test_mat = test_mat.astype(np.uint8)
+        bb = blosc.compress(test_mat.tobytes(), typesize=8)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37/', bb,
+                               content_type='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='20:37')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Get the statistics of the data you posted
+        request = factory.get('/' + version + '/cutout-stats/col1/exp1/channel1/0/100:600/450:750/20:37/'
+                              '?bins=16&percentiles=0,100')
+        force_authenticate(request, user=self.user)
+        response = CutoutStats.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                         resolution='0', x_range='100:600', y_range='450:750',
+                                         z_range='20:37').render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(response.data["count"], test_mat.size)
+        self.assertEqual(response.data["min"], test_mat.min())
+        self.assertEqual(response.data["max"], test_mat.max())
+        self.assertAlmostEqual(response.data["mean"], test_mat.mean())
+        self.assertEqual(response.data["percentiles"], {"0": test_mat.min(), "100": test_mat.max()})
+        self.assertEqual(sum(response.data["histogram"]["counts"]), test_mat.size)
+        self.assertEqual(len(response.data["histogram"]["counts"]), 16)
+
+    def test_channel_uint8_cuboid_unaligned_offset_time_estimate(self):
+        """ Test uint8 data, not cuboid aligned, offset, time samples, estimate interface"""
+        factory = APIRequestFactory()
+        request = factory.get('/' + version + '/cutout-estimate/col1/exp1/channel1/0/100:600/450:750/20:37/0:3')
+        force_authenticate(request, user=self.user)
+        response = CutoutEstimate.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                            resolution='0', x_range='100:600', y_range='450:750', z_range='20:37',
+                                            t_range='0:3').render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(response.data["uncompressed_bytes"], 500 * 300 * 17 * 3)
+        self.assertFalse(response.data["cuboid_aligned"])
+        self.assertEqual(response.data["cuboids_per_time_sample"], 8)
+        self.assertEqual(response.data["time_samples"], 3)
+        cuboids = response.data["cuboids"]
+        self.assertEqual(cuboids["cached"] + cuboids["dirty"] + cuboids["not_cached"], 24)
+        self.assertTrue(response.data["within_cutout_limit"])
+        self.assertGreater(response.data["estimated_seconds"], 0)
+
+    def test_channel_uint8_cuboid_unaligned_offset_no_time_stack(self):
+        """ Test uint8 data, not cuboid aligned, offset, no time samples, stacked with other channels"""
+        test_mat = np.random.randint(1, 254, (17, 300, 500)).astype(np.uint8)
+
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37/',
+                               blosc.compress(test_mat.tobytes(), typesize=8), content_type='application/blosc')
+        force_authenticate(request, user=self.user)
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='20:37', t_range=None)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        def get_stack(channels, accept):
+            request = factory.get('/' + version + '/cutout-stack/col1/exp1/{}/0/100:600/450:750/20:37/'
+                                  .format(channels), HTTP_ACCEPT=accept)
+            force_authenticate(request, user=self.user)
+            return CutoutStack.as_view()(request, collection='col1', experiment='exp1', channels=channels,
+                                         resolution='0', x_range='100:600', y_range='450:750', z_range='20:37',
+                                         t_range=None)
+
+        # Channels of the same data type are stacked
+        response = get_stack('channel1', 'application/blosc').render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = np.frombuffer(blosc.decompress(response.content), dtype=np.uint8).reshape(1, 17, 300, 500)
+        np.testing.assert_array_equal(data[0], test_mat)
+
+        # Channels of different data types are only available framed
+        response = get_stack('channel1,channel2', 'application/blosc').render()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = get_stack('channel1,channel2', 'application/blosc-stream')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        channels = decode_channels(b''.join(response.streaming_content))
+        self.assertEqual(len(channels), 2)
+        np.testing.assert_array_equal(channels[0], test_mat)
+        self.assertEqual(channels[1].dtype, np.uint16)
+        self.assertEqual(channels[1].shape, (17, 300, 500))
+
+        # Duplicate channels are rejected
+        response = get_stack('channel1,channel1', 'application/blosc').render()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_channel_uint8_cuboid_unaligned_offset_no_time_upload_session(self):
+        """ Test uint8 data, not cuboid aligned, offset, no time samples, written as the parts of an upload session"""
+        test_mat = np.random.randint(1, 254, (10, 64, 600)).astype(np.uint8)
+
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/upload/col1/exp1/channel1/0/300:900/0:64/10:20/')
+        force_authenticate(request, user=self.user)
+        response = CutoutUpload.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                          resolution='0', x_range='300:900', y_range='0:64', z_range='10:20',
+                                          t_range=None).render()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        upload_id = response.data["upload_id"]
+        self.assertEqual(response.data["total"], 4)
+
+        def put_part(x_range, y_range, z_range):
+            x_start, x_stop = [int(v) for v in x_range.split(":")]
+            z_start, z_stop = [int(v) for v in z_range.split(":")]
+            part = np.ascontiguousarray(test_mat[z_start - 10:z_stop - 10, :, x_start - 300:x_stop - 300])
+            request = factory.put('/' + version + '/upload/{}/{}/{}/{}/'.format(upload_id, x_range, y_range, z_range),
+                                  blosc.compress(part.tobytes(), typesize=8), content_type='application/blosc')
+            force_authenticate(request, user=self.user)
+            return CutoutUploadPart.as_view()(request, upload_id=upload_id, x_range=x_range, y_range=y_range,
+                                              z_range=z_range).render()
+
+        # Parts have to be cuboid aligned
+        response = put_part('300:600', '0:64', '10:20')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Send the parts out of order, retrying one
+        for x_range, z_range in (('512:900', '16:20'), ('300:512', '10:16'), ('300:512', '16:20')):
+            response = put_part(x_range, '0:64', z_range)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = put_part('300:512', '0:64', '10:16')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["new_cuboids"], 0)
+        self.assertEqual(response.data["received"], 3)
+
+        # Commit fails until every part has been received
+        request = factory.post('/' + version + '/upload/{}/commit/'.format(upload_id))
+        force_authenticate(request, user=self.user)
+        response = CutoutUploadCommit.as_view()(request, upload_id=upload_id).render()
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = put_part('512:900', '0:64', '10:16')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        request = factory.post('/' + version + '/upload/{}/commit/'.format(upload_id))
+        force_authenticate(request, user=self.user)
+        response = CutoutUploadCommit.as_view()(request, upload_id=upload_id).render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], "committed")
+
+        # Create Request to get data you uploaded
+        request = factory.get('/' + version + '/cutout/col1/exp1/channel1/0/300:900/0:64/10:20/',
+                              accepts='application/blosc')
+        force_authenticate(request, user=self.user)
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='300:900', y_range='0:64', z_range='10:20',
+                                    t_range=None).render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data_mat = np.reshape(np.frombuffer(blosc.decompress(response.content), dtype=np.uint8), (10, 64, 600))
+        np.testing.assert_array_equal(data_mat, test_mat)
+
+    def test_channel_uint8_cuboid_aligned_time_upload_session_3d_part(self):
+        """ Test uint8 data, cuboid aligned, time samples, upload session parts have to cover every time sample"""
+        test_mat = np.random.randint(1, 254, (2, 16, 512, 512)).astype(np.uint8)
+
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/upload/col1/exp1/channel1/0/0:512/0:512/0:16/0:2/')
+        force_authenticate(request, user=self.user)
+        response = CutoutUpload.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                          resolution='0', x_range='0:512', y_range='0:512', z_range='0:16',
+                                          t_range='0:2').render()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        upload_id = response.data["upload_id"]
+
+        def put_part(part):
+            request = factory.put('/' + version + '/upload/{}/0:512/0:512/0:16/'.format(upload_id),
+                                  blosc.pack_array(part), content_type='application/blosc-python')
+            force_authenticate(request, user=self.user)
+            return CutoutUploadPart.as_view()(request, upload_id=upload_id, x_range='0:512', y_range='0:512',
+                                              z_range='0:16').render()
+
+        # A 3D part would only write the first time sample
+        response = put_part(np.ascontiguousarray(test_mat[0]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = put_part(test_mat)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["received"], 1)
+
+    def test_channel_uint8_cuboid_unaligned_offset_no_time_projection(self):
+        """ Test uint8 data, not cuboid aligned, offset, no time samples, projection interface"""
+        test_mat = np.random.randint(1, 254, (17, 300, 500))
+        test_mat = test_mat.astype(np.uint8)
+        bb = blosc.compress(test_mat.tobytes(), typesize=8)
+
+        # Create request
+        factory = APIRequestFactory()
+        request = factory.post('/' + version + '/cutout/col1/exp1/channel1/0/100:600/450:750/20:37/', bb,
+                               content_type='application/blosc')
+        # log in user
+        force_authenticate(request, user=self.user)
+
+        # Make request
+        response = Cutout.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                    resolution='0', x_range='100:600', y_range='450:750', z_range='20:37')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # Get a max projection along z as blosc
+        request = factory.get('/' + version + '/projection/col1/exp1/channel1/z/max/0/100:600/450:750/20:37/',
+                              HTTP_ACCEPT='application/blosc')
+        force_authenticate(request, user=self.user)
+        response = CutoutProjection.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                              axis='z', op='max', resolution='0', x_range='100:600',
+                                              y_range='450:750', z_range='20:37').render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data_mat = np.frombuffer(blosc.decompress(response.content), dtype=np.uint8).reshape(1, 300, 500)
+        np.testing.assert_array_equal(data_mat, test_mat.max(axis=0, keepdims=True))
+
+        # Get a mean projection along y as png
+        request = factory.get('/' + version + '/projection/col1/exp1/channel1/y/mean/0/100:600/450:750/20:37/',
+                              HTTP_ACCEPT='image/png')
+        force_authenticate(request, user=self.user)
+        response = CutoutProjection.as_view()(request, collection='col1', experiment='exp1', channel='channel1',
+                                              axis='y', op='mean', resolution='0', x_range='100:600',
+                                              y_range='450:750', z_range='20:37').render()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data_mat = np.asarray(Image.open(io.BytesIO(response.content)))
+        np.testing.assert_array_equal(data_mat, np.rint(test_mat.mean(axis=1)).astype(np.uint8))
+
     def test_channel_uint8_cuboid_aligned_offset_no_time_jpeg(self):
         """ Test uint8 data, cuboid aligned, offset, no time samples, jpeg interface"""
 
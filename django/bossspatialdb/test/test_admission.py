@@ -0,0 +1,111 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+from mockredis import mock_strict_redis_client
+
+from bossspatialdb.admission import AdmissionController, AdmissionRejected, renew_while_streaming
+
+
+class TestAdmissionController(APITestCase):
+
+    def setUp(self):
+        self.client = mock_strict_redis_client()
+
+    def test_acquire_release(self):
+        """Test that bytes are held while a lease is open and returned when it is closed"""
+        controller = AdmissionController(self.client, "test", 1000)
+        lease1 = controller.acquire(400)
+        lease2 = controller.acquire(600)
+        self.assertEqual(controller.get_stats()["in_flight_bytes"], 1000)
+        self.assertEqual(controller.get_stats()["leases"], 2)
+
+        lease1.close()
+        lease1.close()
+        self.assertEqual(controller.get_stats()["in_flight_bytes"], 600)
+
+        lease2.close()
+        self.assertEqual(controller.get_stats()["in_flight_bytes"], 0)
+        self.assertEqual(controller.get_stats()["admitted"], 2)
+
+    def test_over_budget_rejected(self):
+        """Test that a request that doesn't fit in the budget is rejected once its wait times out"""
+        controller = AdmissionController(self.client, "test", 1000, poll_interval=0.01)
+        lease = controller.acquire(800)
+
+        with self.assertRaises(AdmissionRejected):
+            controller.acquire(300, timeout=0.05)
+
+        stats = controller.get_stats()
+        self.assertEqual(stats["in_flight_bytes"], 800)
+        self.assertEqual(stats["rejected"], 1)
+        self.assertEqual(stats["queued"], 1)
+
+        # Room is available again once the first request completes
+        lease.close()
+        controller.acquire(300)
+
+    def test_budget_shared(self):
+        """Test that controllers with the same name share one budget"""
+        controller1 = AdmissionController(self.client, "test", 1000)
+        controller2 = AdmissionController(self.client, "test", 1000)
+        controller1.acquire(800)
+
+        with self.assertRaises(AdmissionRejected):
+            controller2.acquire(300)
+
+    def test_lone_request_larger_than_budget(self):
+        """Test that a request larger than the budget is admitted when nothing else is in flight"""
+        controller = AdmissionController(self.client, "test", 1000)
+        lease = controller.acquire(5000)
+        self.assertEqual(controller.get_stats()["in_flight_bytes"], 5000)
+        lease.close()
+
+    def test_reclaim_expired(self):
+        """Test that leases that outlive their TTL are reclaimed"""
+        controller = AdmissionController(self.client, "test", 1000, lease_ttl=-1)
+        controller.acquire(800)
+
+        # The expired lease is reclaimed while the next request waits
+        controller.acquire(300, timeout=1)
+        stats = controller.get_stats()
+        self.assertEqual(stats["reclaimed"], 1)
+        self.assertEqual(stats["in_flight_bytes"], 300)
+
+    def test_renew(self):
+        """Test that a renewed lease is not reclaimed and a released lease is not renewed"""
+        controller = AdmissionController(self.client, "test", 1000, lease_ttl=-1)
+        lease = controller.acquire(800)
+
+        controller.lease_ttl = 60
+        lease.renew()
+        self.assertEqual(controller.reclaim_expired(), 0)
+        self.assertEqual(controller.get_stats()["in_flight_bytes"], 800)
+
+        lease.close()
+        lease.renew()
+        self.assertFalse(controller.renew(lease))
+        self.assertEqual(controller.get_stats()["leases"], 0)
+        self.assertEqual(controller.get_stats()["in_flight_bytes"], 0)
+
+    def test_renew_while_streaming(self):
+        """Test that a streamed response renews its leases as it sends chunks"""
+        controller = AdmissionController(self.client, "test", 1000, lease_ttl=-1)
+        lease = controller.acquire(800)
+        controller.lease_ttl = 60
+
+        chunks = list(renew_while_streaming(iter([b'a', b'b']), [lease], 0))
+        self.assertEqual(chunks, [b'a', b'b'])
+        self.assertEqual(controller.reclaim_expired(), 0)
@@ -0,0 +1,122 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+import numpy as np
+
+from bosscore.error import BossError
+from bossspatialdb.batch import parse_regions, get_union, get_x_runs, get_batch_peak_size, iter_batch_regions
+from bossspatialdb.renderers import BloscStreamRenderer
+from bossspatialdb.framing import decode_regions
+
+
+class FakeCube(object):
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeCache(object):
+    """Stand-in for SpatialDB that serves cutouts from an in-memory volume and records the cuboids read"""
+
+    def __init__(self, volume):
+        self.volume = volume
+        self.calls = []
+
+    def cutout(self, resource, corner, extent, resolution, time_range, filter_ids=None, iso=False):
+        self.calls.append((corner, extent))
+        return FakeCube(self.volume[time_range[0]:time_range[1],
+                                    corner[2]:corner[2] + extent[2],
+                                    corner[1]:corner[1] + extent[1],
+                                    corner[0]:corner[0] + extent[0]].copy())
+
+
+class FakeResource(object):
+    def get_numpy_data_type(self):
+        return np.uint16
+
+
+class TestBatch(APITestCase):
+
+    def test_parse_regions(self):
+        """Test converting the regions of a batch request"""
+        regions = parse_regions([{"x": "0:10", "y": "5:7", "z": "1:2"}])
+        self.assertEqual(regions, [((0, 5, 1), (10, 2, 1))])
+
+    def test_parse_regions_invalid(self):
+        """Test that invalid regions are rejected"""
+        for regions in [[], None, [{"x": "0:10", "y": "5:7"}], [{"x": "10:0", "y": "5:7", "z": "1:2"}],
+                        [{"x": "a:b", "y": "5:7", "z": "1:2"}]]:
+            with self.assertRaises(BossError):
+                parse_regions(regions)
+
+    def test_union(self):
+        """Test the bounding box of several regions"""
+        self.assertEqual(get_union([((10, 0, 5), (10, 10, 1)), ((0, 20, 0), (5, 5, 2))]),
+                         ((0, 0, 0), (20, 25, 6)))
+
+    def test_x_runs(self):
+        """Test grouping cuboids into runs along x"""
+        self.assertEqual(get_x_runs([(2, 0, 0), (0, 0, 0), (1, 0, 0), (4, 0, 0), (0, 1, 0)]),
+                         [(0, 3, 0, 0), (4, 5, 0, 0), (0, 1, 1, 0)])
+
+    def test_regions_read_cuboids_once(self):
+        """Test that overlapping regions are assembled correctly and shared cuboids are read once"""
+        volume = np.random.randint(1, 2 ** 16 - 1, (2, 40, 600, 1100)).astype(np.uint16)
+        cache = FakeCache(volume)
+        regions = [((500, 100, 10), (40, 20, 10)),
+                   ((505, 110, 12), (40, 20, 3)),
+                   ((1000, 500, 30), (50, 50, 5)),
+                   ((0, 0, 0), (10, 10, 1))]
+
+        data = list(iter_batch_regions(cache, FakeResource(), regions, 0, [0, 2]))
+        for (corner, extent), block in zip(regions, data):
+            np.testing.assert_array_equal(block, volume[:, corner[2]:corner[2] + extent[2],
+                                                        corner[1]:corner[1] + extent[1],
+                                                        corner[0]:corner[0] + extent[0]])
+
+        # The first two regions share cuboids; every cuboid voxel is read at most once
+        read = np.zeros(volume.shape[1:], dtype=np.int32)
+        for corner, extent in cache.calls:
+            read[corner[2]:corner[2] + extent[2], corner[1]:corner[1] + extent[1],
+                 corner[0]:corner[0] + extent[0]] += 1
+        self.assertLessEqual(read.max(), 1)
+
+    def test_peak_size(self):
+        """Test that cuboids kept for later regions are counted until their last use"""
+        regions = [((0, 0, 0), (10, 10, 1)), ((600, 0, 0), (10, 10, 1))]
+
+        # The first cuboid is dropped before the second is read
+        self.assertEqual(get_batch_peak_size(regions, 0, 1, 2), (512 * 10 + 10 * 10) * 2)
+
+        # Both cuboids are held while the second region is assembled, along with the first region
+        self.assertEqual(get_batch_peak_size(regions + [regions[0]], 0, 1, 2),
+                         (512 * 10 + 98 * 10 + 2 * 10 * 10) * 2)
+
+    def test_stream_regions(self):
+        """Test encoding and decoding a batch response"""
+        volume = np.random.randint(1, 2 ** 16 - 1, (1, 20, 40, 40)).astype(np.uint16)
+        regions = [((0, 0, 0), (10, 10, 5)), ((20, 30, 10), (20, 10, 10))]
+        data = [volume[:, z:z + e[2], y:y + e[1], x:x + e[0]] for (x, y, z), e in regions]
+
+        buf = b''.join(BloscStreamRenderer().stream_regions(regions, data, False, 0, np.uint16))
+        decoded = decode_regions(buf)
+
+        self.assertEqual(len(decoded), 2)
+        self.assertEqual(decoded[1][0], (0, 10, 30, 20))
+        np.testing.assert_array_equal(decoded[0][1], data[0][0])
+        np.testing.assert_array_equal(decoded[1][1], data[1][0])
+
+        with self.assertRaises(ValueError):
+            decode_regions(buf[:-1])
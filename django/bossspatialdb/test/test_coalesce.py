@@ -0,0 +1,120 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+import threading
+
+from bossspatialdb.coalesce import SingleFlight
+
+
+class FakeLockClient(object):
+    """Minimal stand-in for the redis commands used by the cross-worker lock"""
+
+    def __init__(self):
+        self.store = {}
+
+    def set(self, name, value, nx=False, ex=None):
+        if nx and name in self.store:
+            return None
+        self.store[name] = value.encode()
+        return True
+
+    def get(self, name):
+        return self.store.get(name)
+
+    def delete(self, name):
+        self.store.pop(name, None)
+
+
+class HeldLockClient(FakeLockClient):
+    """Stand-in for a redis lock that another worker always holds"""
+
+    def set(self, name, value, nx=False, ex=None):
+        return None
+
+
+class TestSingleFlight(APITestCase):
+
+    def test_concurrent_calls_coalesce(self):
+        """Test that concurrent calls with the same key run once"""
+        flight = SingleFlight("TEST")
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return "data"
+
+        def worker():
+            results.append(flight.do("key", fetch))
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        threads[0].start()
+        while not calls:
+            pass
+        for t in threads[1:]:
+            t.start()
+        while flight.get_stats()["coalesced"] < 4:
+            pass
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([r[0] for r in results], ["data"] * 5)
+        self.assertEqual(sum(1 for r in results if r[1]), 4)
+
+        stats = flight.get_stats()
+        self.assertEqual(stats["executed"], 1)
+        self.assertEqual(stats["coalesced"], 4)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_sequential_calls_not_coalesced(self):
+        """Test that a call after the previous one completed runs again"""
+        flight = SingleFlight("TEST")
+        self.assertEqual(flight.do("key", lambda: 1), (1, False))
+        self.assertEqual(flight.do("key", lambda: 2), (2, False))
+        self.assertEqual(flight.get_stats()["executed"], 2)
+
+    def test_error_propagates(self):
+        """Test that an error in the call is raised and the key is released"""
+        flight = SingleFlight("TEST")
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            flight.do("key", fail)
+        self.assertEqual(flight.get_stats()["in_flight"], 0)
+
+    def test_redis_lock_released(self):
+        """Test that the cross-worker lock is taken and released"""
+        flight = SingleFlight("TEST")
+        client = FakeLockClient()
+
+        self.assertEqual(flight.do("key", lambda: len(client.store), lock_client=client), (1, False))
+        self.assertEqual(client.store, {})
+
+    def test_redis_lock_wait_timeout(self):
+        """Test that a call runs anyway once the wait on another worker's lock times out"""
+        flight = SingleFlight("TEST")
+        client = HeldLockClient()
+
+        self.assertEqual(flight.do("key", lambda: "data", lock_client=client, lock_timeout=0), ("data", False))
+        stats = flight.get_stats()
+        self.assertEqual(stats["lock_waits"], 1)
+        self.assertEqual(stats["lock_timeouts"], 1)
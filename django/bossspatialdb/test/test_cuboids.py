@@ -0,0 +1,50 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+from bossspatialdb.cuboids import get_cuboid_range, iter_cuboid_indices, get_num_cuboids, get_cuboid_region, \
+    clip_to_region, is_cuboid_aligned
+
+
+class TestCuboids(APITestCase):
+
+    def test_cuboid_range(self):
+        """Test the cuboid indices covering an unaligned region"""
+        x_range, y_range, z_range = get_cuboid_range((100, 500, 15), (500, 20, 2), 0)
+        self.assertEqual(list(x_range), [0, 1])
+        self.assertEqual(list(y_range), [0, 1])
+        self.assertEqual(list(z_range), [0, 1])
+        self.assertEqual(get_num_cuboids((100, 500, 15), (500, 20, 2), 0), 8)
+
+    def test_cuboid_range_aligned(self):
+        """Test the cuboid indices covering an aligned region"""
+        indices = list(iter_cuboid_indices((512, 0, 16), (512, 1024, 16), 0))
+        self.assertEqual(indices, [(1, 0, 1), (1, 1, 1)])
+
+    def test_cuboid_region(self):
+        """Test getting the region covered by a cuboid"""
+        self.assertEqual(get_cuboid_region((1, 2, 3), 0), ((512, 1024, 48), (512, 512, 16)))
+
+    def test_clip_to_region(self):
+        """Test intersecting a cuboid with a region"""
+        self.assertEqual(clip_to_region((512, 0, 0), (512, 512, 16), (600, 100, 10), (1000, 10, 10)),
+                         ((600, 100, 10), (424, 10, 6)))
+        self.assertEqual(clip_to_region((0, 0, 0), (512, 512, 16), (600, 100, 10), (10, 10, 10))[1], (0, 10, 6))
+
+    def test_is_cuboid_aligned(self):
+        """Test detecting regions made of whole cuboids"""
+        self.assertTrue(is_cuboid_aligned((512, 0, 16), (1024, 512, 32), 0))
+        self.assertFalse(is_cuboid_aligned((512, 0, 16), (1000, 512, 32), 0))
+        self.assertFalse(is_cuboid_aligned((1, 0, 16), (512, 512, 32), 0))
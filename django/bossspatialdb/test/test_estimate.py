@@ -0,0 +1,111 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+from bossspatialdb.estimate import get_aligned_region, get_cache_residency, estimate_latency, estimate_cutout
+
+from spdb.c_lib import ndlib
+
+
+class FakePipeline(object):
+    def __init__(self, keys):
+        self.keys = keys
+        self.results = []
+
+    def exists(self, key):
+        self.results.append(key in self.keys)
+
+    def execute(self):
+        return self.results
+
+
+class FakeClient(object):
+    def __init__(self, keys):
+        self.keys = keys
+
+    def pipeline(self):
+        return FakePipeline(self.keys)
+
+
+class FakeKvio(object):
+    """Stand-in for the cache's key value store, with a set of cached and a set of dirty (t, morton) keys"""
+
+    def __init__(self, cached, dirty):
+        self.cache_client = FakeClient(cached)
+        self.dirty = dirty
+
+    def generate_cached_cuboid_keys(self, resource, resolution, time_samples, morton_ids, iso=False):
+        return [(t, morton) for t in time_samples for morton in morton_ids]
+
+    def is_dirty(self, keys):
+        return [key in self.dirty for key in keys]
+
+
+class FakeCache(object):
+    def __init__(self, cached=(), dirty=()):
+        self.kvio = FakeKvio(set(cached), set(dirty))
+
+
+class FakeResource(object):
+    def get_bit_depth(self):
+        return 16
+
+
+def get_key(t, index):
+    return t, ndlib.XYZMorton(list(index))
+
+
+class TestEstimate(APITestCase):
+
+    def test_get_aligned_region(self):
+        """Test expanding a region to cuboid boundaries"""
+        self.assertEqual(get_aligned_region((100, 600, 20), (500, 100, 10), 0), ((0, 512, 16), (1024, 512, 16)))
+        self.assertEqual(get_aligned_region((0, 0, 0), (512, 512, 16), 0), ((0, 0, 0), (512, 512, 16)))
+
+    def test_get_cache_residency(self):
+        """Test counting cached, dirty and not cached cuboids"""
+        cache = FakeCache(cached=[get_key(0, (0, 0, 0)), get_key(1, (0, 0, 0)), get_key(0, (1, 0, 0))],
+                          dirty=[get_key(1, (1, 0, 0))])
+        counts = get_cache_residency(cache, FakeResource(), (0, 0, 0), (1024, 512, 32), 0, [0, 2])
+
+        self.assertEqual(counts, {"cached": 3, "dirty": 1, "not_cached": 4, "probed": 8})
+
+    def test_get_cache_residency_sampled(self):
+        """Test the counts of a sampled region are scaled to the whole region"""
+        cached = [get_key(0, (x, 0, 0)) for x in range(0, 20, 2)]
+        counts = get_cache_residency(FakeCache(cached=cached), FakeResource(), (0, 0, 0), (20 * 512, 512, 16), 0,
+                                     [0, 1], max_probes=10)
+
+        self.assertEqual(counts["probed"], 10)
+        self.assertEqual(counts["cached"], 20)
+        self.assertEqual(counts["cached"] + counts["dirty"] + counts["not_cached"], 20)
+
+    def test_estimate_latency(self):
+        """Test the latency model"""
+        model = {"cached_cuboid_s": 0.01, "cold_cuboid_s": 0.1, "bytes_per_s": 1000}
+        self.assertAlmostEqual(estimate_latency(2, 1, 3, 500, model), 0.03 + 0.3 + 0.5)
+
+    def test_estimate_cutout(self):
+        """Test the estimate of a time series cutout"""
+        model = {"cached_cuboid_s": 0.01, "cold_cuboid_s": 0.1, "bytes_per_s": 1000}
+        estimate = estimate_cutout(FakeCache(cached=[get_key(5, (0, 1, 1))]), FakeResource(), (100, 600, 20),
+                                   (500, 100, 10), 0, [5, 7], model=model)
+
+        self.assertEqual(estimate["uncompressed_bytes"], 500 * 100 * 10 * 2 * 2)
+        self.assertFalse(estimate["cuboid_aligned"])
+        self.assertEqual(estimate["cuboids_per_time_sample"], 2)
+        self.assertEqual(estimate["time_samples"], 2)
+        self.assertEqual(estimate["cuboids"], {"cached": 1, "dirty": 0, "not_cached": 3, "probed": 4})
+        self.assertAlmostEqual(estimate["estimated_seconds"], 0.01 + 0.3 + 2000)
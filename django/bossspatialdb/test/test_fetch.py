@@ -0,0 +1,123 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from rest_framework.test import APITestCase
+
+import numpy as np
+
+from bossspatialdb.fetch import get_time_blocks, get_slab_offset, iter_ordered, iter_z_slabs, iter_time_slabs, \
+    time_block_cutout
+from bossspatialdb.renderers import BloscStreamRenderer
+from bossspatialdb.framing import decode_frames
+
+
+class FakeCube(object):
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeCache(object):
+    """Stand-in for SpatialDB that serves cutouts from an in-memory volume and records the time ranges read"""
+
+    def __init__(self, volume):
+        self.volume = volume
+        self.time_ranges = []
+        self._lock = threading.Lock()
+
+    def cutout(self, resource, corner, extent, resolution, time_range, filter_ids=None, iso=False):
+        with self._lock:
+            self.time_ranges.append(tuple(time_range))
+        return FakeCube(self.volume[time_range[0]:time_range[1],
+                                    corner[2]:corner[2] + extent[2],
+                                    corner[1]:corner[1] + extent[1],
+                                    corner[0]:corner[0] + extent[0]].copy())
+
+
+class FakeResource(object):
+    def get_bit_depth(self):
+        return 16
+
+
+class TestFetch(APITestCase):
+
+    def setUp(self):
+        self.volume = np.random.randint(0, 2 ** 16, (10, 40, 20, 30)).astype(np.uint16)
+
+    def test_get_time_blocks(self):
+        """Test splitting a time range into blocks"""
+        self.assertEqual(get_time_blocks([3, 10], 3), [[3, 6], [6, 9], [9, 10]])
+        self.assertEqual(get_time_blocks([0, 2], 16), [[0, 2]])
+
+    def test_get_slab_offset(self):
+        """Test the offsets of z-slabs and of slabs of time blocks"""
+        self.assertEqual(get_slab_offset(5), (0, 5, 0, 0))
+        self.assertEqual(get_slab_offset((2, 5)), (2, 5, 0, 0))
+
+    def test_iter_ordered(self):
+        """Test results are returned in order"""
+        self.assertEqual(list(iter_ordered(lambda x: x * 2, range(10), 3)), [x * 2 for x in range(10)])
+
+    def test_iter_ordered_error(self):
+        """Test an error of a call is raised to the consumer"""
+        def fn(x):
+            if x == 4:
+                raise ValueError()
+            return x
+
+        with self.assertRaises(ValueError):
+            list(iter_ordered(fn, range(10), 2))
+
+    def test_time_block_cutout(self):
+        """Test a time series read as blocks is assembled in order"""
+        cache = FakeCache(self.volume)
+        cube = time_block_cutout(cache, FakeResource(), (3, 2, 5), (20, 15, 30), 0, [1, 10], block_size=2,
+                                 workers=3)
+
+        np.testing.assert_array_equal(cube.data, self.volume[1:10, 5:35, 2:17, 3:23])
+        self.assertEqual(sorted(cache.time_ranges), [(1, 3), (3, 5), (5, 7), (7, 9), (9, 10)])
+
+    def test_time_block_cutout_single_block(self):
+        """Test a range that fits in one block is read with one call"""
+        cache = FakeCache(self.volume)
+        cube = time_block_cutout(cache, FakeResource(), (0, 0, 0), (30, 20, 40), 0, [2, 5], block_size=16,
+                                 workers=4)
+
+        np.testing.assert_array_equal(cube.data, self.volume[2:5])
+        self.assertEqual(cache.time_ranges, [(2, 5)])
+
+    def test_iter_time_slabs(self):
+        """Test slabs of time blocks are yielded in order with their (t, z) offsets"""
+        cache = FakeCache(self.volume)
+        slabs = list(iter_time_slabs(cache, FakeResource(), (0, 0, 4), (30, 20, 36), 0, [0, 10], block_size=5,
+                                     workers=3, target_size=30 * 20 * 16 * 5 * 2))
+
+        offsets = [offset for offset, _ in slabs]
+        self.assertEqual(offsets, [(t, z) for t in (0, 5) for z in (0, 12, 28)])
+        for (t, z), cube in slabs:
+            np.testing.assert_array_equal(cube.data, self.volume[t:t + cube.data.shape[0],
+                                                                 4 + z:4 + z + cube.data.shape[1]])
+
+    def test_stream_time_slabs(self):
+        """Test streamed slabs of time blocks decode to the full cutout"""
+        cache = FakeCache(self.volume)
+        slabs = iter_time_slabs(cache, FakeResource(), (0, 0, 0), (30, 20, 40), 0, [0, 10], block_size=3,
+                                workers=2)
+        iter_z = iter_z_slabs(FakeCache(self.volume), FakeResource(), (0, 0, 0), (30, 20, 40), 0, [0, 10])
+
+        renderer = BloscStreamRenderer()
+        for blocks in (slabs, iter_z):
+            body = b''.join(renderer.stream(blocks, True, self.volume.shape, self.volume.dtype))
+            np.testing.assert_array_equal(decode_frames(body), self.volume)
@@ -0,0 +1,127 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+import unittest
+import blosc
+import numpy as np
+
+from bossspatialdb.framing import pack_frame_header, unpack_frame_header, blosc_frame, end_frame, \
+    iter_frames, decode_frames, codec_frame, codec_available, FRAME_HEADER, FLAG_END, CODEC_BLOSC, \
+    CODEC_BLOSC_PACKED, CODEC_ZSTD, CODEC_LZ4
+from bossspatialdb.renderers import BloscCuboidsRenderer
+
+
+class TestFraming(APITestCase):
+
+    def test_header_round_trip(self):
+        """Test encoding and decoding a frame header"""
+        header = pack_frame_header(CODEC_BLOSC, 4, np.uint16, (1, 2, 3, 4), (5, 6, 7, 8), 1234)
+        self.assertEqual(len(header), FRAME_HEADER.size)
+
+        decoded = unpack_frame_header(header)
+        self.assertEqual(decoded.codec, CODEC_BLOSC)
+        self.assertEqual(decoded.ndim, 4)
+        self.assertEqual(decoded.flags, 0)
+        self.assertEqual(decoded.dtype, np.dtype(np.uint16))
+        self.assertEqual(decoded.offset, (1, 2, 3, 4))
+        self.assertEqual(decoded.shape, (5, 6, 7, 8))
+        self.assertEqual(decoded.nbytes, 1234)
+
+    def test_header_bad_magic(self):
+        """Test that a buffer that is not a frame is rejected"""
+        with self.assertRaises(ValueError):
+            unpack_frame_header(b'\0' * FRAME_HEADER.size)
+
+    def test_decode_slabs_3d(self):
+        """Test reassembling a 3D response from z-slabs"""
+        test_mat = np.random.randint(1, 254, (1, 40, 30, 20)).astype(np.uint8)
+
+        buf = b''
+        for z in range(0, 40, 16):
+            header, payload = blosc_frame(test_mat[:, z:z + 16, :, :], (0, z, 0, 0), 3)
+            buf += header + payload
+        buf += end_frame(3, np.uint8, test_mat.shape)
+
+        frames = list(iter_frames(buf))
+        self.assertEqual(len(frames), 4)
+        self.assertTrue(frames[-1][0].flags & FLAG_END)
+
+        data = decode_frames(buf)
+        self.assertEqual(data.shape, (40, 30, 20))
+        np.testing.assert_array_equal(data, test_mat[0])
+
+    def test_decode_slabs_4d(self):
+        """Test reassembling a 4D response from z-slabs"""
+        test_mat = np.random.randint(1, 2 ** 16 - 1, (3, 20, 30, 20)).astype(np.uint16)
+
+        buf = b''
+        for z in range(0, 20, 16):
+            header, payload = blosc_frame(test_mat[:, z:z + 16, :, :], (0, z, 0, 0), 4)
+            buf += header + payload
+        buf += end_frame(4, np.uint16, test_mat.shape)
+
+        np.testing.assert_array_equal(decode_frames(buf), test_mat)
+
+    def test_decode_missing_end_frame(self):
+        """Test that a truncated response is detected"""
+        test_mat = np.random.randint(1, 254, (1, 16, 30, 20)).astype(np.uint8)
+        header, payload = blosc_frame(test_mat, (0, 0, 0, 0), 3)
+
+        with self.assertRaises(ValueError):
+            decode_frames(header + payload)
+
+        with self.assertRaises(ValueError):
+            decode_frames(header + payload[:-1])
+
+    def test_decode_packed_cuboids(self):
+        """Test reassembling a response made of blosc packed cuboids"""
+        test_mat = np.random.randint(1, 2 ** 16 - 1, (2, 32, 20, 10)).astype(np.uint16)
+
+        blocks = []
+        for z in range(0, 32, 16):
+            for t in range(2):
+                block = np.ascontiguousarray(test_mat[t:t + 1, z:z + 16, :, :])
+                blocks.append(((t, z, 0, 0), block.shape, blosc.pack_array(block)))
+
+        buf = b''.join(BloscCuboidsRenderer().stream(blocks, True, test_mat.shape, np.uint16))
+        self.assertTrue(all(h.codec == CODEC_BLOSC_PACKED for h, _ in list(iter_frames(buf))[:-1]))
+        np.testing.assert_array_equal(decode_frames(buf), test_mat)
+
+    @unittest.skipUnless(codec_available(CODEC_ZSTD), "zstandard is not installed")
+    def test_decode_zstd(self):
+        """Test decoding a zstd frame and rejecting one larger than its header"""
+        test_mat = np.random.randint(1, 2 ** 16 - 1, (2, 20, 30, 20)).astype(np.uint16)
+
+        header, payload = codec_frame(CODEC_ZSTD, test_mat, (0, 0, 0, 0), 4, 3)
+        np.testing.assert_array_equal(decode_frames(header + payload + end_frame(4, np.uint16, test_mat.shape)),
+                                      test_mat)
+
+        header = pack_frame_header(CODEC_ZSTD, 4, np.uint16, (0, 0, 0, 0), (1, 20, 30, 20), len(payload))
+        with self.assertRaises(ValueError):
+            decode_frames(header + payload + end_frame(4, np.uint16, test_mat.shape))
+
+    @unittest.skipUnless(codec_available(CODEC_LZ4), "lz4 is not installed")
+    def test_decode_lz4(self):
+        """Test decoding an lz4 frame and rejecting one larger than its header"""
+        test_mat = np.random.randint(1, 254, (1, 20, 30, 20)).astype(np.uint8)
+
+        header, payload = codec_frame(CODEC_LZ4, test_mat, (0, 0, 0, 0), 3, 0)
+        np.testing.assert_array_equal(decode_frames(header + payload + end_frame(3, np.uint8, test_mat.shape)),
+                                      test_mat[0])
+
+        header = pack_frame_header(CODEC_LZ4, 3, np.uint8, (0, 0, 0, 0), (1, 10, 30, 20), len(payload))
+        with self.assertRaises(ValueError):
+            decode_frames(header + payload + end_frame(3, np.uint8, test_mat.shape))
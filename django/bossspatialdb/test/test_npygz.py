@@ -0,0 +1,100 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+import io
+import zlib
+
+import numpy as np
+
+from bossspatialdb.npygz import iter_npygz, decode_npygz, adler32_combine, zlib_header
+
+
+class TestNpygz(APITestCase):
+
+    def test_adler32_combine(self):
+        """Test combining the checksums of two buffers"""
+        a = b'first buffer of data' * 100
+        b = b'second buffer' * 5000
+        self.assertEqual(adler32_combine(zlib.adler32(a), zlib.adler32(b), len(b)), zlib.adler32(a + b))
+
+    def test_zlib_header(self):
+        """Test that every level produces a valid zlib header"""
+        for level in range(-1, 10):
+            header = zlib_header(level)
+            self.assertEqual(header[0], 0x78)
+            self.assertEqual((header[0] * 256 + header[1]) % 31, 0)
+
+    def test_encode_compatible(self):
+        """Test that the parallel encoder produces output readable by zlib.decompress() and np.load()"""
+        test_mat = np.random.randint(1, 2 ** 16 - 1, (5, 40, 300, 200)).astype(np.uint16)
+        for level in (0, 1, 6, 9):
+            npy_gz = b''.join(iter_npygz(test_mat, level, threads=3, block_size=100000))
+            data_mat = np.load(io.BytesIO(zlib.decompress(npy_gz)))
+            np.testing.assert_array_equal(data_mat, test_mat)
+            self.assertEqual(data_mat.dtype, test_mat.dtype)
+
+    def test_decode_stream(self):
+        """Test decoding a zlib compressed npy file in small pieces"""
+        test_mat = np.random.randint(1, 254, (17, 300, 500)).astype(np.uint8)
+        npy_file = io.BytesIO()
+        np.save(npy_file, test_mat, allow_pickle=False)
+
+        data_mat = decode_npygz(io.BytesIO(zlib.compress(npy_file.getvalue())), chunk_size=1000)
+        np.testing.assert_array_equal(data_mat, test_mat)
+
+    def test_decode_fortran_order(self):
+        """Test decoding an array saved in fortran order"""
+        test_mat = np.asfortranarray(np.random.randint(1, 254, (4, 30, 50)).astype(np.uint64))
+        npy_file = io.BytesIO()
+        np.save(npy_file, test_mat, allow_pickle=False)
+
+        np.testing.assert_array_equal(decode_npygz(io.BytesIO(zlib.compress(npy_file.getvalue()))), test_mat)
+
+    def test_decode_invalid(self):
+        """Test that truncated, oversized and corrupt input is rejected"""
+        test_mat = np.random.randint(1, 254, (17, 30, 50)).astype(np.uint8)
+        npy_gz = b''.join(iter_npygz(test_mat))
+
+        with self.assertRaises(ValueError):
+            decode_npygz(io.BytesIO(npy_gz[:-10]))
+
+        with self.assertRaises(ValueError):
+            decode_npygz(io.BytesIO(npy_gz + b'extra'))
+
+        with self.assertRaises(ValueError):
+            decode_npygz(io.BytesIO(npy_gz), max_size=test_mat.nbytes - 1)
+
+        with self.assertRaises(ValueError):
+            decode_npygz(io.BytesIO(zlib.compress(b'not an npy file at all')))
+
+        with self.assertRaises(zlib.error):
+            decode_npygz(io.BytesIO(b'not compressed data'))
+
+    def test_decode_unexpected_array(self):
+        """Test that the shape and type are checked from the npy header before the data is read"""
+        test_mat = np.random.randint(1, 254, (17, 300, 500)).astype(np.uint8)
+        npy_gz = b''.join(iter_npygz(test_mat))
+
+        stream = io.BytesIO(npy_gz)
+        with self.assertRaises(ValueError):
+            decode_npygz(stream, chunk_size=1000, shapes=[(1, 17, 300, 500), (17, 300, 400)])
+        self.assertLess(stream.tell(), len(npy_gz))
+
+        with self.assertRaises(TypeError):
+            decode_npygz(io.BytesIO(npy_gz), shapes=[(17, 300, 500)], dtype=np.uint16)
+
+        data_mat = decode_npygz(io.BytesIO(npy_gz), shapes=[(17, 300, 500)], dtype=np.uint8)
+        np.testing.assert_array_equal(data_mat, test_mat)
@@ -0,0 +1,178 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+import blosc
+import io
+import numpy as np
+
+from bossspatialdb.parsers import read_request_body, read_exactly, read_spooled_body, check_blosc_header, \
+    decompress_blosc_into, check_frames, ConsumeReqMixin
+from bossspatialdb.framing import pack_frame_header, end_frame, CODEC_RAW
+
+
+class TestParserHelpers(APITestCase):
+
+    def test_read_request_body_chunked(self):
+        """Test reading a body in chunks smaller than the body"""
+        body = bytes(range(256)) * 10
+        data = read_request_body(io.BytesIO(body), len(body), chunk_size=100)
+        self.assertEqual(bytes(data), body)
+
+    def test_read_request_body_truncated(self):
+        """Test reading a body that is shorter than the advertised content length"""
+        body = b'0123456789'
+        data = read_request_body(io.BytesIO(body), 20, chunk_size=3)
+        self.assertEqual(bytes(data), body)
+
+    def test_read_request_body_no_length(self):
+        """Test reading a body without a content length"""
+        body = b'0123456789'
+        data = read_request_body(io.BytesIO(body), None)
+        self.assertEqual(bytes(data), body)
+
+    def test_read_request_body_prefix(self):
+        """Test reading the rest of a body whose start was already read"""
+        stream = io.BytesIO(bytes(range(100)))
+        prefix = read_exactly(stream, 16)
+        data = read_request_body(stream, 100, chunk_size=30, prefix=prefix)
+        self.assertEqual(bytes(data), bytes(range(100)))
+
+    def test_read_spooled_body(self):
+        """Test a body over the threshold is spooled to disk and decompressed from the mapping"""
+        test_mat = np.random.randint(1, 2 ** 16 - 1, (4, 16, 32)).astype(np.uint16)
+        compressed = blosc.compress(test_mat.tobytes(), typesize=16)
+        stream = io.BytesIO(compressed)
+        prefix = read_exactly(stream, 16)
+
+        with read_spooled_body(stream, len(compressed), threshold=100, chunk_size=50, prefix=prefix) as body:
+            self.assertTrue(body.spooled)
+            self.assertEqual(len(body), len(compressed))
+            data = decompress_blosc_into(body.buffer, (4, 16, 32), np.uint16)
+        np.testing.assert_array_equal(data, test_mat)
+        self.assertFalse(body.spooled)
+
+    def test_read_spooled_body_max_size(self):
+        """Test bodies larger than the limit are rejected, before reading them if their length is known"""
+        body = b'0123456789'
+        with read_spooled_body(io.BytesIO(body), None, chunk_size=3, max_size=10) as spooled:
+            self.assertEqual(bytes(spooled.buffer), body)
+
+        stream = io.BytesIO(body)
+        with self.assertRaises(ValueError):
+            read_spooled_body(stream, len(body), max_size=9)
+        self.assertEqual(stream.tell(), 0)
+
+        with self.assertRaises(ValueError):
+            read_spooled_body(io.BytesIO(body), None, chunk_size=3, max_size=9)
+
+    def test_read_spooled_body_small(self):
+        """Test bodies under the threshold, or of unknown length, are read into memory"""
+        body = b'0123456789'
+        for content_length in (len(body), None):
+            with read_spooled_body(io.BytesIO(body), content_length, threshold=100) as spooled:
+                self.assertFalse(spooled.spooled)
+                self.assertEqual(bytes(spooled.buffer), body)
+
+    def test_consume_request(self):
+        """Test an unused body is drained in bounded reads"""
+        class Stream(io.BytesIO):
+            sizes = []
+
+            def read(self, size=-1):
+                self.sizes.append(size)
+                return super().read(size)
+
+        stream = Stream(b'0' * 100)
+        ConsumeReqMixin().consume_request(stream)
+        self.assertEqual(stream.tell(), 100)
+        self.assertNotIn(-1, stream.sizes)
+
+    def test_check_blosc_header(self):
+        """Test checking a blosc header against the expected array"""
+        test_mat = np.random.randint(1, 2 ** 16 - 1, (4, 16, 32)).astype(np.uint16)
+        for typesize in (1, 2, 8, 16):
+            compressed = blosc.compress(test_mat.tobytes(), typesize=typesize)
+            check_blosc_header(compressed[:16], (4, 16, 32), np.uint16, len(compressed))
+
+        compressed = blosc.compress(test_mat.tobytes(), typesize=16)
+        with self.assertRaises(ValueError):
+            check_blosc_header(compressed[:16], (4, 16, 16), np.uint16)
+        with self.assertRaises(ValueError):
+            check_blosc_header(compressed[:16], (4, 16, 32), np.uint16, len(compressed) + 1)
+        with self.assertRaises(ValueError):
+            check_blosc_header(compressed[:10], (4, 16, 32), np.uint16)
+        with self.assertRaises(TypeError):
+            check_blosc_header(compressed[:16], (4, 16, 64), np.uint8)
+
+    def test_check_frames(self):
+        """Test that POSTed frames have to cover the region exactly once"""
+        shape = (1, 4, 16, 32)
+
+        def build(*regions):
+            body = b''
+            for offset, frame_shape in regions:
+                nbytes = int(np.prod(frame_shape))
+                body += pack_frame_header(CODEC_RAW, 3, np.uint8, offset, frame_shape, nbytes) + bytes(nbytes)
+            return body + end_frame(3, np.uint8, shape)
+
+        check_frames(build(((0, 0, 0, 0), (1, 4, 16, 16)), ((0, 0, 0, 16), (1, 4, 16, 16))), CODEC_RAW, shape,
+                     np.dtype(np.uint8))
+        check_frames(build(((0, 0, 0, 0), (1, 2, 16, 32)), ((0, 2, 0, 0), (1, 2, 8, 32)),
+                           ((0, 2, 8, 0), (1, 2, 8, 32))), CODEC_RAW, shape, np.dtype(np.uint8))
+
+        # Gap
+        with self.assertRaises(ValueError):
+            check_frames(build(((0, 0, 0, 0), (1, 4, 16, 16))), CODEC_RAW, shape, np.dtype(np.uint8))
+        with self.assertRaises(ValueError):
+            check_frames(build(), CODEC_RAW, shape, np.dtype(np.uint8))
+
+        # Overlap, even with as many bytes as the region
+        with self.assertRaises(ValueError):
+            check_frames(build(((0, 0, 0, 0), (1, 4, 16, 16)), ((0, 0, 0, 8), (1, 4, 16, 16))), CODEC_RAW, shape,
+                         np.dtype(np.uint8))
+        with self.assertRaises(ValueError):
+            check_frames(build(((0, 0, 0, 0), (1, 4, 16, 32)), ((0, 0, 0, 0), (1, 4, 16, 32))), CODEC_RAW, shape,
+                         np.dtype(np.uint8))
+
+        # Outside of the region
+        with self.assertRaises(ValueError):
+            check_frames(build(((0, 0, 0, 0), (1, 4, 16, 32)), ((0, 0, 0, 32), (1, 4, 16, 16))), CODEC_RAW, shape,
+                         np.dtype(np.uint8))
+
+    def test_decompress_blosc_into(self):
+        """Test decompressing directly into an array"""
+        test_mat = np.random.randint(1, 2 ** 16 - 1, (4, 16, 32)).astype(np.uint16)
+        compressed = bytearray(blosc.compress(test_mat.tobytes(), typesize=2))
+
+        data = decompress_blosc_into(compressed, (4, 16, 32), np.uint16)
+        self.assertEqual(data.dtype, np.uint16)
+        np.testing.assert_array_equal(data, test_mat)
+
+    def test_decompress_blosc_into_wrong_shape(self):
+        """Test that a size mismatch is detected before decompressing"""
+        test_mat = np.random.randint(1, 254, (4, 16, 32)).astype(np.uint8)
+        compressed = blosc.compress(test_mat.tobytes(), typesize=1)
+
+        with self.assertRaises(ValueError):
+            decompress_blosc_into(compressed, (4, 16, 16), np.uint8)
+
+    def test_decompress_blosc_into_truncated(self):
+        """Test that a truncated body is rejected"""
+        test_mat = np.random.randint(1, 254, (4, 16, 32)).astype(np.uint8)
+        compressed = blosc.compress(test_mat.tobytes(), typesize=1)
+
+        with self.assertRaises(ValueError):
+            decompress_blosc_into(compressed[:-10], (4, 16, 32), np.uint8)
@@ -0,0 +1,63 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+from unittest.mock import patch
+
+from bossspatialdb import pool
+
+
+def mock_init_(self, kv_conf, state_conf, object_store_conf):
+    self.kvio = None
+    self.cache_state = None
+
+
+@patch('spdb.spatialdb.spatialdb.SpatialDB.__init__', mock_init_)
+class TestSpatialDBPool(APITestCase):
+
+    def setUp(self):
+        pool.reset_spatialdb()
+
+    def tearDown(self):
+        pool.reset_spatialdb()
+
+    def test_instance_reused(self):
+        """Test that requests in the same process share an instance"""
+        before = pool.get_pool_stats()
+
+        first = pool.get_spatialdb()
+        second = pool.get_spatialdb()
+        self.assertIs(first, second)
+
+        stats = pool.get_pool_stats()
+        self.assertTrue(stats["active"])
+        self.assertEqual(stats["instances_created"], before["instances_created"] + 1)
+        self.assertEqual(stats["lookups"], before["lookups"] + 2)
+
+    def test_instance_rebuilt_after_fork(self):
+        """Test that a new instance is built when the process id changes"""
+        first = pool.get_spatialdb()
+
+        with patch('os.getpid', return_value=pool.os.getpid() + 1):
+            second = pool.get_spatialdb()
+
+        self.assertIsNot(first, second)
+
+    def test_reset(self):
+        """Test dropping the instance"""
+        first = pool.get_spatialdb()
+        pool.reset_spatialdb()
+        self.assertFalse(pool.get_pool_stats()["active"])
+        self.assertIsNot(first, pool.get_spatialdb())
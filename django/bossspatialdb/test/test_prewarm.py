@@ -0,0 +1,95 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from rest_framework.test import APITestCase
+
+from mockredis import mock_strict_redis_client
+
+from bossspatialdb.prewarm import create_job, get_job, prewarm_regions, PrewarmExecutor
+
+from .test_estimate import FakeCache, FakeResource, get_key
+
+
+class RecordingCache(FakeCache):
+    """Stand-in for SpatialDB that records the regions read"""
+
+    def __init__(self, cached=(), dirty=()):
+        super().__init__(cached, dirty)
+        self.cutouts = []
+
+    def cutout(self, resource, corner, extent, resolution, time_range, filter_ids=None, iso=False):
+        self.cutouts.append((tuple(corner), tuple(extent), tuple(time_range)))
+
+
+class TestPrewarm(APITestCase):
+
+    def test_prewarm_regions(self):
+        """Test only cuboids that are not cached are read, in runs along x"""
+        cache = RecordingCache(cached=[get_key(0, (1, 0, 0))], dirty=[get_key(0, (2, 0, 0))])
+        updates = []
+        counts = prewarm_regions(cache, FakeResource(), [((0, 0, 0), (2048, 512, 16))], 0, [0, 1],
+                                 progress=lambda cached, paged_in: updates.append((cached, paged_in)))
+
+        self.assertEqual(counts, (2, 2))
+        self.assertEqual(cache.cutouts, [((0, 0, 0), (512, 512, 16), (0, 1)), ((1536, 0, 0), (512, 512, 16), (0, 1))])
+        self.assertEqual(updates, [(2, 0), (0, 1), (0, 1)])
+
+    def test_prewarm_regions_overlapping(self):
+        """Test cuboids shared by regions are only read once, and runs are split at the target size"""
+        cache = RecordingCache()
+        regions = [((0, 0, 0), (1024, 512, 16)), ((512, 0, 0), (1024, 512, 16))]
+        counts = prewarm_regions(cache, FakeResource(), regions, 0, [3, 5], target_size=2 * 512 * 512 * 16 * 2)
+
+        self.assertEqual(counts, (0, 6))
+        self.assertEqual(cache.cutouts, [((0, 0, 0), (1024, 512, 16), (3, 4)), ((1024, 0, 0), (512, 512, 16), (3, 4)),
+                                         ((0, 0, 0), (1024, 512, 16), (4, 5)), ((1024, 0, 0), (512, 512, 16), (4, 5))])
+
+    def test_job_progress(self):
+        """Test a job's progress is recorded and read back"""
+        client = mock_strict_redis_client()
+        job_id = create_job(client, "testuser", 8, 60)
+
+        job = get_job(client, job_id)
+        self.assertEqual(job["status"], "queued")
+        self.assertEqual(job["user"], "testuser")
+        self.assertEqual(job["progress"], 0.0)
+
+        client.hincrby("PREWARM&" + job_id, "cached", 2)
+        client.hincrby("PREWARM&" + job_id, "paged_in", 4)
+        job = get_job(client, job_id)
+        self.assertEqual((job["total"], job["cached"], job["paged_in"]), (8, 2, 4))
+        self.assertEqual(job["progress"], 0.75)
+
+        self.assertIsNone(get_job(client, "0" * 32))
+
+    def test_executor_limit(self):
+        """Test jobs are refused while the executor is full"""
+        executor = PrewarmExecutor(1, 1)
+        release = threading.Event()
+        done = threading.Event()
+
+        def job():
+            release.wait()
+            done.set()
+
+        self.assertTrue(executor.submit(job))
+        self.assertFalse(executor.submit(job))
+        self.assertEqual(executor.get_stats(), {"pending": 1, "max_jobs": 1})
+
+        release.set()
+        done.wait(5)
+        executor._executor.shutdown(wait=True)
+        self.assertEqual(executor.get_stats()["pending"], 0)
@@ -0,0 +1,52 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+import numpy as np
+
+from bossspatialdb.projection import project_slabs, get_projection_shape
+
+
+class FakeCube(object):
+    def __init__(self, data):
+        self.data = data
+
+
+def get_slabs(volume, thickness):
+    return [(z, FakeCube(volume[:, z:z + thickness])) for z in range(0, volume.shape[1], thickness)]
+
+
+class TestProjection(APITestCase):
+
+    def test_shape(self):
+        """Test the shape of a projection along each axis"""
+        self.assertEqual(get_projection_shape((2, 40, 30, 20), "z"), (2, 1, 30, 20))
+        self.assertEqual(get_projection_shape((2, 40, 30, 20), "y"), (2, 40, 1, 20))
+        self.assertEqual(get_projection_shape((2, 40, 30, 20), "x"), (2, 40, 30, 1))
+
+    def test_project_slabs(self):
+        """Test that reducing slab by slab matches reducing the whole region"""
+        volume = np.random.randint(0, 2 ** 16 - 1, (2, 40, 30, 20)).astype(np.uint16)
+
+        for axis, dim in (("z", 1), ("y", 2), ("x", 3)):
+            for op in ("max", "min", "mean"):
+                data = project_slabs(get_slabs(volume, 16), volume.shape, np.uint16, axis, op)
+                if op == "mean":
+                    expected = np.rint(volume.mean(axis=dim, keepdims=True)).astype(np.uint16)
+                else:
+                    expected = getattr(volume, op)(axis=dim, keepdims=True)
+
+                self.assertEqual(data.dtype, np.uint16)
+                np.testing.assert_array_equal(data, expected)
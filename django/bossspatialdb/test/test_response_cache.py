@@ -0,0 +1,122 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+from mockredis import mock_strict_redis_client
+
+from bossspatialdb.response_cache import ResponseCache
+from bossspatialdb.versions import CuboidVersions, get_versions_ttl
+
+
+class TestResponseCache(APITestCase):
+
+    def test_hit(self):
+        """Test getting a response that was stored with the same versions"""
+        cache = ResponseCache(1000)
+        cache.put("a", (0, 1), b'x' * 100)
+        self.assertEqual(cache.get("a", (0, 1)), b'x' * 100)
+        self.assertEqual(cache.get_stats()["hits"], 1)
+
+    def test_version_change_invalidates(self):
+        """Test that a write to the region drops the entry"""
+        cache = ResponseCache(1000)
+        cache.put("a", (0, 1), b'x' * 100)
+        self.assertIsNone(cache.get("a", (0, 2)))
+        self.assertIsNone(cache.get("a", (0, 1)))
+        self.assertEqual(cache.get_stats()["invalidations"], 1)
+        self.assertEqual(cache.size, 0)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted to stay under budget"""
+        cache = ResponseCache(1000)
+        cache.put("a", (0,), b'a' * 200)
+        cache.put("b", (0,), b'b' * 200)
+        cache.put("c", (0,), b'c' * 200)
+        cache.put("d", (0,), b'd' * 200)
+
+        # Touch a so b is the oldest
+        self.assertIsNotNone(cache.get("a", (0,)))
+        cache.put("e", (0,), b'e' * 250)
+
+        self.assertIsNone(cache.get("b", (0,)))
+        self.assertIsNotNone(cache.get("a", (0,)))
+        self.assertIsNotNone(cache.get("e", (0,)))
+        self.assertLessEqual(cache.size, 1000)
+        self.assertEqual(cache.get_stats()["evictions"], 1)
+
+    def test_large_response_not_cached(self):
+        """Test that a response over a quarter of the budget is not stored"""
+        cache = ResponseCache(1000)
+        cache.put("a", (0,), b'a' * 251)
+        self.assertIsNone(cache.get("a", (0,)))
+        self.assertEqual(cache.size, 0)
+
+    def test_ttl(self):
+        """Test that an expired entry is not served"""
+        cache = ResponseCache(1000, ttl=-1)
+        cache.put("a", (0,), b'a' * 10)
+        self.assertIsNone(cache.get("a", (0,)))
+
+
+class TestCuboidVersions(APITestCase):
+
+    def setUp(self):
+        self.versions = CuboidVersions(mock_strict_redis_client())
+
+    def test_bump_overlapping(self):
+        """Test that a write changes the versions of overlapping regions only"""
+        before = self.versions.get("1&1&1", 0, (0, 0, 0), (512, 512, 16), [0, 1])
+        other_before = self.versions.get("1&1&1", 0, (1024, 0, 0), (512, 512, 16), [0, 1])
+
+        self.versions.bump("1&1&1", 0, (100, 100, 0), (10, 10, 10), [0, 1])
+
+        self.assertNotEqual(self.versions.get("1&1&1", 0, (0, 0, 0), (512, 512, 16), [0, 1]), before)
+        self.assertEqual(self.versions.get("1&1&1", 0, (1024, 0, 0), (512, 512, 16), [0, 1]), other_before)
+
+    def test_bump_other_time_sample(self):
+        """Test that a write to another time sample doesn't change the versions"""
+        before = self.versions.get("1&1&1", 0, (0, 0, 0), (512, 512, 16), [0, 1])
+        self.versions.bump("1&1&1", 0, (0, 0, 0), (512, 512, 16), [1, 2])
+        self.assertEqual(self.versions.get("1&1&1", 0, (0, 0, 0), (512, 512, 16), [0, 1]), before)
+
+    def test_bump_epoch(self):
+        """Test that a downsample changes the versions of every region in the channel"""
+        before = self.versions.get("1&1&1", 1, (0, 0, 0), (512, 512, 16), [0, 1])
+        self.versions.bump_epoch("1&1&1")
+        self.assertNotEqual(self.versions.get("1&1&1", 1, (0, 0, 0), (512, 512, 16), [0, 1]), before)
+
+    def test_counters_expire(self):
+        """Test that reading or bumping counters keeps them for the ttl only"""
+        client = mock_strict_redis_client()
+        versions = CuboidVersions(client, 300)
+        hash_key = CuboidVersions.get_hash_key("1&1&1", 0)
+
+        versions.bump("1&1&1", 0, (0, 0, 0), (512, 512, 16), [0, 1])
+        self.assertTrue(0 < client.ttl(hash_key) <= 300)
+
+        client.expire(hash_key, 10)
+        versions.get("1&1&1", 0, (0, 0, 0), (512, 512, 16), [0, 1])
+        self.assertGreater(client.ttl(hash_key), 10)
+
+    def test_versions_ttl(self):
+        """Test that counters are only kept while something derived from cuboid data is cached"""
+        with self.settings(CUTOUT_RESPONSE_CACHE_SIZE=0, CUTOUT_STATS_CACHE_TTL=0):
+            self.assertEqual(get_versions_ttl(), 0)
+        with self.settings(CUTOUT_RESPONSE_CACHE_SIZE=1048576, CUTOUT_RESPONSE_CACHE_TTL=300,
+                           CUTOUT_STATS_CACHE_TTL=0):
+            self.assertEqual(get_versions_ttl(), 300)
+        with self.settings(CUTOUT_RESPONSE_CACHE_SIZE=1048576, CUTOUT_RESPONSE_CACHE_TTL=300,
+                           CUTOUT_STATS_CACHE_TTL=600):
+            self.assertEqual(get_versions_ttl(), 600)
@@ -0,0 +1,85 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+import numpy as np
+
+from bossspatialdb.rle import encode_rle, decode_rle, RLE_HEADER
+
+
+class TestRle(APITestCase):
+
+    def test_round_trip_3d(self):
+        """Test encoding and decoding sparse annotation data"""
+        test_mat = np.zeros((1, 16, 64, 64), dtype=np.uint64)
+        test_mat[0, 2:5, 10:20, 10:40] = 12
+        test_mat[0, 8, :, :] = 2 ** 64 - 1
+        test_mat[0, -1, -1, -1] = 3
+
+        data = decode_rle(encode_rle(test_mat, 3))
+        self.assertEqual(data.shape, (16, 64, 64))
+        np.testing.assert_array_equal(data, test_mat[0])
+
+    def test_round_trip_4d(self):
+        """Test encoding and decoding dense annotation data with several time samples"""
+        test_mat = np.random.randint(0, 4, (3, 4, 32, 32)).astype(np.uint64)
+        np.testing.assert_array_equal(decode_rle(encode_rle(test_mat, 4)), test_mat)
+
+    def test_only_nonzero_runs(self):
+        """Test that zeros are not encoded"""
+        test_mat = np.zeros((1, 4, 32, 32), dtype=np.uint64)
+        self.assertEqual(len(encode_rle(test_mat, 3)), RLE_HEADER.size)
+
+        test_mat[0, 1, :, :] = 5
+        self.assertEqual(len(encode_rle(test_mat, 3)), RLE_HEADER.size + 3 * 8)
+
+    def test_invalid(self):
+        """Test that truncated, overlapping and oversized data is rejected"""
+        test_mat = np.zeros((1, 4, 32, 32), dtype=np.uint64)
+        test_mat[0, 1, 2, 3:9] = 7
+        test_mat[0, 2, 2, 3:9] = 8
+        buf = encode_rle(test_mat, 3)
+
+        with self.assertRaises(ValueError):
+            decode_rle(buf[:-1])
+
+        with self.assertRaises(ValueError):
+            decode_rle(buf, max_size=test_mat.size - 1)
+
+        # Make the first run long enough to overlap the second
+        runs = np.frombuffer(buf, dtype='<u8', offset=RLE_HEADER.size).reshape(3, 2).copy()
+        runs[1, 0] = 2000
+        with self.assertRaises(ValueError):
+            decode_rle(buf[:RLE_HEADER.size] + runs.tobytes())
+
+    def test_invalid_wrapping_run(self):
+        """Test that a run whose end wraps around the uint64 range is rejected"""
+        test_mat = np.zeros((1, 4, 32, 32), dtype=np.uint64)
+        test_mat[0, 1, 2, 3:9] = 7
+        test_mat[0, 2, 2, 3:9] = 8
+        buf = encode_rle(test_mat, 3)
+
+        # start + length of the last run wraps around to just past the start of the cutout
+        runs = np.frombuffer(buf, dtype='<u8', offset=RLE_HEADER.size).reshape(3, 2).copy()
+        runs[1, 1] = 2 ** 64 - int(runs[0, 1]) + 1
+        with self.assertRaises(ValueError):
+            decode_rle(buf[:RLE_HEADER.size] + runs.tobytes())
+
+        # A start outside of the cutout
+        runs = np.frombuffer(buf, dtype='<u8', offset=RLE_HEADER.size).reshape(3, 2).copy()
+        runs[0, 1] = test_mat.size
+        runs[1, 1] = 1
+        with self.assertRaises(ValueError):
+            decode_rle(buf[:RLE_HEADER.size] + runs.tobytes())
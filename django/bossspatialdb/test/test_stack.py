@@ -0,0 +1,99 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+import numpy as np
+
+from bosscore.error import BossError
+from bossspatialdb.stack import parse_channels, get_stack_dtype, iter_channel_cutouts, stack_cutouts
+from bossspatialdb.renderers import BloscStreamRenderer
+from bossspatialdb.framing import decode_channels
+
+
+class FakeCube(object):
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeCache(object):
+    """Stand-in for SpatialDB that serves each channel's cutouts from its own in-memory volume"""
+
+    def __init__(self, volumes):
+        self.volumes = volumes
+
+    def cutout(self, resource, corner, extent, resolution, time_range, filter_ids=None, iso=False):
+        return FakeCube(self.volumes[resource.name][time_range[0]:time_range[1],
+                                                    corner[2]:corner[2] + extent[2],
+                                                    corner[1]:corner[1] + extent[1],
+                                                    corner[0]:corner[0] + extent[0]].copy())
+
+
+class FakeResource(object):
+    def __init__(self, name, dtype):
+        self.name = name
+        self.dtype = dtype
+
+    def get_numpy_data_type(self):
+        return self.dtype
+
+
+class TestStack(APITestCase):
+
+    def setUp(self):
+        self.volumes = {"em": np.random.randint(1, 254, (2, 20, 40, 60)).astype(np.uint8),
+                        "membranes": np.random.randint(1, 254, (2, 20, 40, 60)).astype(np.uint8),
+                        "labels": np.random.randint(1, 2 ** 32, (2, 20, 40, 60)).astype(np.uint64)}
+        self.cache = FakeCache(self.volumes)
+
+    def test_parse_channels(self):
+        """Test splitting the channels of a stacked cutout request"""
+        self.assertEqual(parse_channels("em,membranes,labels", 8), ["em", "membranes", "labels"])
+        with self.assertRaises(BossError):
+            parse_channels("em,membranes,labels", 2)
+
+    def test_stack_dtype(self):
+        """Test that only channels of the same data type share a stack data type"""
+        self.assertEqual(get_stack_dtype([FakeResource("em", np.uint8), FakeResource("membranes", np.uint8)]),
+                         np.uint8)
+        self.assertIsNone(get_stack_dtype([FakeResource("em", np.uint8), FakeResource("labels", np.uint64)]))
+
+    def test_stack_cutouts(self):
+        """Test stacking the channels of a cutout fetched concurrently"""
+        resources = [FakeResource("membranes", np.uint8), FakeResource("em", np.uint8)]
+        cubes = iter_channel_cutouts(self.cache, resources, (10, 5, 2), (30, 20, 10), 0, [0, 2], workers=2)
+        data = stack_cutouts(cubes, 2, True).data
+        self.assertEqual(data.shape, (2, 2, 10, 20, 30))
+        np.testing.assert_array_equal(data[0], self.volumes["membranes"][:, 2:12, 5:25, 10:40])
+        np.testing.assert_array_equal(data[1], self.volumes["em"][:, 2:12, 5:25, 10:40])
+
+        cubes = iter_channel_cutouts(self.cache, resources, (10, 5, 2), (30, 20, 10), 0, [1, 2], workers=2)
+        data = stack_cutouts(cubes, 2, False).data
+        self.assertEqual(data.shape, (2, 10, 20, 30))
+        np.testing.assert_array_equal(data[1], self.volumes["em"][1, 2:12, 5:25, 10:40])
+
+    def test_stream_channels(self):
+        """Test encoding and decoding a framed stacked response of channels of different data types"""
+        resources = [FakeResource("em", np.uint8), FakeResource("labels", np.uint64)]
+        cubes = iter_channel_cutouts(self.cache, resources, (10, 5, 2), (30, 20, 10), 0, [0, 1], workers=2)
+        buf = b''.join(BloscStreamRenderer().stream_channels(cubes, False, 0, (10, 5, 2), 2, np.uint8))
+        channels = decode_channels(buf)
+
+        self.assertEqual(len(channels), 2)
+        self.assertEqual(channels[1].dtype, np.uint64)
+        np.testing.assert_array_equal(channels[0], self.volumes["em"][0, 2:12, 5:25, 10:40])
+        np.testing.assert_array_equal(channels[1], self.volumes["labels"][0, 2:12, 5:25, 10:40])
+
+        with self.assertRaises(ValueError):
+            decode_channels(buf[:-10])
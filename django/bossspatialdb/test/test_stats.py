@@ -0,0 +1,129 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+from mockredis import mock_strict_redis_client
+import numpy as np
+
+from bossspatialdb.stats import get_histogram, pack_histogram, unpack_histogram, get_region_histogram, \
+    summarize_histogram
+from bossspatialdb.versions import CuboidVersions
+
+
+class FakeCube(object):
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeKvio(object):
+    def __init__(self):
+        self.cache_client = mock_strict_redis_client()
+
+
+class FakeCache(object):
+    """Stand-in for SpatialDB that serves cutouts from an in-memory volume and counts the reads"""
+
+    def __init__(self, volume):
+        self.volume = volume
+        self.kvio = FakeKvio()
+        self.calls = 0
+        self.max_read = 0
+
+    def cutout(self, resource, corner, extent, resolution, time_range, filter_ids=None, iso=False):
+        self.calls += 1
+        self.max_read = max(self.max_read, (time_range[1] - time_range[0]) * extent[0] * extent[1] * extent[2] * 2)
+        return FakeCube(self.volume[time_range[0]:time_range[1],
+                                    corner[2]:corner[2] + extent[2],
+                                    corner[1]:corner[1] + extent[1],
+                                    corner[0]:corner[0] + extent[0]].copy())
+
+
+class FakeResource(object):
+    def get_bit_depth(self):
+        return 16
+
+    def get_lookup_key(self):
+        return "1&2&3"
+
+
+class TestStats(APITestCase):
+
+    def test_pack_histogram(self):
+        """Test encoding a cuboid histogram for the cache"""
+        hist = get_histogram(np.array([0, 5, 5, 65535], dtype=np.uint16), 16)
+        epoch, version, decoded = unpack_histogram(pack_histogram(hist, 3, 7), 2 ** 16)
+        self.assertEqual((epoch, version), (3, 7))
+        np.testing.assert_array_equal(decoded, hist)
+
+    def test_summarize(self):
+        """Test the statistics computed from a histogram"""
+        data = np.random.randint(100, 4000, (3, 50, 60)).astype(np.uint16)
+        stats = summarize_histogram(get_histogram(data, 16), bins=10, percentiles=(0, 50, 99.5, 100))
+
+        self.assertEqual(stats["count"], data.size)
+        self.assertEqual(stats["min"], data.min())
+        self.assertEqual(stats["max"], data.max())
+        self.assertAlmostEqual(stats["mean"], data.mean())
+        self.assertAlmostEqual(stats["std"], data.std())
+        self.assertEqual(stats["percentiles"]["0"], data.min())
+        self.assertEqual(stats["percentiles"]["100"], data.max())
+        self.assertEqual(stats["percentiles"]["50"], np.sort(data, axis=None)[int(np.ceil(data.size / 2)) - 1])
+        self.assertEqual(len(stats["histogram"]["counts"]), 10)
+        self.assertEqual(sum(stats["histogram"]["counts"]), data.size)
+
+    def test_summarize_empty(self):
+        """Test the statistics of a region with no data"""
+        stats = summarize_histogram(np.zeros(256, dtype=np.int64))
+        self.assertEqual(stats["count"], 0)
+        self.assertIsNone(stats["mean"])
+
+    def test_region_histogram_cached(self):
+        """Test that whole cuboid histograms are cached and invalidated by a write"""
+        volume = np.random.randint(0, 1000, (2, 48, 600, 1100)).astype(np.uint16)
+        cache = FakeCache(volume)
+        corner, extent, time_range = (300, 0, 0), (800, 512, 40), [0, 2]
+        expected = get_histogram(volume[0:2, 0:40, 0:512, 300:1100], 16)
+
+        hist, num_cached, num_computed = get_region_histogram(cache, FakeResource(), corner, extent, 0, time_range,
+                                                              ttl=60)
+        np.testing.assert_array_equal(hist, expected)
+        self.assertEqual((num_cached, num_computed), (0, 18))
+
+        # Cuboid (1, 0, 0) and (1, 0, 1) are fully inside the region, for both time samples
+        hist, num_cached, num_computed = get_region_histogram(cache, FakeResource(), corner, extent, 0, time_range,
+                                                              ttl=60)
+        np.testing.assert_array_equal(hist, expected)
+        self.assertEqual((num_cached, num_computed), (4, 14))
+
+        # Writing to a cuboid makes its cached histogram stale
+        volume[0, 0:16, 0:512, 512:1024] = 7
+        CuboidVersions(cache.kvio.cache_client).bump("1&2&3", 0, (512, 0, 0), (512, 512, 16), [0, 1])
+        hist, num_cached, num_computed = get_region_histogram(cache, FakeResource(), corner, extent, 0, time_range,
+                                                              ttl=60)
+        np.testing.assert_array_equal(hist, get_histogram(volume[0:2, 0:40, 0:512, 300:1100], 16))
+        self.assertEqual((num_cached, num_computed), (3, 15))
+
+    def test_region_histogram_bounded_reads(self):
+        """Test that long time ranges are read a bounded number of time samples at a time"""
+        volume = np.random.randint(0, 1000, (5, 16, 512, 600)).astype(np.uint16)
+        cache = FakeCache(volume)
+        corner, extent, time_range = (0, 0, 0), (600, 512, 16), [0, 5]
+        cuboid_bytes = 512 * 512 * 16 * 2
+
+        hist, _, num_computed = get_region_histogram(cache, FakeResource(), corner, extent, 0, time_range,
+                                                     target_size=2 * cuboid_bytes)
+        np.testing.assert_array_equal(hist, get_histogram(volume, 16))
+        self.assertEqual(num_computed, 10)
+        self.assertLessEqual(cache.max_read, 2 * cuboid_bytes)
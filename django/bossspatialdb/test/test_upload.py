@@ -0,0 +1,73 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+from mockredis import mock_strict_redis_client
+
+from bossspatialdb.upload import create_session, get_session, is_part_aligned, record_part, set_status, \
+    delete_session
+
+
+class TestUpload(APITestCase):
+
+    def setUp(self):
+        self.client = mock_strict_redis_client()
+        self.args = {"collection": "col1", "experiment": "exp1", "channel": "channel1", "resolution": "0",
+                     "t_range": None}
+
+    def test_session(self):
+        """Test a session is recorded and read back"""
+        upload_id = create_session(self.client, "testuser", self.args, (300, 0, 10), (600, 64, 10), [0, 1], 4, 60)
+
+        session = get_session(self.client, upload_id)
+        self.assertEqual(session["status"], "open")
+        self.assertEqual(session["user"], "testuser")
+        self.assertEqual(session["args"], self.args)
+        self.assertEqual(session["corner"], [300, 0, 10])
+        self.assertEqual(session["extent"], [600, 64, 10])
+        self.assertEqual(session["time_range"], [0, 1])
+        self.assertFalse(session["iso"])
+        self.assertEqual((session["total"], session["received"], session["progress"]), (4, 0, 0.0))
+
+        set_status(self.client, upload_id, "committed")
+        self.assertEqual(get_session(self.client, upload_id)["status"], "committed")
+
+        delete_session(self.client, upload_id)
+        self.assertIsNone(get_session(self.client, upload_id))
+
+    def test_record_part(self):
+        """Test retried parts are only counted once"""
+        upload_id = create_session(self.client, "testuser", self.args, (0, 0, 0), (1024, 512, 32), [0, 1], 4, 60)
+
+        self.assertEqual(record_part(self.client, upload_id, [(0, 0, 0), (1, 0, 0)], 60), 2)
+        self.assertEqual(record_part(self.client, upload_id, [(1, 0, 0), (1, 0, 1)], 60), 1)
+        self.assertEqual(record_part(self.client, upload_id, [(0, 0, 0)], 60), 0)
+
+        session = get_session(self.client, upload_id)
+        self.assertEqual(session["received"], 3)
+        self.assertEqual(session["progress"], 0.75)
+
+    def test_is_part_aligned(self):
+        """Test parts have to start and stop on cuboid boundaries or the edges of the region"""
+        session = {"corner": [300, 0, 10], "extent": [600, 64, 10]}
+
+        self.assertTrue(is_part_aligned(session, (300, 0, 10), (212, 64, 6), 0))
+        self.assertTrue(is_part_aligned(session, (512, 0, 16), (388, 64, 4), 0))
+        self.assertTrue(is_part_aligned(session, (300, 0, 10), (600, 64, 10), 0))
+
+        self.assertFalse(is_part_aligned(session, (300, 0, 10), (300, 64, 10), 0))
+        self.assertFalse(is_part_aligned(session, (400, 0, 10), (112, 64, 10), 0))
+        self.assertFalse(is_part_aligned(session, (512, 0, 16), (512, 64, 4), 0))
+        self.assertFalse(is_part_aligned(session, (0, 0, 0), (512, 64, 16), 0))
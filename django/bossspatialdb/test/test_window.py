@@ -0,0 +1,57 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from rest_framework.test import APITestCase
+
+import numpy as np
+
+from bosscore.error import BossError
+from bossspatialdb.window import Window, parse_window
+
+
+class TestWindow(APITestCase):
+
+    def test_window_uint16_to_uint8(self):
+        """Test windowing uint16 data into uint8"""
+        window = Window(np.uint16, 1000, 2020, out_dtype=np.uint8)
+        data = np.array([[0, 999, 1000, 1510, 2020, 65535]], dtype=np.uint16)
+
+        windowed = window.apply(data)
+        self.assertEqual(windowed.dtype, np.uint8)
+        self.assertEqual(windowed.shape, data.shape)
+        np.testing.assert_array_equal(windowed, [[0, 0, 0, 128, 255, 255]])
+        self.assertEqual(window.bit_depth, 8)
+
+    def test_window_gamma(self):
+        """Test applying a gamma curve"""
+        window = Window(np.uint8, 0, 255, gamma=2.0)
+        np.testing.assert_array_equal(window.apply(np.array([0, 51, 255], dtype=np.uint8)), [0, 10, 255])
+
+    def test_parse_window(self):
+        """Test building a window from query parameters"""
+        self.assertIsNone(parse_window({}, np.uint16))
+
+        window = parse_window({"window": "100:3000", "dtype": "uint8"}, np.uint16)
+        self.assertEqual(window.get_key(), (100, 3000, 1.0, '|u1'))
+
+        window = parse_window({"gamma": "0.5"}, np.uint8)
+        self.assertEqual(window.get_key(), (0, 255, 0.5, '|u1'))
+
+    def test_parse_window_invalid(self):
+        """Test that invalid windows are rejected"""
+        for params, dtype in [({"window": "3000:100"}, np.uint16), ({"window": "0:256"}, np.uint8),
+                              ({"window": "a:b"}, np.uint16), ({"gamma": "0"}, np.uint16),
+                              ({"dtype": "float32"}, np.uint16), ({"window": "0:10"}, np.uint64)]:
+            with self.assertRaises(BossError):
+                parse_window(params, dtype)
@@ -0,0 +1,249 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from rest_framework.test import APITestCase
+
+from unittest.mock import patch, MagicMock
+from mockredis import mock_strict_redis_client
+
+import numpy as np
+
+from bossspatialdb.writebehind import regions_overlap, get_overlapping_writes, wait_for_pending_writes, \
+    wait_to_read, get_pending_key, WriteBehindQueue, register_write_behind_start, start_write_behind
+
+
+class FakeResource(object):
+    def __init__(self, data=None):
+        self.data = data or {"lookup_key": "1&2&3"}
+
+    def get_lookup_key(self):
+        return self.data["lookup_key"]
+
+    def to_dict(self):
+        return self.data
+
+
+class FakeKvio(object):
+    def __init__(self, client):
+        self.cache_client = client
+
+
+class FakeCache(object):
+    """Stand-in for SpatialDB that records the writes applied"""
+
+    def __init__(self, client):
+        self.kvio = FakeKvio(client)
+        self.writes = []
+        self.written = threading.Event()
+
+    def write_cuboid(self, resource, corner, resolution, data, time_sample_start, iso=False):
+        self.writes.append((tuple(corner), resolution, data.copy(), time_sample_start, iso))
+        self.written.set()
+
+
+def get_region(corner, extent, time_range):
+    return {"corner": corner, "extent": extent, "time_range": time_range}
+
+
+@patch('bossspatialdb.writebehind.BossResourceBasic', FakeResource)
+@patch('bossspatialdb.writebehind.mark_written', lambda *args: None)
+@patch('bossspatialdb.writebehind.connection')
+class TestWriteBehind(APITestCase):
+
+    def setUp(self):
+        self.client = mock_strict_redis_client()
+        self.cache = FakeCache(self.client)
+        self.spool_root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_root, ignore_errors=True)
+
+    def get_queue(self, name, wait_timeout=1, max_attempts=1):
+        return WriteBehindQueue(os.path.join(self.spool_root, name), 1, 2, 60, wait_timeout, max_attempts)
+
+    def hold_back_earlier_write(self):
+        """Record a pending write from another worker that was accepted before any write of the test"""
+        self.client.hset(get_pending_key("1&2&3", 0), "earlier",
+                         '{"seq": 0, "corner": [0, 0, 0], "extent": [512, 512, 16], "time_range": [0, 1], '
+                         '"created": %f}' % time.time())
+
+    def test_regions_overlap(self, mock_connection):
+        """Test regions overlap only if they share voxels and time samples"""
+        region = get_region([0, 0, 0], [512, 512, 16], [0, 1])
+        self.assertTrue(regions_overlap(region, get_region([511, 0, 15], [10, 10, 10], [0, 5])))
+        self.assertFalse(regions_overlap(region, get_region([512, 0, 0], [10, 10, 10], [0, 1])))
+        self.assertFalse(regions_overlap(region, get_region([0, 0, 0], [10, 10, 10], [1, 2])))
+
+    def test_get_overlapping_writes(self, mock_connection):
+        """Test pending writes are filtered by region, sequence number and age"""
+        key = get_pending_key("1&2&3", 0)
+        self.client.hset(key, "a", '{"seq": 1, "corner": [0, 0, 0], "extent": [10, 10, 10], "time_range": [0, 1], '
+                                   '"created": 1e10}')
+        self.client.hset(key, "b", '{"seq": 2, "corner": [100, 0, 0], "extent": [10, 10, 10], "time_range": [0, 1], '
+                                   '"created": 1e10}')
+        self.client.hset(key, "c", '{"seq": 3, "corner": [0, 0, 0], "extent": [10, 10, 10], "time_range": [0, 1], '
+                                   '"created": 0}')
+
+        region = get_region([5, 5, 5], [10, 10, 10], [0, 1])
+        self.assertEqual(sorted(get_overlapping_writes(self.client, "1&2&3", 0, region)), ["a", "c"])
+        self.assertEqual(get_overlapping_writes(self.client, "1&2&3", 0, region, max_age=60), ["a"])
+        self.assertEqual(get_overlapping_writes(self.client, "1&2&3", 0, region, before_seq=1), [])
+        self.assertFalse(wait_for_pending_writes(self.client, "1&2&3", 0, region, 0.1, max_age=60))
+        self.assertTrue(wait_for_pending_writes(self.client, "1&2&3", 1, region, 0.1, max_age=60))
+
+    def test_wait_to_read(self, mock_connection):
+        """Test reads wait for pending writes only when asynchronous writes are enabled"""
+        self.hold_back_earlier_write()
+        with patch('bossspatialdb.writebehind.get_spatialdb', lambda: self.cache):
+            with self.settings(CUTOUT_WRITE_BEHIND_ENABLED=False):
+                self.assertTrue(wait_to_read("1&2&3", 0, (0, 0, 0), (10, 10, 10), [0, 1]))
+            with self.settings(CUTOUT_WRITE_BEHIND_ENABLED=True, CUTOUT_WRITE_BEHIND_WAIT_TIMEOUT=0.1):
+                self.assertFalse(wait_to_read("1&2&3", 0, (0, 0, 0), (10, 10, 10), [0, 1]))
+                self.assertTrue(wait_to_read("1&2&3", 0, (512, 0, 0), (10, 10, 10), [0, 1]))
+
+    def test_submit(self, mock_connection):
+        """Test a write is saved, applied and reported"""
+        queue = self.get_queue(str(os.getpid()))
+        data = np.random.randint(1, 254, (1, 16, 32, 64)).astype(np.uint8)
+
+        with patch('bossspatialdb.writebehind.get_spatialdb', lambda: self.cache):
+            ticket = queue.submit(self.client, "testuser", FakeResource(), 0, (64, 32, 16), data, 2)
+            self.assertIn(ticket["status"], ("queued", "running", "done"))
+            self.assertEqual(ticket["extent"], [64, 32, 16])
+            self.assertEqual(ticket["time_range"], [2, 3])
+
+            self.assertTrue(self.cache.written.wait(5))
+            queue._executor.shutdown(wait=True)
+
+        corner, resolution, written, time_start, iso = self.cache.writes[0]
+        self.assertEqual((corner, resolution, time_start, iso), ((64, 32, 16), 0, 2, False))
+        np.testing.assert_array_equal(written, data)
+        self.assertEqual(self.client.hget("WRITE&" + ticket["ticket_id"], "status"), b"done")
+        self.assertEqual(self.client.hgetall(get_pending_key("1&2&3", 0)), {})
+        self.assertEqual(os.listdir(queue.spool_dir), [])
+        self.assertEqual(queue.get_stats()["applied"], 1)
+
+    def test_submit_waits_for_earlier_writes(self, mock_connection):
+        """Test a write is failed, but kept, without being applied while an earlier, overlapping write is pending"""
+        self.hold_back_earlier_write()
+        queue = self.get_queue(str(os.getpid()), wait_timeout=0.1, max_attempts=2)
+        data = np.random.randint(1, 254, (1, 16, 32, 64)).astype(np.uint8)
+
+        with patch('bossspatialdb.writebehind.get_spatialdb', lambda: self.cache):
+            ticket = queue.submit(self.client, "testuser", FakeResource(), 0, (64, 32, 0), data, 0)
+            queue._executor.shutdown(wait=True)
+
+        self.assertEqual(self.cache.writes, [])
+        self.assertEqual(self.client.hget("WRITE&" + ticket["ticket_id"], "status"), b"failed")
+        self.assertEqual(list(self.client.hgetall(get_pending_key("1&2&3", 0))), [b"earlier"])
+        self.assertEqual(sorted(os.listdir(queue.spool_dir)),
+                         [ticket["ticket_id"] + ".json", ticket["ticket_id"] + ".npy"])
+        self.assertEqual(queue.get_stats()["failed"], 1)
+
+    def test_submit_retries_after_earlier_writes(self, mock_connection):
+        """Test a write is kept and applied once the earlier, overlapping write is done"""
+        self.hold_back_earlier_write()
+        queue = self.get_queue(str(os.getpid()), wait_timeout=0.05, max_attempts=100)
+        data = np.random.randint(1, 254, (1, 16, 32, 64)).astype(np.uint8)
+
+        with patch('bossspatialdb.writebehind.get_spatialdb', lambda: self.cache):
+            ticket = queue.submit(self.client, "testuser", FakeResource(), 0, (64, 32, 0), data, 0)
+            time.sleep(0.3)
+            self.assertEqual(self.cache.writes, [])
+            self.assertEqual(len(os.listdir(queue.spool_dir)), 2)
+
+            self.client.hdel(get_pending_key("1&2&3", 0), "earlier")
+            self.assertTrue(self.cache.written.wait(5))
+            queue._executor.shutdown(wait=True)
+
+        np.testing.assert_array_equal(self.cache.writes[0][2], data)
+        self.assertEqual(self.client.hget("WRITE&" + ticket["ticket_id"], "status"), b"done")
+
+    @patch('bossspatialdb.writebehind.RETRY_BACKOFF', 0)
+    def test_submit_retries_errors(self, mock_connection):
+        """Test a write that raises an error is retried and kept once it runs out of attempts"""
+        data = np.random.randint(1, 254, (1, 16, 32, 64)).astype(np.uint8)
+        self.cache.write_cuboid = MagicMock(side_effect=[IOError("throttled"), None])
+        queue = self.get_queue(str(os.getpid()), max_attempts=2)
+        with patch('bossspatialdb.writebehind.get_spatialdb', lambda: self.cache):
+            ticket = queue.submit(self.client, "testuser", FakeResource(), 0, (0, 0, 0), data, 0)
+            queue._executor.shutdown(wait=True)
+
+        self.assertEqual(self.cache.write_cuboid.call_count, 2)
+        self.assertEqual(self.client.hget("WRITE&" + ticket["ticket_id"], "status"), b"done")
+        self.assertEqual(os.listdir(queue.spool_dir), [])
+
+        self.cache.write_cuboid = MagicMock(side_effect=IOError("throttled"))
+        queue = self.get_queue(str(os.getpid()), max_attempts=2)
+        with patch('bossspatialdb.writebehind.get_spatialdb', lambda: self.cache):
+            ticket = queue.submit(self.client, "testuser", FakeResource(), 0, (0, 0, 0), data, 0)
+            queue._executor.shutdown(wait=True)
+
+        self.assertEqual(self.cache.write_cuboid.call_count, 2)
+        self.assertEqual(self.client.hget("WRITE&" + ticket["ticket_id"], "status"), b"failed")
+        self.assertEqual(self.client.hgetall(get_pending_key("1&2&3", 0)), {})
+        self.assertEqual(sorted(os.listdir(queue.spool_dir)),
+                         [ticket["ticket_id"] + ".json", ticket["ticket_id"] + ".npy"])
+        self.assertEqual(queue.get_stats()["failed"], 1)
+
+    def test_submit_full(self, mock_connection):
+        """Test writes are refused while the queue is full"""
+        queue = self.get_queue(str(os.getpid()))
+        queue._pending = queue.max_pending
+        data = np.zeros((1, 16, 32, 64), dtype=np.uint8)
+        self.assertIsNone(queue.submit(self.client, "testuser", FakeResource(), 0, (0, 0, 0), data, 0))
+
+    def test_recover(self, mock_connection):
+        """Test the saved writes of an exited worker are adopted and applied"""
+        dead = self.get_queue("999999999")
+        data = np.random.randint(1, 254, (1, 16, 32, 64)).astype(np.uint8)
+        with patch.object(dead, '_enqueue'):
+            dead.submit(self.client, "testuser", FakeResource(), 0, (0, 0, 0), data, 0)
+
+        queue = self.get_queue(str(os.getpid()))
+        with patch('bossspatialdb.writebehind.get_spatialdb', lambda: self.cache):
+            self.assertEqual(queue.recover(self.spool_root), 1)
+            self.assertTrue(self.cache.written.wait(5))
+            queue._executor.shutdown(wait=True)
+
+        np.testing.assert_array_equal(self.cache.writes[0][2], data)
+        self.assertEqual(os.listdir(self.spool_root), [str(os.getpid())])
+
+    def test_start_on_fork(self, mock_connection):
+        """Test the queue, and the recovery of exited workers' writes, is started when a uwsgi worker starts"""
+        mock_uwsgi = MagicMock()
+        mock_uwsgi.worker_id.return_value = 0
+        mock_postfork = MagicMock()
+        with patch('bossspatialdb.writebehind.uwsgi', mock_uwsgi), \
+                patch('bossspatialdb.writebehind.postfork', mock_postfork):
+            register_write_behind_start()
+        mock_postfork.assert_called_once_with(start_write_behind)
+
+        mock_uwsgi.worker_id.return_value = 3
+        with patch('bossspatialdb.writebehind.uwsgi', mock_uwsgi), \
+                patch('bossspatialdb.writebehind.get_write_behind_queue') as mock_get_queue:
+            with self.settings(CUTOUT_WRITE_BEHIND_ENABLED=True):
+                register_write_behind_start()
+            mock_get_queue.assert_called_once_with()
+
+            mock_get_queue.reset_mock()
+            with self.settings(CUTOUT_WRITE_BEHIND_ENABLED=False):
+                register_write_behind_start()
+            mock_get_queue.assert_not_called()
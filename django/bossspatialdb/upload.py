@@ -0,0 +1,196 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Resumable upload sessions for large cutout writes
+#
+# A session covers a region of a channel that is written as parts: cuboid aligned sub-regions, uploaded in any order
+# and in parallel, each in any of the cutout POST formats. Every part is written to the cache as it arrives and the
+# cuboids it covers are added to a redis set, so a retried part is simply written again and only counted once. The
+# session can be committed once every cuboid of the region has been received.
+
+import json
+import time
+import uuid
+
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
+
+UPLOAD_PREFIX = "UPLOAD"
+
+# Fields of a session that are stored as JSON
+SESSION_JSON_FIELDS = ("args", "corner", "extent", "time_range")
+
+
+def get_session_key(upload_id):
+    """Method to get the redis key of a session
+
+    Args:
+        upload_id (str): Session id
+
+    Returns:
+        (str): Redis key
+    """
+    return "{}&{}".format(UPLOAD_PREFIX, upload_id)
+
+
+def get_parts_key(upload_id):
+    """Method to get the redis key of the set of cuboids a session has received
+
+    Args:
+        upload_id (str): Session id
+
+    Returns:
+        (str): Redis key
+    """
+    return "{}&{}&PARTS".format(UPLOAD_PREFIX, upload_id)
+
+
+def create_session(client, username, args, corner, extent, time_range, total, ttl, iso=False):
+    """Method to record a new session
+
+    Args:
+        client (redis.StrictRedis): Redis client sessions are kept in
+        username (str): User that opened the session
+        args (dict): Collection, experiment, channel, resolution and t_range of the session, as in a cutout URL
+        corner ((int, int, int)): (x, y, z) start of the region
+        extent ((int, int, int)): (x, y, z) span of the region
+        time_range ([int, int]): Start and stop time samples every part covers
+        total (int): Number of cuboids covering the region
+        ttl (int): Number of seconds the session is kept
+        iso (bool): Flag indicating if the parts are written to the isotropic data
+
+    Returns:
+        (str): Session id
+    """
+    upload_id = uuid.uuid4().hex
+    key = get_session_key(upload_id)
+    pipe = client.pipeline()
+    pipe.hmset(key, {"status": "open", "user": username, "args": json.dumps(args), "corner": json.dumps(list(corner)),
+                     "extent": json.dumps(list(extent)), "time_range": json.dumps(list(time_range)),
+                     "iso": int(iso), "total": total, "created": time.time()})
+    pipe.expire(key, ttl)
+    pipe.execute()
+    return upload_id
+
+
+def get_session(client, upload_id):
+    """Method to get a session
+
+    Args:
+        client (redis.StrictRedis): Redis client sessions are kept in
+        upload_id (str): Session id
+
+    Returns:
+        (dict|None): status, user, region, cuboid counts and fraction received of the session, or None if it doesn't
+        exist
+    """
+    pipe = client.pipeline()
+    pipe.hgetall(get_session_key(upload_id))
+    pipe.scard(get_parts_key(upload_id))
+    fields, received = pipe.execute()
+    if not fields:
+        return None
+
+    session = {k.decode() if isinstance(k, bytes) else k: v.decode() if isinstance(v, bytes) else v
+               for k, v in fields.items()}
+    for name in SESSION_JSON_FIELDS:
+        session[name] = json.loads(session[name])
+    session["iso"] = bool(int(session["iso"]))
+    session["total"] = int(session["total"])
+    session["created"] = float(session["created"])
+    session["received"] = int(received)
+    session["progress"] = session["received"] / session["total"] if session["total"] else 1.0
+    session["upload_id"] = upload_id
+    return session
+
+
+def is_part_aligned(session, corner, extent, resolution):
+    """Method to check if a part is inside its session's region and starts and stops on cuboid boundaries
+
+    A part may also start or stop at the edge of the region, so regions that are not cuboid aligned can be uploaded.
+
+    Args:
+        session (dict): The session, as returned by get_session()
+        corner ((int, int, int)): (x, y, z) start of the part
+        extent ((int, int, int)): (x, y, z) span of the part
+        resolution (int): Resolution level
+
+    Returns:
+        (bool): True if the part is valid
+    """
+    cuboid_size = CUBOIDSIZE[resolution]
+    for d in range(3):
+        start = corner[d]
+        stop = corner[d] + extent[d]
+        region_start = session["corner"][d]
+        region_stop = session["corner"][d] + session["extent"][d]
+
+        if start < region_start or stop > region_stop:
+            return False
+        if start != region_start and start % cuboid_size[d] != 0:
+            return False
+        if stop != region_stop and stop % cuboid_size[d] != 0:
+            return False
+    return True
+
+
+def record_part(client, upload_id, indices, ttl):
+    """Method to record the cuboids a part covered
+
+    Args:
+        client (redis.StrictRedis): Redis client sessions are kept in
+        upload_id (str): Session id
+        indices (iterable((int, int, int))): (x, y, z) indices of the part's cuboids
+        ttl (int): Number of seconds the session is kept from now
+
+    Returns:
+        (int): Number of cuboids that had not been received before
+    """
+    key = get_parts_key(upload_id)
+    members = ["{}&{}&{}".format(*index) for index in indices]
+    if not members:
+        return 0
+
+    pipe = client.pipeline()
+    pipe.sadd(key, *members)
+    pipe.expire(key, ttl)
+    pipe.expire(get_session_key(upload_id), ttl)
+    added, _, _ = pipe.execute()
+    return added
+
+
+def set_status(client, upload_id, status):
+    """Method to change the status of a session
+
+    Args:
+        client (redis.StrictRedis): Redis client sessions are kept in
+        upload_id (str): Session id
+        status (str): New status
+
+    Returns:
+        None
+    """
+    client.hset(get_session_key(upload_id), "status", status)
+
+
+def delete_session(client, upload_id):
+    """Method to delete a session and its record of received cuboids
+
+    Args:
+        client (redis.StrictRedis): Redis client sessions are kept in
+        upload_id (str): Session id
+
+    Returns:
+        None
+    """
+    client.delete(get_session_key(upload_id), get_parts_key(upload_id))
@@ -0,0 +1,158 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Per-channel, per-cuboid write counters
+#
+# Every write through the cutout service bumps the counter of each cuboid it touches, and starting or finishing a
+# downsample bumps a per-channel epoch. Anything derived from cuboid data (cached responses, cached statistics) records
+# the counters it was built from and is only reused while they are unchanged. The counters live in redis so a write in
+# one worker invalidates derived data in every worker.
+#
+# Counters are only kept while something derived from cuboid data is cached. Every read and bump of a channel's
+# counters extends their expiry by the longest time derived data is cached, so they can only expire (and restart from
+# 0) once everything built from them has expired too.
+
+from django.conf import settings
+
+from .cuboids import iter_cuboid_indices
+
+VERSION_PREFIX = "CUBOID-VERSION"
+
+
+def get_versions_ttl():
+    """Method to get the number of seconds cuboid write counters have to be kept
+
+    Returns:
+        (int): The longest time derived data is cached, or 0 if nothing derived from cuboid data is cached
+    """
+    ttls = []
+    if settings.CUTOUT_RESPONSE_CACHE_SIZE:
+        ttls.append(settings.CUTOUT_RESPONSE_CACHE_TTL)
+    if settings.CUTOUT_STATS_CACHE_TTL:
+        ttls.append(settings.CUTOUT_STATS_CACHE_TTL)
+    return max(ttls, default=0)
+
+
+class CuboidVersions(object):
+    """Read and bump cuboid write counters"""
+
+    def __init__(self, client, ttl=None):
+        """
+        Args:
+            client (redis.StrictRedis): Redis client holding the counters
+            ttl (int): Number of seconds the counters are kept after they were last read or bumped, or None to keep
+                them forever
+        """
+        self.client = client
+        self.ttl = ttl
+
+    @staticmethod
+    def get_hash_key(lookup_key, resolution):
+        """Method to get the redis hash holding a channel's counters at one resolution
+
+        Isotropic and anisotropic data share counters. Below the isotropic fork they are the same data, and
+        invalidating a little more than needed is harmless.
+
+        Args:
+            lookup_key (str): Channel lookup key
+            resolution (int): Resolution level
+
+        Returns:
+            (str): Redis key
+        """
+        return "{}&{}&{}".format(VERSION_PREFIX, lookup_key, resolution)
+
+    @staticmethod
+    def get_epoch_key(lookup_key):
+        """Method to get the redis key holding a channel's downsample epoch
+
+        Args:
+            lookup_key (str): Channel lookup key
+
+        Returns:
+            (str): Redis key
+        """
+        return "{}&{}&EPOCH".format(VERSION_PREFIX, lookup_key)
+
+    @staticmethod
+    def get_fields(corner, extent, resolution, time_range):
+        """Method to get the hash fields of every cuboid in a region
+
+        Args:
+            corner ((int, int, int)): (x, y, z) start of the region
+            extent ((int, int, int)): (x, y, z) span of the region
+            resolution (int): Resolution level
+            time_range ([int, int]): Start and stop time samples
+
+        Returns:
+            (list(str)): Hash fields
+        """
+        indices = list(iter_cuboid_indices(corner, extent, resolution))
+        return ["{}&{}&{}&{}".format(t, x, y, z) for t in range(time_range[0], time_range[1])
+                for x, y, z in indices]
+
+    def get(self, lookup_key, resolution, corner, extent, time_range):
+        """Method to get the counters of a region in one round trip
+
+        Args:
+            lookup_key (str): Channel lookup key
+            resolution (int): Resolution level
+            corner ((int, int, int)): (x, y, z) start of the region
+            extent ((int, int, int)): (x, y, z) span of the region
+            time_range ([int, int]): Start and stop time samples
+
+        Returns:
+            (tuple(int)): The channel's downsample epoch followed by each cuboid's counter
+        """
+        fields = self.get_fields(corner, extent, resolution, time_range)
+        hash_key = self.get_hash_key(lookup_key, resolution)
+        pipe = self.client.pipeline()
+        pipe.get(self.get_epoch_key(lookup_key))
+        pipe.hmget(hash_key, fields)
+        if self.ttl:
+            pipe.expire(hash_key, self.ttl)
+        epoch, versions = pipe.execute()[:2]
+        return tuple(int(v) if v is not None else 0 for v in [epoch] + list(versions))
+
+    def bump(self, lookup_key, resolution, corner, extent, time_range):
+        """Method to record a write to a region
+
+        Args:
+            lookup_key (str): Channel lookup key
+            resolution (int): Resolution level
+            corner ((int, int, int)): (x, y, z) start of the region
+            extent ((int, int, int)): (x, y, z) span of the region
+            time_range ([int, int]): Start and stop time samples
+
+        Returns:
+            None
+        """
+        hash_key = self.get_hash_key(lookup_key, resolution)
+        pipe = self.client.pipeline()
+        for field in self.get_fields(corner, extent, resolution, time_range):
+            pipe.hincrby(hash_key, field, 1)
+        if self.ttl:
+            pipe.expire(hash_key, self.ttl)
+        pipe.execute()
+
+    def bump_epoch(self, lookup_key):
+        """Method to record that a channel's downsampled resolutions changed
+
+        Args:
+            lookup_key (str): Channel lookup key
+
+        Returns:
+            None
+        """
+        self.client.incr(self.get_epoch_key(lookup_key))
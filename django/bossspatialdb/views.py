@@ -11,43 +11,109 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import json
+
 import numpy as np
+from PIL import Image
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import authentication, permissions
 from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
-
-from .parsers import BloscParser, BloscPythonParser, NpygzParser, is_too_large
-from .renderers import BloscRenderer, BloscPythonRenderer, NpygzRenderer, JpegRenderer
-
-from django.http import HttpResponse
+from rest_framework.parsers import JSONParser
+
+from .parsers import BloscParser, BloscPythonParser, NpygzParser, RleParser, CODEC_PARSERS, is_too_large, \
+    get_cutout_size, ConsumeReqMixin
+from .renderers import BloscRenderer, BloscPythonRenderer, BloscStreamRenderer, BloscCuboidsRenderer, NpygzRenderer, \
+    CodecRenderer, CODEC_RENDERERS, RleRenderer, JpegRenderer
+from .fetch import iter_z_slabs, iter_time_slabs, get_time_blocks, SLAB_TARGET_SIZE
+from .pool import get_spatialdb, get_pool_stats
+from .coalesce import coalesced_cutout, get_cutout_key, cutout_flight
+from .response_cache import get_response_cache
+from .versions import CuboidVersions, get_versions_ttl
+from .batch import parse_regions, get_union, get_batch_peak_size, iter_batch_regions
+from .cuboids import is_cuboid_aligned, iter_cuboid_indices
+from .passthrough import iter_cuboid_blocks, iter_slab_blocks, passthrough_stats
+from .admission import admit, AdmissionRejected, AdmissionMixin, get_admission_controller
+from .stats import get_region_histogram, summarize_histogram, DEFAULT_PERCENTILES
+from .projection import Projection, project_slabs, get_projection_shape, PROJECTION_AXES
+from .window import parse_window, window_slabs
+from .estimate import estimate_cutout
+from .prewarm import create_job, get_job, get_job_key, run_job, get_prewarm_executor
+from .upload import create_session, get_session, is_part_aligned, record_part, set_status, delete_session
+from .writebehind import get_write_behind_queue, wait_for_pending_writes, wait_to_read, get_ticket, mark_written
+from .stack import parse_channels, get_stack_dtype, iter_channel_cutouts, stack_cutouts
+
+from bosstiles.renderers import PNGRenderer, JPEGRenderer
+
+from django.http import HttpResponse, StreamingHttpResponse
 from django.conf import settings
 
 from bosscore.request import BossRequest
+from bosscore.timing import TimingMixin, get_timer, timing_histograms
 from bosscore.error import BossError, BossHTTPError, BossParserError, ErrorCodes
 from bosscore.models import Channel
 
-from spdb.spatialdb.spatialdb import SpatialDB, CUBOIDSIZE
+from spdb.spatialdb.spatialdb import CUBOIDSIZE
 from spdb import project
 import bossutils
 
 
-class Cutout(APIView):
+# Renderers whose output depends only on the cutout data and can be served from the response cache
+CACHEABLE_RENDERERS = (BloscRenderer, BloscPythonRenderer, NpygzRenderer, CodecRenderer, RleRenderer)
+
+
+def check_posted_data(req, resource, data):
+    """Method to check POSTed data matches the channel's data type and the region in the URL
+
+    Args:
+        req (bosscore.request.BossRequest): The validated request
+        resource (spdb.project.BossResource): Resource for the channel
+        data (np.ndarray): The parsed 3D or 4D data
+
+    Returns:
+        (BossHTTPError|None): The error to return, or None if the data is valid
+    """
+    # Get bit depth
+    try:
+        expected_data_type = resource.get_numpy_data_type()
+    except ValueError:
+        return BossHTTPError("Unsupported data type: {}".format(resource.get_data_type()), ErrorCodes.TYPE_ERROR)
+
+    # Make sure datatype is valid
+    if expected_data_type != data.dtype:
+        return BossHTTPError("Datatype does not match channel", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+    # Make sure the dimensions of the data match the dimensions of the post URL
+    if len(data.shape) == 4:
+        expected_shape = (len(req.get_time()), req.get_z_span(), req.get_y_span(), req.get_x_span())
+    else:
+        expected_shape = (req.get_z_span(), req.get_y_span(), req.get_x_span())
+
+    if expected_shape != data.shape:
+        return BossHTTPError("Data dimensions in URL do not match POSTed data.",
+                             ErrorCodes.DATA_DIMENSION_MISMATCH)
+    return None
+
+
+class Cutout(TimingMixin, AdmissionMixin, APIView):
     """
     View to handle spatial cutouts by providing all datamodel fields
 
     * Requires authentication.
     """
     # Set Parser and Renderer
-    parser_classes = (BloscParser, BloscPythonParser, NpygzParser, BrowsableAPIRenderer)
-    renderer_classes = (BloscRenderer, BloscPythonRenderer, NpygzRenderer, JpegRenderer,
-                        JSONRenderer, BrowsableAPIRenderer)
+    parser_classes = (BloscParser, BloscPythonParser, NpygzParser, RleParser) + CODEC_PARSERS + (BrowsableAPIRenderer,)
+    renderer_classes = (BloscRenderer, BloscPythonRenderer, BloscStreamRenderer, BloscCuboidsRenderer,
+                        NpygzRenderer) + CODEC_RENDERERS + (RleRenderer, JpegRenderer, JSONRenderer,
+                                                            BrowsableAPIRenderer)
 
     def __init__(self):
         super().__init__()
         self.data_type = None
         self.bit_depth = None
+        self.gzlevel = None
+        self.level = None
 
     def get(self, request, collection, experiment, channel, resolution, x_range, y_range, z_range, t_range=None):
         """
@@ -78,6 +144,28 @@ class Cutout(APIView):
         else:
             iso = False
 
+        # Check for optional npygz compression level
+        if "gzlevel" in request.query_params:
+            try:
+                self.gzlevel = int(request.query_params["gzlevel"])
+                if not 0 <= self.gzlevel <= 9:
+                    raise ValueError()
+            except ValueError:
+                return BossHTTPError("Invalid gzlevel {}. The level has to be between 0 and 9."
+                                     .format(request.query_params["gzlevel"]), ErrorCodes.INVALID_ARGUMENT)
+
+        # Check for optional zstd/lz4 compression level. The valid levels depend on the codec.
+        if "level" in request.query_params and isinstance(request.accepted_renderer, CodecRenderer):
+            levels = request.accepted_renderer.levels
+            try:
+                self.level = int(request.query_params["level"])
+                if self.level not in levels:
+                    raise ValueError()
+            except ValueError:
+                return BossHTTPError("Invalid level {}. The level has to be between {} and {}."
+                                     .format(request.query_params["level"], levels[0], levels[-1]),
+                                     ErrorCodes.INVALID_ARGUMENT)
+
         if isinstance(request.data, BossParserError):
             return request.data.to_http()
 
@@ -108,26 +196,127 @@ class Cutout(APIView):
         except ValueError:
             return BossHTTPError("Unsupported data type: {}".format(resource.get_data_type()), ErrorCodes.TYPE_ERROR)
 
+        if isinstance(request.accepted_renderer, RleRenderer) and self.bit_depth != 64:
+            return BossHTTPError("The cutout service run-length interface only supports uint64 annotation data",
+                                 ErrorCodes.DATATYPE_NOT_SUPPORTED)
+
+        # Check for an optional intensity window and output data type
+        try:
+            window = parse_window(request.query_params, resource.get_numpy_data_type())
+        except BossError as err:
+            return err.to_http()
+
+        # Streamed responses never hold the whole cutout, so they are allowed to be larger
+        stream = isinstance(request.accepted_renderer, (BloscStreamRenderer, BloscCuboidsRenderer))
+
         # Make sure cutout request is under 500MB UNCOMPRESSED
-        if is_too_large(req, self.bit_depth):
+        if stream:
+            if is_too_large(req, self.bit_depth, settings.CUTOUT_STREAM_MAX_SIZE):
+                return BossHTTPError("Cutout request is over {}MB when uncompressed. Reduce cutout dimensions."
+                                     .format(settings.CUTOUT_STREAM_MAX_SIZE // 1048576),
+                                     ErrorCodes.REQUEST_TOO_LARGE)
+        elif is_too_large(req, self.bit_depth):
             return BossHTTPError("Cutout request is over 500MB when uncompressed. Reduce cutout dimensions.",
                                  ErrorCodes.REQUEST_TOO_LARGE)
 
+        # Long time series are streamed as slabs of blocks of time samples, several fetched at a time
+        time_range = [req.get_time().start, req.get_time().stop]
+        time_workers = 1
+        if stream and len(get_time_blocks(time_range, settings.CUTOUT_TIME_BLOCK_SIZE)) > 1:
+            time_workers = max(1, settings.CUTOUT_TIME_WORKERS)
+
+        # Reads of a region wait for the asynchronous writes to it that are still pending
+        if not wait_to_read(resource.get_lookup_key(), req.get_resolution(),
+                            (req.get_x_start(), req.get_y_start(), req.get_z_start()),
+                            (req.get_x_span(), req.get_y_span(), req.get_z_span()), time_range):
+            return BossHTTPError("Writes to this region are still pending. Retry the request later.",
+                                 ErrorCodes.SERVER_BUSY)
+
+        # Wait for room in the node's budget of bytes in flight. Streamed responses hold about one slab per worker.
+        size = get_cutout_size(req, self.bit_depth)
+        try:
+            self.admission_lease = admit(min(size, SLAB_TARGET_SIZE * time_workers) if stream else size)
+        except AdmissionRejected:
+            return BossHTTPError("Server is busy. Retry the request later.", ErrorCodes.SERVER_BUSY)
+
+        # Renderers see the windowed data
+        dtype = resource.get_numpy_data_type()
+        if window:
+            self.bit_depth = window.bit_depth
+            dtype = window.out_dtype
+
         # Get interface to SPDB cache
-        cache = SpatialDB(settings.KVIO_SETTINGS,
-                          settings.STATEIO_CONFIG,
-                          settings.OBJECTIO_CONFIG)
+        cache = get_spatialdb()
 
         # Get the params to pull data out of the cache
         corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
         extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
 
+        if stream:
+            if isinstance(request.accepted_renderer, BloscCuboidsRenderer) and req.get_filter_ids() is None and \
+                    window is None and is_cuboid_aligned(corner, extent, req.get_resolution()):
+                # Send the cuboids as they are stored, without decompressing and recompressing them
+                blocks = iter_cuboid_blocks(cache, resource, corner, extent, req.get_resolution(), time_range,
+                                            iso=iso)
+            else:
+                if time_workers > 1:
+                    # Fetch several slabs at a time and send them in order, time block by time block
+                    blocks = iter_time_slabs(cache, resource, corner, extent, req.get_resolution(), time_range,
+                                             filter_ids=req.get_filter_ids(), iso=iso,
+                                             block_size=settings.CUTOUT_TIME_BLOCK_SIZE, workers=time_workers)
+                else:
+                    # Fetch, compress and send one z-slab at a time
+                    blocks = iter_z_slabs(cache, resource, corner, extent, req.get_resolution(), time_range,
+                                          filter_ids=req.get_filter_ids(), iso=iso)
+                if window:
+                    blocks = window_slabs(blocks, window)
+                if isinstance(request.accepted_renderer, BloscCuboidsRenderer):
+                    blocks = iter_slab_blocks(blocks)
+
+            shape = (len(req.get_time()), req.get_z_span(), req.get_y_span(), req.get_x_span())
+            frames = request.accepted_renderer.stream(blocks, req.time_request, shape, dtype)
+            return StreamingHttpResponse(frames, content_type=request.accepted_renderer.media_type)
+
+        # Serve repeated reads of unchanged regions from the worker's response cache
+        response_cache = get_response_cache()
+        if response_cache and isinstance(request.accepted_renderer, CACHEABLE_RENDERERS):
+            cache_key = get_cutout_key(resource, req.get_resolution(), corner, extent, time_range,
+                                       req.get_filter_ids(), iso) + (request.accepted_renderer.media_type,
+                                                                     req.time_request, self.gzlevel, self.level,
+                                                                     window.get_key() if window else None)
+
+            # Read the write counters before the data so a concurrent write leaves the entry out of date
+            versions = CuboidVersions(cache.kvio.cache_client, get_versions_ttl()).get(
+                resource.get_lookup_key(), req.get_resolution(), corner, extent, time_range)
+            body = response_cache.get(cache_key, versions)
+            if body is None:
+                with get_timer(request).stage("fetch"):
+                    data = coalesced_cutout(cache, resource, corner, extent, req.get_resolution(), time_range,
+                                            filter_ids=req.get_filter_ids(), iso=iso)
+                if window:
+                    data.data = window.apply(data.data)
+                with get_timer(request).stage("render"):
+                    body = request.accepted_renderer.render({"time_request": req.time_request, "data": data},
+                                                            request.accepted_media_type, self.get_renderer_context())
+                response_cache.put(cache_key, versions, body)
+
+            return HttpResponse(body, content_type=request.accepted_renderer.media_type)
+
         # Get a Cube instance with all time samples
-        data = cache.cutout(resource, corner, extent, req.get_resolution(), [req.get_time().start, req.get_time().stop],
-                            filter_ids=req.get_filter_ids(), iso=iso)
+        with get_timer(request).stage("fetch"):
+            data = coalesced_cutout(cache, resource, corner, extent, req.get_resolution(), time_range,
+                                    filter_ids=req.get_filter_ids(), iso=iso)
+        if window:
+            # Each caller gets its own copy of the Cube, so replacing its data does not affect other requests
+            data.data = window.apply(data.data)
         to_renderer = {"time_request": req.time_request,
                        "data": data}
 
+        # npygz is compressed in blocks, each sent as soon as it is ready
+        if isinstance(request.accepted_renderer, NpygzRenderer):
+            return StreamingHttpResponse(request.accepted_renderer.stream(to_renderer, self.get_renderer_context()),
+                                         content_type=NpygzRenderer.media_type)
+
         # Send data to renderer
         return Response(to_renderer)
 
@@ -149,8 +338,9 @@ class Cutout(APIView):
         :return:
         """
         # Check if parsing completed without error. If an error did occur, return to user.
-        if isinstance(request.data, BossParserError):
-            return request.data.to_http()
+        with get_timer(request).stage("parse"):
+            if isinstance(request.data, BossParserError):
+                return request.data.to_http()
 
         # Check for optional iso flag
         if "iso" in request.query_params:
@@ -161,61 +351,348 @@ class Cutout(APIView):
         else:
             iso = False
 
+        # Check for optional asynchronous write (see bossspatialdb.writebehind)
+        write_async = request.query_params.get("async", "false").lower() == "true"
+
         # Get BossRequest and BossResource from parser
         req = request.data[0]
         resource = request.data[1]
 
+        # Make sure the data matches the channel and the post URL
+        err = check_posted_data(req, resource, request.data[2])
+        if err:
+            return err
+
+        # Get interface to SPDB cache
+        cache = get_spatialdb()
+
+        # Write block to cache
+        corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
+        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+        num_time = request.data[2].shape[0] if len(request.data[2].shape) == 4 else 1
+        time_range = [req.get_time()[0], req.get_time()[0] + num_time]
+
+        if settings.CUTOUT_WRITE_BEHIND_ENABLED:
+            if write_async:
+                # Queue the write and answer with a ticket instead of waiting for it
+                with get_timer(request).stage("write"):
+                    data = request.data[2] if len(request.data[2].shape) == 4 else \
+                        np.expand_dims(request.data[2], axis=0)
+                    ticket = get_write_behind_queue().submit(cache.kvio.cache_client, request.user.username,
+                                                             resource, req.get_resolution(), corner, data,
+                                                             req.get_time()[0], iso=iso)
+                if ticket is None:
+                    return BossHTTPError("Server is busy. Retry the request later.", ErrorCodes.SERVER_BUSY)
+
+                ticket["url"] = "/{}/cutout-write/{}/".format(settings.BOSS_VERSION, ticket["ticket_id"])
+                return HttpResponse(json.dumps(ticket), content_type="application/json", status=202)
+
+            # Synchronous writes go after the pending asynchronous writes they overlap
+            region = {"corner": corner, "extent": extent, "time_range": time_range}
+            if not wait_for_pending_writes(cache.kvio.cache_client, resource.get_lookup_key(), req.get_resolution(),
+                                           region, settings.CUTOUT_WRITE_BEHIND_WAIT_TIMEOUT):
+                return BossHTTPError("Writes to this region are still pending. Retry the request later.",
+                                     ErrorCodes.SERVER_BUSY)
+        elif write_async:
+            return BossHTTPError("Asynchronous writes are not enabled.", ErrorCodes.INVALID_ARGUMENT)
+
+        try:
+            with get_timer(request).stage("write"):
+                if len(request.data[2].shape) == 4:
+                    cache.write_cuboid(resource, corner, req.get_resolution(), request.data[2], req.get_time()[0],
+                                       iso=iso)
+                else:
+                    cache.write_cuboid(resource, corner, req.get_resolution(),
+                                       np.expand_dims(request.data[2], axis=0), req.get_time()[0], iso=iso)
+        except Exception as e:
+            # TODO: Eventually remove as this level of detail should not be sent to the user
+            return BossHTTPError('Error during write_cuboid: {}'.format(e), ErrorCodes.BOSS_SYSTEM_ERROR)
+
+        mark_written(cache, resource, req.get_resolution(), corner, extent, time_range)
+
+        # Send data to renderer
+        return HttpResponse(status=201)
+
+
+class CutoutBatch(AdmissionMixin, APIView):
+    """
+    View to handle cutouts of many regions of one channel in a single request
+
+    The regions are POSTed as JSON and returned in request order as a framed blosc response (see
+    bossspatialdb.framing). Cuboids shared by several regions are only read once.
+
+    * Requires authentication.
+    """
+    # Set Parser and Renderer
+    parser_classes = (JSONParser,)
+    renderer_classes = (BloscStreamRenderer, JSONRenderer, BrowsableAPIRenderer)
+
+    def __init__(self):
+        super().__init__()
+        self.bit_depth = None
+
+    def post(self, request, collection, experiment, channel, resolution, t_range=None):
+        """
+        View to handle POST requests for a batch of cutouts
+
+        The body is a JSON dict with a "regions" list of python style x, y and z ranges, eg.
+        {"regions": [{"x": "0:64", "y": "0:64", "z": "0:16"}, ...]}
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param collection: Unique Collection identifier, indicating which collection you want to access
+        :param experiment: Experiment identifier, indicating which experiment you want to access
+        :param channel: Channel identifier, indicating which channel you want to access
+        :param resolution: Integer indicating the level in the resolution hierarchy (0 = native)
+        :param t_range: Python style range indicating the time samples of every region (eg. 0:2)
+        :return:
+        """
+        if not isinstance(request.accepted_renderer, BloscStreamRenderer):
+            return BossHTTPError("Batch cutouts are only available as {}".format(BloscStreamRenderer.media_type),
+                                 ErrorCodes.UNSUPPORTED_TRANSPORT_FORMAT)
+
+        if "filter" in request.query_params:
+            ids = request.query_params["filter"]
+        else:
+            ids = None
+
+        if "iso" in request.query_params:
+            if request.query_params["iso"].lower() == "true":
+                iso = True
+            else:
+                iso = False
+        else:
+            iso = False
+
+        try:
+            regions = parse_regions(request.data.get("regions") if isinstance(request.data, dict) else None)
+        except BossError as err:
+            return err.to_http()
+
+        if len(regions) > settings.CUTOUT_BATCH_MAX_REGIONS:
+            return BossHTTPError("Batch request has {} regions. The maximum is {}."
+                                 .format(len(regions), settings.CUTOUT_BATCH_MAX_REGIONS),
+                                 ErrorCodes.REQUEST_TOO_LARGE)
+
+        # Validate and check permissions once, for the bounding box of all the regions
+        union_corner, union_extent = get_union(regions)
+        try:
+            request_args = {
+                "service": "batch",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+                "resolution": resolution,
+                "x_args": "{}:{}".format(union_corner[0], union_corner[0] + union_extent[0]),
+                "y_args": "{}:{}".format(union_corner[1], union_corner[1] + union_extent[1]),
+                "z_args": "{}:{}".format(union_corner[2], union_corner[2] + union_extent[2]),
+                "time_args": t_range,
+                "ids": ids
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # Convert to Resource
+        resource = project.BossResourceDjango(req)
+
         # Get bit depth
         try:
-            expected_data_type = resource.get_numpy_data_type()
+            self.bit_depth = resource.get_bit_depth()
         except ValueError:
             return BossHTTPError("Unsupported data type: {}".format(resource.get_data_type()), ErrorCodes.TYPE_ERROR)
 
-        # Make sure datatype is valid
-        if expected_data_type != request.data[2].dtype:
-            return BossHTTPError("Datatype does not match channel", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+        # Each region is held in memory while it is compressed, and the response is streamed
+        region_sizes = [extent[0] * extent[1] * extent[2] * len(req.get_time()) * self.bit_depth // 8
+                        for _, extent in regions]
+        if max(region_sizes) > settings.CUTOUT_MAX_SIZE:
+            return BossHTTPError("A region is over 500MB when uncompressed. Reduce region dimensions.",
+                                 ErrorCodes.REQUEST_TOO_LARGE)
+        if sum(region_sizes) > settings.CUTOUT_STREAM_MAX_SIZE:
+            return BossHTTPError("Batch request is over {}MB when uncompressed. Reduce the number of regions."
+                                 .format(settings.CUTOUT_STREAM_MAX_SIZE // 1048576), ErrorCodes.REQUEST_TOO_LARGE)
+
+        # Reads wait for the pending asynchronous writes to any part of the batch
+        if not wait_to_read(resource.get_lookup_key(), req.get_resolution(), union_corner, union_extent,
+                            [req.get_time().start, req.get_time().stop]):
+            return BossHTTPError("Writes to this region are still pending. Retry the request later.",
+                                 ErrorCodes.SERVER_BUSY)
+
+        # Cuboids are held until the last region that uses them has been produced, so regions that share cuboids
+        # with later ones can hold much more than a single region
+        peak_size = get_batch_peak_size(regions, req.get_resolution(), len(req.get_time()), self.bit_depth // 8)
+        if peak_size > settings.CUTOUT_MAX_SIZE:
+            return BossHTTPError("Batch request holds over 500MB of cuboids at once when uncompressed. Reduce region "
+                                 "dimensions or send regions that share cuboids next to each other.",
+                                 ErrorCodes.REQUEST_TOO_LARGE)
+
+        # Wait for room in the node's budget of bytes in flight for the most the batch holds at once
+        try:
+            self.admission_lease = admit(peak_size)
+        except AdmissionRejected:
+            return BossHTTPError("Server is busy. Retry the request later.", ErrorCodes.SERVER_BUSY)
+
+        # Get interface to SPDB cache
+        cache = get_spatialdb()
+
+        data = iter_batch_regions(cache, resource, regions, req.get_resolution(),
+                                  [req.get_time().start, req.get_time().stop],
+                                  filter_ids=req.get_filter_ids(), iso=iso)
+        frames = request.accepted_renderer.stream_regions(regions, data, req.time_request, req.get_time().start,
+                                                          resource.get_numpy_data_type())
+        return StreamingHttpResponse(frames, content_type=BloscStreamRenderer.media_type)
+
+
+class CutoutStack(AdmissionMixin, APIView):
+    """
+    View to handle cutouts of the same region of several channels of one experiment in a single request
+
+    Channels of the same data type are returned as a single stacked array, with the channel as the first axis.
+    Channels of any data type can be returned as a framed blosc response (see bossspatialdb.framing) with one frame
+    per channel. The request is validated once and the channels are fetched concurrently.
+
+    * Requires authentication.
+    """
+    # Set Parser and Renderer
+    renderer_classes = (BloscRenderer, BloscPythonRenderer, BloscStreamRenderer, NpygzRenderer, JSONRenderer,
+                        BrowsableAPIRenderer)
+
+    def __init__(self):
+        super().__init__()
+        self.bit_depth = None
+        self.gzlevel = None
+
+    def get(self, request, collection, experiment, channels, resolution, x_range, y_range, z_range, t_range=None):
+        """
+        View to handle GET requests for a stacked cutout
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param collection: Unique Collection identifier, indicating which collection you want to access
+        :param experiment: Experiment identifier, indicating which experiment you want to access
+        :param channels: Comma separated channel identifiers, indicating which channels you want to access
+        :param resolution: Integer indicating the level in the resolution hierarchy (0 = native)
+        :param x_range: Python style range indicating the X coordinates of the cutout (eg. 100:200)
+        :param y_range: Python style range indicating the Y coordinates of the cutout (eg. 100:200)
+        :param z_range: Python style range indicating the Z coordinates of the cutout (eg. 100:200)
+        :param t_range: Python style range indicating the time samples of the cutout (eg. 0:2)
+        :return:
+        """
+        stack = not isinstance(request.accepted_renderer, BloscStreamRenderer)
+        if stack and not isinstance(request.accepted_renderer, (BloscRenderer, BloscPythonRenderer, NpygzRenderer)):
+            return BossHTTPError("Stacked cutouts are not available as {}".format(request.accepted_media_type),
+                                 ErrorCodes.UNSUPPORTED_TRANSPORT_FORMAT)
 
-        # Make sure the dimensions of the data match the dimensions of the post URL
-        if len(request.data[2].shape) == 4:
-            expected_shape = (len(req.get_time()), req.get_z_span(), req.get_y_span(), req.get_x_span())
+        if "iso" in request.query_params:
+            if request.query_params["iso"].lower() == "true":
+                iso = True
+            else:
+                iso = False
         else:
-            expected_shape = (req.get_z_span(), req.get_y_span(), req.get_x_span())
+            iso = False
+
+        # Check for optional npygz compression level
+        if "gzlevel" in request.query_params:
+            try:
+                self.gzlevel = int(request.query_params["gzlevel"])
+                if not 0 <= self.gzlevel <= 9:
+                    raise ValueError()
+            except ValueError:
+                return BossHTTPError("Invalid gzlevel {}. The level has to be between 0 and 9."
+                                     .format(request.query_params["gzlevel"]), ErrorCodes.INVALID_ARGUMENT)
+
+        # Validate the collection, experiment and cutout arguments once, and check permissions for each channel
+        try:
+            request_args = {
+                "service": "stack",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_names": parse_channels(channels, settings.CUTOUT_STACK_MAX_CHANNELS),
+                "resolution": resolution,
+                "x_args": x_range,
+                "y_args": y_range,
+                "z_args": z_range,
+                "time_args": t_range
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
 
-        if expected_shape != request.data[2].shape:
-            return BossHTTPError("Data dimensions in URL do not match POSTed data.",
-                                 ErrorCodes.DATA_DIMENSION_MISMATCH)
+        # Convert to Resources
+        resources = [project.BossResourceDjango(req.get_channel_request(channel)) for channel in req.channels]
 
-        # Get interface to SPDB cache
-        cache = SpatialDB(settings.KVIO_SETTINGS,
-                          settings.STATEIO_CONFIG,
-                          settings.OBJECTIO_CONFIG)
+        # Get bit depths
+        try:
+            bit_depths = [resource.get_bit_depth() for resource in resources]
+        except ValueError:
+            return BossHTTPError("Unsupported data type in channels {}".format(channels), ErrorCodes.TYPE_ERROR)
+
+        dtype = get_stack_dtype(resources)
+        if stack and dtype is None:
+            return BossHTTPError("Channels {} have different data types. Request {} to get one frame per channel."
+                                 .format(channels, BloscStreamRenderer.media_type),
+                                 ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+        # A stacked response holds every channel, a framed response about one channel per worker
+        workers = min(len(resources), max(1, settings.CUTOUT_STACK_WORKERS))
+        channel_sizes = [get_cutout_size(req, bit_depth) for bit_depth in bit_depths]
+        if stack:
+            if sum(channel_sizes) > settings.CUTOUT_MAX_SIZE:
+                return BossHTTPError("Stacked cutout request is over 500MB when uncompressed. Reduce cutout "
+                                     "dimensions or the number of channels.", ErrorCodes.REQUEST_TOO_LARGE)
+            size = sum(channel_sizes)
+        else:
+            if max(channel_sizes) > settings.CUTOUT_MAX_SIZE:
+                return BossHTTPError("A channel is over 500MB when uncompressed. Reduce cutout dimensions.",
+                                     ErrorCodes.REQUEST_TOO_LARGE)
+            if sum(channel_sizes) > settings.CUTOUT_STREAM_MAX_SIZE:
+                return BossHTTPError("Stacked cutout request is over {}MB when uncompressed. Reduce the number of "
+                                     "channels.".format(settings.CUTOUT_STREAM_MAX_SIZE // 1048576),
+                                     ErrorCodes.REQUEST_TOO_LARGE)
+            size = sum(sorted(channel_sizes)[-workers:])
 
-        # Write block to cache
+        # Get the params to pull data out of the cache
         corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
+        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+        time_range = [req.get_time().start, req.get_time().stop]
 
+        # Reads of a region wait for the asynchronous writes to it that are still pending
+        for resource in resources:
+            if not wait_to_read(resource.get_lookup_key(), req.get_resolution(), corner, extent, time_range):
+                return BossHTTPError("Writes to this region are still pending. Retry the request later.",
+                                     ErrorCodes.SERVER_BUSY)
+
+        # Wait for room in the node's budget of bytes in flight
         try:
-            if len(request.data[2].shape) == 4:
-                cache.write_cuboid(resource, corner, req.get_resolution(), request.data[2], req.get_time()[0], iso=iso)
-            else:
-                cache.write_cuboid(resource, corner, req.get_resolution(),
-                                   np.expand_dims(request.data[2], axis=0), req.get_time()[0], iso=iso)
-        except Exception as e:
-            # TODO: Eventually remove as this level of detail should not be sent to the user
-            return BossHTTPError('Error during write_cuboid: {}'.format(e), ErrorCodes.BOSS_SYSTEM_ERROR)
+            self.admission_lease = admit(size)
+        except AdmissionRejected:
+            return BossHTTPError("Server is busy. Retry the request later.", ErrorCodes.SERVER_BUSY)
 
-        # If the channel status is DOWNSAMPLED change status to NOT_DOWNSAMPLED since you just wrote data
-        channel = resource.get_channel()
-        if channel.downsample_status.upper() == "DOWNSAMPLED":
-            # Get Channel object and update status
-            lookup_key = resource.get_lookup_key()
-            _, exp_id, _ = lookup_key.split("&")
-            channel_obj = Channel.objects.get(name=channel.name, experiment=int(exp_id))
-            channel_obj.downsample_status = "NOT_DOWNSAMPLED"
-            channel_obj.downsample_arn = ""
-            channel_obj.save()
+        # Get interface to SPDB cache
+        cache = get_spatialdb()
+
+        cubes = iter_channel_cutouts(cache, resources, corner, extent, req.get_resolution(), time_range, iso=iso,
+                                     workers=workers)
+        if not stack:
+            frames = request.accepted_renderer.stream_channels(cubes, req.time_request, time_range[0], corner,
+                                                               len(resources), resources[0].get_numpy_data_type())
+            return StreamingHttpResponse(frames, content_type=BloscStreamRenderer.media_type)
+
+        self.bit_depth = bit_depths[0]
+        with get_timer(request).stage("fetch"):
+            data = stack_cutouts(cubes, len(resources), req.time_request)
+
+        # The stack already has the shape it is returned in, so renderers must not squeeze its first axis
+        to_renderer = {"time_request": True,
+                       "data": data}
+
+        # npygz is compressed in blocks, each sent as soon as it is ready
+        if isinstance(request.accepted_renderer, NpygzRenderer):
+            return StreamingHttpResponse(request.accepted_renderer.stream(to_renderer, self.get_renderer_context()),
+                                         content_type=NpygzRenderer.media_type)
 
         # Send data to renderer
-        return HttpResponse(status=201)
+        return Response(to_renderer)
 
 
 class Downsample(APIView):
@@ -283,6 +760,9 @@ class Downsample(APIView):
                 channel_obj.save()
                 to_renderer["status"] = "DOWNSAMPLED"
 
+                # Downsampled resolutions were rewritten
+                CuboidVersions(get_spatialdb().kvio.cache_client).bump_epoch(lookup_key)
+
             elif status == "FAILED" or status == "TIMED_OUT":
                 # Change status to FAILED
                 channel_obj = Channel.objects.get(name=channel.name, experiment=int(exp_id))
@@ -393,6 +873,9 @@ class Downsample(APIView):
         channel_obj.downsample_arn = arn
         channel_obj.save()
 
+        # Downsampled resolutions are about to be rewritten
+        CuboidVersions(get_spatialdb().kvio.cache_client).bump_epoch(lookup_key)
+
         return HttpResponse(status=201)
 
     def delete(self, request, collection, experiment, channel):
@@ -443,4 +926,699 @@ class Downsample(APIView):
         channel_obj.downsample_status = "NOT_DOWNSAMPLED"
         channel_obj.save()
 
+        # A cancelled downsample may have partially rewritten downsampled resolutions
+        CuboidVersions(get_spatialdb().kvio.cache_client).bump_epoch(lookup_key)
+
         return HttpResponse(status=204)
+
+
+class CutoutStats(AdmissionMixin, APIView):
+    """
+    View to compute the statistics of the data in a region without sending the data
+
+    Returns the count, min, max, mean, standard deviation, selected percentiles and a histogram of the region's
+    values. Only uint8 and uint16 channels are supported.
+
+    * Requires authentication.
+    """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request, collection, experiment, channel, resolution, x_range, y_range, z_range, t_range=None):
+        """
+        View to handle GET requests for the statistics of a region
+
+        Optional query parameters are bins (number of histogram bins, default settings.CUTOUT_STATS_DEFAULT_BINS),
+        percentiles (comma separated list, eg. 1,50,99.5) and iso.
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param collection: Unique Collection identifier, indicating which collection you want to access
+        :param experiment: Experiment identifier, indicating which experiment you want to access
+        :param channel: Channel identifier, indicating which channel you want to access
+        :param resolution: Integer indicating the level in the resolution hierarchy (0 = native)
+        :param x_range: Python style range indicating the X coordinates of the region (eg. 100:200)
+        :param y_range: Python style range indicating the Y coordinates of the region (eg. 100:200)
+        :param z_range: Python style range indicating the Z coordinates of the region (eg. 100:200)
+        :return:
+        """
+        iso = request.query_params.get("iso", "false").lower() == "true"
+
+        try:
+            bins = int(request.query_params.get("bins", settings.CUTOUT_STATS_DEFAULT_BINS))
+            if not 1 <= bins <= 65536:
+                raise ValueError()
+        except ValueError:
+            return BossHTTPError("Invalid bins {}. The number of bins has to be between 1 and 65536."
+                                 .format(request.query_params["bins"]), ErrorCodes.INVALID_ARGUMENT)
+
+        if "percentiles" in request.query_params:
+            try:
+                percentiles = [float(p) for p in request.query_params["percentiles"].split(",")]
+                if not all(0 <= p <= 100 for p in percentiles):
+                    raise ValueError()
+            except ValueError:
+                return BossHTTPError("Invalid percentiles {}. Provide a comma separated list of values between 0 "
+                                     "and 100.".format(request.query_params["percentiles"]),
+                                     ErrorCodes.INVALID_ARGUMENT)
+        else:
+            percentiles = DEFAULT_PERCENTILES
+
+        # Process request and validate
+        try:
+            request_args = {
+                "service": "cutout",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+                "resolution": resolution,
+                "x_args": x_range,
+                "y_args": y_range,
+                "z_args": z_range,
+                "time_args": t_range,
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # Convert to Resource
+        resource = project.BossResourceDjango(req)
+
+        # Get bit depth
+        try:
+            bit_depth = resource.get_bit_depth()
+        except ValueError:
+            return BossHTTPError("Unsupported data type: {}".format(resource.get_data_type()), ErrorCodes.TYPE_ERROR)
+
+        if bit_depth > 16:
+            return BossHTTPError("Statistics are only supported for uint8 and uint16 channels",
+                                 ErrorCodes.DATATYPE_NOT_SUPPORTED)
+
+        # The region is read in pieces, so it is allowed to be as large as a streamed cutout
+        if is_too_large(req, bit_depth, settings.CUTOUT_STREAM_MAX_SIZE):
+            return BossHTTPError("Region is over {}MB when uncompressed. Reduce region dimensions."
+                                 .format(settings.CUTOUT_STREAM_MAX_SIZE // 1048576), ErrorCodes.REQUEST_TOO_LARGE)
+
+        corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
+        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+
+        # Reads of a region wait for the asynchronous writes to it that are still pending
+        if not wait_to_read(resource.get_lookup_key(), req.get_resolution(), corner, extent,
+                            [req.get_time().start, req.get_time().stop]):
+            return BossHTTPError("Writes to this region are still pending. Retry the request later.",
+                                 ErrorCodes.SERVER_BUSY)
+
+        try:
+            self.admission_lease = admit(min(get_cutout_size(req, bit_depth), SLAB_TARGET_SIZE))
+        except AdmissionRejected:
+            return BossHTTPError("Server is busy. Retry the request later.", ErrorCodes.SERVER_BUSY)
+
+        hist, _, _ = get_region_histogram(get_spatialdb(), resource, corner, extent, req.get_resolution(),
+                                          [req.get_time().start, req.get_time().stop], iso=iso,
+                                          ttl=settings.CUTOUT_STATS_CACHE_TTL)
+
+        return Response(summarize_histogram(hist, bins, percentiles))
+
+
+class CutoutProjection(AdmissionMixin, APIView):
+    """
+    View to handle max, min and mean intensity projections of a region along one axis
+
+    The projection is returned like a cutout whose reduced axis has a length of 1, or as a 2D image (xy for z
+    projections, xz for y projections and yz for x projections) for a single time sample.
+
+    * Requires authentication.
+    """
+    renderer_classes = (BloscRenderer, BloscPythonRenderer, NpygzRenderer, PNGRenderer, JPEGRenderer, JSONRenderer,
+                        BrowsableAPIRenderer)
+
+    def __init__(self):
+        super().__init__()
+        self.bit_depth = None
+        self.gzlevel = None
+
+    def get(self, request, collection, experiment, channel, axis, op, resolution, x_range, y_range, z_range,
+            t_range=None):
+        """
+        View to handle GET requests for a projection of a region
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param collection: Unique Collection identifier, indicating which collection you want to access
+        :param experiment: Experiment identifier, indicating which experiment you want to access
+        :param channel: Channel identifier, indicating which channel you want to access
+        :param axis: Axis to reduce. Valid options include z, y or x
+        :param op: Reduction. Valid options include max, min or mean
+        :param resolution: Integer indicating the level in the resolution hierarchy (0 = native)
+        :param x_range: Python style range indicating the X coordinates of the region (eg. 100:200)
+        :param y_range: Python style range indicating the Y coordinates of the region (eg. 100:200)
+        :param z_range: Python style range indicating the Z coordinates of the region (eg. 100:200)
+        :return:
+        """
+        iso = request.query_params.get("iso", "false").lower() == "true"
+
+        # Process request and validate
+        try:
+            request_args = {
+                "service": "cutout",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+                "resolution": resolution,
+                "x_args": x_range,
+                "y_args": y_range,
+                "z_args": z_range,
+                "time_args": t_range,
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # Convert to Resource
+        resource = project.BossResourceDjango(req)
+
+        # Get bit depth
+        try:
+            self.bit_depth = resource.get_bit_depth()
+        except ValueError:
+            return BossHTTPError("Unsupported data type: {}".format(resource.get_data_type()), ErrorCodes.TYPE_ERROR)
+
+        image = isinstance(request.accepted_renderer, (PNGRenderer, JPEGRenderer))
+        if image and len(req.get_time()) > 1:
+            return BossHTTPError("The projection service image interface does not support 4D projections",
+                                 ErrorCodes.UNSUPPORTED_4D)
+        if isinstance(request.accepted_renderer, JPEGRenderer) and self.bit_depth != 8:
+            return BossHTTPError("The projection service JPEG interface only supports uint8 image data",
+                                 ErrorCodes.DATATYPE_DOES_NOT_MATCH)
+
+        # The region is read in pieces, so it is allowed to be as large as a streamed cutout
+        if is_too_large(req, self.bit_depth, settings.CUTOUT_STREAM_MAX_SIZE):
+            return BossHTTPError("Region is over {}MB when uncompressed. Reduce region dimensions."
+                                 .format(settings.CUTOUT_STREAM_MAX_SIZE // 1048576), ErrorCodes.REQUEST_TOO_LARGE)
+
+        shape = (len(req.get_time()), req.get_z_span(), req.get_y_span(), req.get_x_span())
+        projection_size = int(np.prod(get_projection_shape(shape, axis))) * self.bit_depth // 8
+
+        corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
+        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+
+        # Reads of a region wait for the asynchronous writes to it that are still pending
+        if not wait_to_read(resource.get_lookup_key(), req.get_resolution(), corner, extent,
+                            [req.get_time().start, req.get_time().stop]):
+            return BossHTTPError("Writes to this region are still pending. Retry the request later.",
+                                 ErrorCodes.SERVER_BUSY)
+
+        try:
+            self.admission_lease = admit(min(get_cutout_size(req, self.bit_depth), SLAB_TARGET_SIZE) +
+                                         projection_size)
+        except AdmissionRejected:
+            return BossHTTPError("Server is busy. Retry the request later.", ErrorCodes.SERVER_BUSY)
+
+        # Reduce the region one z-slab at a time
+        slabs = iter_z_slabs(get_spatialdb(), resource, corner, extent, req.get_resolution(),
+                             [req.get_time().start, req.get_time().stop], iso=iso)
+        data = project_slabs(slabs, shape, np.dtype(resource.get_numpy_data_type()), axis, op)
+
+        if image:
+            return Response(Image.fromarray(np.squeeze(data, axis=(0, PROJECTION_AXES[axis]))))
+
+        to_renderer = {"time_request": req.time_request, "data": Projection(data)}
+
+        # npygz is compressed in blocks, each sent as soon as it is ready
+        if isinstance(request.accepted_renderer, NpygzRenderer):
+            return StreamingHttpResponse(request.accepted_renderer.stream(to_renderer, self.get_renderer_context()),
+                                         content_type=NpygzRenderer.media_type)
+
+        return Response(to_renderer)
+
+
+class CutoutEstimate(APIView):
+    """
+    View to estimate the cost of a cutout without reading its data
+
+    Returns the uncompressed size of the cutout, the cuboids it touches, how many of them are in the cache, waiting
+    in the write buffer or have to be read from the object store (or were never written), whether it is within the
+    cutout size limits and a rough latency estimate.
+
+    * Requires authentication.
+    """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request, collection, experiment, channel, resolution, x_range, y_range, z_range, t_range=None):
+        """
+        View to handle GET requests for the cost estimate of a cutout
+
+        Optional query parameter is iso.
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param collection: Unique Collection identifier, indicating which collection you want to access
+        :param experiment: Experiment identifier, indicating which experiment you want to access
+        :param channel: Channel identifier, indicating which channel you want to access
+        :param resolution: Integer indicating the level in the resolution hierarchy (0 = native)
+        :param x_range: Python style range indicating the X coordinates of the cutout (eg. 100:200)
+        :param y_range: Python style range indicating the Y coordinates of the cutout (eg. 100:200)
+        :param z_range: Python style range indicating the Z coordinates of the cutout (eg. 100:200)
+        :return:
+        """
+        iso = request.query_params.get("iso", "false").lower() == "true"
+
+        # Process request and validate
+        try:
+            request_args = {
+                "service": "cutout",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+                "resolution": resolution,
+                "x_args": x_range,
+                "y_args": y_range,
+                "z_args": z_range,
+                "time_args": t_range,
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # Convert to Resource
+        resource = project.BossResourceDjango(req)
+
+        # Get bit depth
+        try:
+            bit_depth = resource.get_bit_depth()
+        except ValueError:
+            return BossHTTPError("Unsupported data type: {}".format(resource.get_data_type()), ErrorCodes.TYPE_ERROR)
+
+        corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
+        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+        estimate = estimate_cutout(get_spatialdb(), resource, corner, extent, req.get_resolution(),
+                                   [req.get_time().start, req.get_time().stop], iso=iso,
+                                   max_probes=settings.CUTOUT_ESTIMATE_MAX_PROBES,
+                                   model=settings.CUTOUT_ESTIMATE_MODEL)
+        estimate["within_cutout_limit"] = not is_too_large(req, bit_depth)
+        estimate["within_stream_limit"] = not is_too_large(req, bit_depth, settings.CUTOUT_STREAM_MAX_SIZE)
+
+        return Response(estimate)
+
+
+class CutoutPrewarm(APIView):
+    """
+    View to page the cuboids of a list of regions into the cache in the background
+
+    The regions are POSTed as JSON, in the same form as a batch cutout. The response is the new job, whose progress
+    is available from CutoutPrewarmStatus.
+
+    * Requires authentication.
+    """
+    parser_classes = (JSONParser,)
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def post(self, request, collection, experiment, channel, resolution, t_range=None):
+        """
+        View to handle POST requests to pre-warm the cache for a list of regions
+
+        The body is a JSON dict with a "regions" list of python style x, y and z ranges, eg.
+        {"regions": [{"x": "0:64", "y": "0:64", "z": "0:16"}, ...]}
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param collection: Unique Collection identifier, indicating which collection you want to access
+        :param experiment: Experiment identifier, indicating which experiment you want to access
+        :param channel: Channel identifier, indicating which channel you want to access
+        :param resolution: Integer indicating the level in the resolution hierarchy (0 = native)
+        :param t_range: Python style range indicating the time samples of every region (eg. 0:2)
+        :return:
+        """
+        iso = request.query_params.get("iso", "false").lower() == "true"
+
+        try:
+            regions = parse_regions(request.data.get("regions") if isinstance(request.data, dict) else None)
+        except BossError as err:
+            return err.to_http()
+
+        if len(regions) > settings.CUTOUT_BATCH_MAX_REGIONS:
+            return BossHTTPError("Pre-warm request has {} regions. The maximum is {}."
+                                 .format(len(regions), settings.CUTOUT_BATCH_MAX_REGIONS),
+                                 ErrorCodes.REQUEST_TOO_LARGE)
+
+        # Validate and check permissions once, for the bounding box of all the regions
+        union_corner, union_extent = get_union(regions)
+        try:
+            request_args = {
+                "service": "batch",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+                "resolution": resolution,
+                "x_args": "{}:{}".format(union_corner[0], union_corner[0] + union_extent[0]),
+                "y_args": "{}:{}".format(union_corner[1], union_corner[1] + union_extent[1]),
+                "z_args": "{}:{}".format(union_corner[2], union_corner[2] + union_extent[2]),
+                "time_args": t_range,
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # Convert to Resource
+        resource = project.BossResourceDjango(req)
+
+        num_cuboids = len(set(index for corner, extent in regions
+                               for index in iter_cuboid_indices(corner, extent, req.get_resolution())))
+        total = num_cuboids * len(req.get_time())
+        if total > settings.CUTOUT_PREWARM_MAX_CUBOIDS:
+            return BossHTTPError("Pre-warm request covers {} cuboids. The maximum is {}."
+                                 .format(total, settings.CUTOUT_PREWARM_MAX_CUBOIDS), ErrorCodes.REQUEST_TOO_LARGE)
+
+        client = get_spatialdb().kvio.cache_client
+        job_id = create_job(client, request.user.username, total, settings.CUTOUT_PREWARM_JOB_TTL)
+        if not get_prewarm_executor().submit(run_job, job_id, resource, regions, req.get_resolution(),
+                                             [req.get_time().start, req.get_time().stop], iso=iso):
+            client.delete(get_job_key(job_id))
+            return BossHTTPError("Server is busy. Retry the request later.", ErrorCodes.SERVER_BUSY)
+
+        return Response(get_job(client, job_id), status=202)
+
+
+class CutoutPrewarmStatus(APIView):
+    """
+    View to get the progress of a pre-warm job
+
+    * Requires authentication. Jobs are only visible to the user that started them and to staff.
+    """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request, job_id):
+        """
+        View to handle GET requests for the progress of a pre-warm job
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param job_id: Id of the job, as returned when it was started
+        :return:
+        """
+        job = get_job(get_spatialdb().kvio.cache_client, job_id)
+        if job is None or (job["user"] != request.user.username and not request.user.is_staff):
+            return BossHTTPError("Pre-warm job {} not found".format(job_id), ErrorCodes.RESOURCE_NOT_FOUND)
+        return Response(job)
+
+
+class CutoutUpload(APIView):
+    """
+    View to open a resumable upload session for a region of a channel
+
+    The region is then written as cuboid aligned parts with CutoutUploadPart and committed with CutoutUploadCommit.
+
+    * Requires authentication.
+    """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def post(self, request, collection, experiment, channel, resolution, x_range, y_range, z_range, t_range=None):
+        """
+        View to handle POST requests to open an upload session
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param collection: Unique Collection identifier, indicating which collection you want to access
+        :param experiment: Experiment identifier, indicating which experiment you want to access
+        :param channel: Channel identifier, indicating which dataset or annotation project you want to access
+        :param resolution: Integer indicating the level in the resolution hierarchy (0 = native)
+        :param x_range: Python style range indicating the X coordinates of the region (eg. 100:200)
+        :param y_range: Python style range indicating the Y coordinates of the region (eg. 100:200)
+        :param z_range: Python style range indicating the Z coordinates of the region (eg. 100:200)
+        :param t_range: Python style range indicating the time samples every part covers (eg. 0:2)
+        :return:
+        """
+        iso = request.query_params.get("iso", "false").lower() == "true"
+
+        # Validate the region and check the user can write to the channel
+        try:
+            request_args = {
+                "service": "cutout",
+                "collection_name": collection,
+                "experiment_name": experiment,
+                "channel_name": channel,
+                "resolution": resolution,
+                "x_args": x_range,
+                "y_args": y_range,
+                "z_args": z_range,
+                "time_args": t_range,
+            }
+            req = BossRequest(request, request_args)
+        except BossError as err:
+            return err.to_http()
+
+        # Convert to Resource
+        resource = project.BossResourceDjango(req)
+
+        try:
+            bit_depth = resource.get_bit_depth()
+        except ValueError:
+            return BossHTTPError("Unsupported data type: {}".format(resource.get_data_type()), ErrorCodes.TYPE_ERROR)
+
+        if is_too_large(req, bit_depth, settings.CUTOUT_UPLOAD_MAX_SIZE):
+            return BossHTTPError("Upload region is too large. Split it into several uploads.",
+                                 ErrorCodes.REQUEST_TOO_LARGE)
+
+        corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
+        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+        total = len(list(iter_cuboid_indices(corner, extent, req.get_resolution())))
+
+        args = {"collection": collection, "experiment": experiment, "channel": channel, "resolution": resolution,
+                "t_range": t_range}
+        client = get_spatialdb().kvio.cache_client
+        upload_id = create_session(client, request.user.username, args, corner, extent,
+                                   [req.get_time().start, req.get_time().stop], total,
+                                   settings.CUTOUT_UPLOAD_SESSION_TTL, iso=iso)
+
+        return Response(get_session(client, upload_id), status=201)
+
+
+class CutoutUploadSession(APIView):
+    """
+    View to get the progress of an upload session or abort it
+
+    * Requires authentication. Sessions are only visible to the user that opened them.
+    """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request, upload_id):
+        """
+        View to handle GET requests for the progress of an upload session
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param upload_id: Id of the session, as returned when it was opened
+        :return:
+        """
+        session = get_session(get_spatialdb().kvio.cache_client, upload_id)
+        if session is None or session["user"] != request.user.username:
+            return BossHTTPError("Upload session {} not found".format(upload_id), ErrorCodes.RESOURCE_NOT_FOUND)
+        return Response(session)
+
+    def delete(self, request, upload_id):
+        """
+        View to handle DELETE requests to abort an upload session
+
+        Parts that were already received stay written.
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param upload_id: Id of the session, as returned when it was opened
+        :return:
+        """
+        client = get_spatialdb().kvio.cache_client
+        session = get_session(client, upload_id)
+        if session is None or session["user"] != request.user.username:
+            return BossHTTPError("Upload session {} not found".format(upload_id), ErrorCodes.RESOURCE_NOT_FOUND)
+
+        delete_session(client, upload_id)
+        return HttpResponse(status=204)
+
+
+class CutoutUploadCommit(APIView):
+    """
+    View to commit an upload session once all of its parts have been received
+
+    * Requires authentication.
+    """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def post(self, request, upload_id):
+        """
+        View to handle POST requests to commit an upload session
+
+        Committing an already committed session succeeds, so the request can be retried.
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param upload_id: Id of the session, as returned when it was opened
+        :return:
+        """
+        client = get_spatialdb().kvio.cache_client
+        session = get_session(client, upload_id)
+        if session is None or session["user"] != request.user.username:
+            return BossHTTPError("Upload session {} not found".format(upload_id), ErrorCodes.RESOURCE_NOT_FOUND)
+
+        if session["status"] == "open":
+            if session["received"] < session["total"]:
+                return BossHTTPError("Upload session {} has received {} of {} cuboids."
+                                     .format(upload_id, session["received"], session["total"]),
+                                     ErrorCodes.INVALID_STATE)
+            set_status(client, upload_id, "committed")
+            session["status"] = "committed"
+
+        return Response(session)
+
+
+class CutoutUploadPart(AdmissionMixin, APIView, ConsumeReqMixin):
+    """
+    View to write a part of an upload session
+
+    A part is a cuboid aligned sub-region of the session's region, covering all of its time samples, in any of the
+    formats a cutout can be POSTed in. Parts can be sent in any order and in parallel, and retried.
+
+    * Requires authentication.
+    """
+    parser_classes = (BloscParser, BloscPythonParser, NpygzParser, RleParser) + CODEC_PARSERS
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def __init__(self):
+        super().__init__()
+        self.session = None
+
+    def get_parser_context(self, http_request):
+        """Method to add the session's channel and time range to the URL arguments the parsers validate"""
+        context = super().get_parser_context(http_request)
+        self.session = get_session(get_spatialdb().kvio.cache_client, context['kwargs']['upload_id'])
+        if self.session is not None:
+            context['kwargs'] = dict(context['kwargs'], **self.session["args"])
+        return context
+
+    def put(self, request, upload_id, x_range, y_range, z_range):
+        """
+        View to handle PUT requests for a part of an upload session
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param upload_id: Id of the session, as returned when it was opened
+        :param x_range: Python style range indicating the X coordinates of the part (eg. 512:1024)
+        :param y_range: Python style range indicating the Y coordinates of the part (eg. 512:1024)
+        :param z_range: Python style range indicating the Z coordinates of the part (eg. 16:32)
+        :return:
+        """
+        session = self.session
+        if session is None or session["user"] != request.user.username:
+            self.consume_request(request.stream)
+            return BossHTTPError("Upload session {} not found".format(upload_id), ErrorCodes.RESOURCE_NOT_FOUND)
+        if session["status"] != "open":
+            self.consume_request(request.stream)
+            return BossHTTPError("Upload session {} is {}".format(upload_id, session["status"]),
+                                 ErrorCodes.INVALID_STATE)
+
+        # Check if parsing completed without error. If an error did occur, return to user.
+        if isinstance(request.data, BossParserError):
+            return request.data.to_http()
+
+        # Get BossRequest and BossResource from parser
+        req = request.data[0]
+        resource = request.data[1]
+
+        corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
+        extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
+        if not is_part_aligned(session, corner, extent, req.get_resolution()):
+            return BossHTTPError("Parts must be inside the upload region and start and stop on cuboid boundaries or "
+                                 "the edges of the region.", ErrorCodes.INVALID_CUTOUT_ARGS)
+
+        # Make sure the data matches the channel and the part's URL
+        err = check_posted_data(req, resource, request.data[2])
+        if err:
+            return err
+
+        # Each part is recorded as received for every time sample of the session, so it has to cover all of them
+        num_time = session["time_range"][1] - session["time_range"][0]
+        if num_time > 1 and len(request.data[2].shape) != 4:
+            return BossHTTPError("The upload session covers {} time samples. Parts have to be 4D and cover all of them."
+                                 .format(num_time), ErrorCodes.DATA_DIMENSION_MISMATCH)
+
+        cache = get_spatialdb()
+        data = request.data[2] if len(request.data[2].shape) == 4 else np.expand_dims(request.data[2], axis=0)
+
+        # Parts go after the pending asynchronous writes they overlap
+        if settings.CUTOUT_WRITE_BEHIND_ENABLED:
+            region = {"corner": corner, "extent": extent,
+                      "time_range": [req.get_time()[0], req.get_time()[0] + data.shape[0]]}
+            if not wait_for_pending_writes(cache.kvio.cache_client, resource.get_lookup_key(), req.get_resolution(),
+                                           region, settings.CUTOUT_WRITE_BEHIND_WAIT_TIMEOUT):
+                return BossHTTPError("Writes to this region are still pending. Retry the request later.",
+                                     ErrorCodes.SERVER_BUSY)
+
+        try:
+            cache.write_cuboid(resource, corner, req.get_resolution(), data, req.get_time()[0], iso=session["iso"])
+        except Exception as e:
+            # TODO: Eventually remove as this level of detail should not be sent to the user
+            return BossHTTPError('Error during write_cuboid: {}'.format(e), ErrorCodes.BOSS_SYSTEM_ERROR)
+
+        mark_written(cache, resource, req.get_resolution(), corner, extent,
+                     [req.get_time()[0], req.get_time()[0] + data.shape[0]])
+
+        # Retried parts cover cuboids that were already received, so they are only counted once
+        new_cuboids = record_part(cache.kvio.cache_client, upload_id,
+                                  iter_cuboid_indices(corner, extent, req.get_resolution()),
+                                  settings.CUTOUT_UPLOAD_SESSION_TTL)
+
+        session = get_session(cache.kvio.cache_client, upload_id)
+        session["new_cuboids"] = new_cuboids
+        return Response(session)
+
+
+class CutoutWriteTicket(APIView):
+    """
+    View to get the status of an asynchronous cutout write
+
+    * Requires authentication. Tickets are only visible to the user that made the write and to staff.
+    """
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request, ticket_id):
+        """
+        View to handle GET requests for the status of an asynchronous write
+
+        :param request: DRF Request object
+        :type request: rest_framework.request.Request
+        :param ticket_id: Id of the write ticket, as returned by the POST
+        :return:
+        """
+        ticket = get_ticket(get_spatialdb().kvio.cache_client, ticket_id)
+        if ticket is None or (ticket["user"] != request.user.username and not request.user.is_staff):
+            return BossHTTPError("Write ticket {} not found".format(ticket_id), ErrorCodes.RESOURCE_NOT_FOUND)
+        return Response(ticket)
+
+
+class CutoutMetrics(APIView):
+    """
+    View to provide the cutout service's runtime statistics for the worker process that handles the request
+
+    * Requires staff privileges.
+    """
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (JSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request):
+        """View to provide the worker's cutout service statistics
+
+        Args:
+            request: DRF Request object
+
+        Returns:
+            JSON dict of statistics
+        """
+        response_cache = get_response_cache()
+        admission = get_admission_controller()
+        return Response({"pool": get_pool_stats(),
+                         "admission": admission.get_stats() if admission else None,
+                         "coalesce": cutout_flight.get_stats(),
+                         "passthrough": passthrough_stats.get_stats(),
+                         "response_cache": response_cache.get_stats() if response_cache else None,
+                         "timing": timing_histograms.get_stats(),
+                         "prewarm": get_prewarm_executor().get_stats(),
+                         "write_behind": get_write_behind_queue().get_stats()
+                         if settings.CUTOUT_WRITE_BEHIND_ENABLED else None})
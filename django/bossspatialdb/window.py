@@ -0,0 +1,146 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Intensity windowing and data type conversion of image cutouts
+#
+# A window maps the values between its min and max onto the full range of the output data type, optionally with a
+# gamma curve, and clips values outside of it. Every possible input value is mapped once into a lookup table, so
+# converting a cutout is a single vectorized table lookup.
+
+import numpy as np
+
+from bosscore.error import BossError, ErrorCodes
+
+# Query parameters that select a window
+WINDOW_PARAMS = ("window", "gamma", "dtype")
+
+# Data types windows can read and produce
+WINDOW_DTYPES = {"uint8": np.uint8, "uint16": np.uint16}
+
+
+class Window(object):
+    """Lookup table from a channel's values to windowed output values"""
+
+    def __init__(self, dtype, low, high, gamma=1.0, out_dtype=None):
+        """
+        Args:
+            dtype (np.dtype): Data type of the channel, uint8 or uint16
+            low (int): Value mapped to 0
+            high (int): Value mapped to the output type's maximum
+            gamma (float): Exponent applied to the normalized values
+            out_dtype (np.dtype): Data type of the output, defaults to the channel's
+        """
+        self.dtype = np.dtype(dtype)
+        self.out_dtype = np.dtype(out_dtype if out_dtype is not None else dtype)
+        self.low = low
+        self.high = high
+        self.gamma = gamma
+
+        values = np.arange(np.iinfo(self.dtype).max + 1, dtype=np.float64)
+        normalized = np.clip((values - low) / float(high - low), 0, 1)
+        if gamma != 1.0:
+            normalized **= gamma
+        self.lut = np.rint(normalized * np.iinfo(self.out_dtype).max).astype(self.out_dtype)
+
+    @property
+    def bit_depth(self):
+        """Bit depth of the output"""
+        return self.out_dtype.itemsize * 8
+
+    def get_key(self):
+        """Method to get a hashable description of the window, eg. for cache keys
+
+        Returns:
+            (tuple): The window's parameters
+        """
+        return self.low, self.high, self.gamma, self.out_dtype.str
+
+    def apply(self, data):
+        """Method to window an array
+
+        Args:
+            data (np.ndarray): Data of the channel's type
+
+        Returns:
+            (np.ndarray): Windowed data of the output type, in the same shape
+        """
+        return np.take(self.lut, data)
+
+
+def parse_window(query_params, dtype):
+    """Method to build the window selected by a request's query parameters
+
+    window is a python style range of the values to keep (eg. 100:3000, defaults to the channel's full range), gamma
+    an exponent applied after windowing (defaults to 1) and dtype the output type, uint8 or uint16 (defaults to the
+    channel's).
+
+    Args:
+        query_params (dict): The request's query parameters
+        dtype (np.dtype): Data type of the channel
+
+    Returns:
+        (Window|None): The window, or None if the request does not select one
+
+    Raises:
+        (BossError): If the parameters are invalid or the channel can't be windowed
+    """
+    if not any(param in query_params for param in WINDOW_PARAMS):
+        return None
+
+    dtype = np.dtype(dtype)
+    if dtype not in [np.dtype(t) for t in WINDOW_DTYPES.values()]:
+        raise BossError("Windowing is only supported for uint8 and uint16 channels",
+                        ErrorCodes.DATATYPE_NOT_SUPPORTED)
+
+    max_value = np.iinfo(dtype).max
+    try:
+        if "window" in query_params:
+            low, high = [int(v) for v in query_params["window"].split(":")]
+        else:
+            low, high = 0, max_value
+        if not 0 <= low < high <= max_value:
+            raise ValueError()
+    except ValueError:
+        raise BossError("Invalid window {}. Provide a range like 100:3000 between 0 and {}."
+                        .format(query_params["window"], max_value), ErrorCodes.INVALID_ARGUMENT)
+
+    try:
+        gamma = float(query_params.get("gamma", 1.0))
+        if not 0 < gamma <= 10:
+            raise ValueError()
+    except ValueError:
+        raise BossError("Invalid gamma {}. The gamma has to be greater than 0 and at most 10."
+                        .format(query_params["gamma"]), ErrorCodes.INVALID_ARGUMENT)
+
+    out_dtype = query_params.get("dtype", dtype.name)
+    if out_dtype not in WINDOW_DTYPES:
+        raise BossError("Invalid dtype {}. Valid options include {}.".format(out_dtype, ", ".join(WINDOW_DTYPES)),
+                        ErrorCodes.INVALID_ARGUMENT)
+
+    return Window(dtype, low, high, gamma, WINDOW_DTYPES[out_dtype])
+
+
+def window_slabs(slabs, window):
+    """Generator to window the z-slabs of a streamed cutout
+
+    Args:
+        slabs (iterable((int|(int, int), spdb.spatialdb.Cube))): z or (t, z) offset and data of each slab, in order
+        window (Window): Window to apply
+
+    Yields:
+        (int|(int, int), spdb.spatialdb.Cube): The slab's offset and windowed data
+    """
+    for offset, cube in slabs:
+        cube.data = window.apply(cube.data)
+        yield offset, cube
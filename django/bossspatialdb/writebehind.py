@@ -0,0 +1,600 @@
+# Copyright 2016 The Johns Hopkins University Applied Physics Laboratory
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Write-behind of cutout POSTs
+#
+# An asynchronous POST is validated and decoded by the request, then its data and everything needed to apply it are
+# saved to a spool directory on local disk and it is answered with a write ticket. Background threads apply the
+# tickets with SpatialDB.write_cuboid, one channel at a time in the order they were accepted. Each ticket's status is
+# kept in redis, along with the regions of the tickets that are still pending, so reads and later writes of a region
+# can wait for the pending writes that overlap it, no matter which worker accepted them.
+#
+# Every worker process spools into its own sub-directory. A new process adopts the sub-directories of processes that
+# no longer exist and applies their tickets, so writes that were accepted survive a worker restart. A write that fails
+# is retried with backoff; once it runs out of attempts its ticket is failed, but its spooled data is kept so it is
+# applied again when the directory is adopted.
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from django.conf import settings
+from django.db import connection
+
+from spdb.project import BossResourceBasic
+
+from bosscore.models import Channel
+
+from .pool import get_spatialdb
+from .versions import CuboidVersions, get_versions_ttl
+
+try:
+    import uwsgi
+    from uwsgidecorators import postfork
+except ImportError:
+    # Not running under uwsgi
+    uwsgi = None
+    postfork = None
+
+WRITE_PREFIX = "WRITE"
+
+# Seconds between checks for pending writes that overlap a region
+PENDING_POLL_INTERVAL = 0.05
+
+# Seconds before the first retry of a write that failed, doubled on every further retry up to the maximum
+RETRY_BACKOFF = 0.5
+RETRY_BACKOFF_MAX = 30
+
+
+def get_ticket_key(ticket_id):
+    """Method to get the redis key of a write ticket
+
+    Args:
+        ticket_id (str): Ticket id
+
+    Returns:
+        (str): Redis key
+    """
+    return "{}&{}".format(WRITE_PREFIX, ticket_id)
+
+
+def get_pending_key(lookup_key, resolution):
+    """Method to get the redis key of the regions of a channel's pending writes
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+        resolution (int): Resolution level
+
+    Returns:
+        (str): Redis key
+    """
+    return "{}&PENDING&{}&{}".format(WRITE_PREFIX, lookup_key, resolution)
+
+
+def get_sequence_key(lookup_key):
+    """Method to get the redis key of the counter that orders a channel's writes
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+
+    Returns:
+        (str): Redis key
+    """
+    return "{}&SEQ&{}".format(WRITE_PREFIX, lookup_key)
+
+
+def mark_written(cache, resource, resolution, corner, extent, time_range):
+    """Method to update the state that depends on a channel's data after a write
+
+    Cached responses built from the written cuboids are invalidated and the channel is flagged for downsampling.
+
+    Args:
+        cache (spdb.spatialdb.SpatialDB): Interface to the spatial database
+        resource (spdb.project.BossResource): Resource for the channel
+        resolution (int): Resolution level
+        corner ((int, int, int)): (x, y, z) start of the written region
+        extent ((int, int, int)): (x, y, z) span of the written region
+        time_range ([int, int]): Start and stop time samples written
+
+    Returns:
+        None
+    """
+    # Invalidate cached responses and statistics built from the cuboids that were just written
+    versions_ttl = get_versions_ttl()
+    if versions_ttl:
+        CuboidVersions(cache.kvio.cache_client, versions_ttl).bump(resource.get_lookup_key(), resolution, corner,
+                                                                   extent, time_range)
+
+    # If the channel status is DOWNSAMPLED change status to NOT_DOWNSAMPLED since you just wrote data
+    channel = resource.get_channel()
+    if channel.downsample_status.upper() == "DOWNSAMPLED":
+        # Get Channel object and update status
+        lookup_key = resource.get_lookup_key()
+        _, exp_id, _ = lookup_key.split("&")
+        channel_obj = Channel.objects.get(name=channel.name, experiment=int(exp_id))
+        channel_obj.downsample_status = "NOT_DOWNSAMPLED"
+        channel_obj.downsample_arn = ""
+        channel_obj.save()
+
+
+def regions_overlap(region_a, region_b):
+    """Method to check if two regions share any voxels
+
+    Args:
+        region_a (dict): "corner", "extent" and "time_range" of the first region
+        region_b (dict): "corner", "extent" and "time_range" of the second region
+
+    Returns:
+        (bool): True if the regions overlap
+    """
+    for d in range(3):
+        if (region_a["corner"][d] >= region_b["corner"][d] + region_b["extent"][d] or
+                region_b["corner"][d] >= region_a["corner"][d] + region_a["extent"][d]):
+            return False
+    return (region_a["time_range"][0] < region_b["time_range"][1] and
+            region_b["time_range"][0] < region_a["time_range"][1])
+
+
+def get_overlapping_writes(client, lookup_key, resolution, region, before_seq=None, max_age=None):
+    """Method to find the pending writes that overlap a region
+
+    Args:
+        client (redis.StrictRedis): Redis client tickets are kept in
+        lookup_key (str): Lookup key of the channel
+        resolution (int): Resolution level
+        region (dict): "corner", "extent" and "time_range" of the region
+        before_seq (int): Only consider writes accepted before this sequence number, or None for all writes
+        max_age (float): Ignore writes accepted more than this many seconds ago, or None to consider every write
+
+    Returns:
+        (list(str)): Ticket ids of the overlapping writes
+    """
+    now = time.time()
+    overlapping = []
+    for ticket_id, value in client.hgetall(get_pending_key(lookup_key, resolution)).items():
+        pending = json.loads(value.decode() if isinstance(value, bytes) else value)
+        if before_seq is not None and pending["seq"] >= before_seq:
+            continue
+        if max_age is not None and now - pending["created"] > max_age:
+            continue
+        if regions_overlap(region, pending):
+            overlapping.append(ticket_id.decode() if isinstance(ticket_id, bytes) else ticket_id)
+    return overlapping
+
+
+def wait_for_pending_writes(client, lookup_key, resolution, region, timeout, before_seq=None, max_age=None):
+    """Method to wait until no pending write overlaps a region
+
+    Writes that have been pending for longer than max_age are assumed to have been lost with their node, so they don't
+    block the region forever.
+
+    Args:
+        client (redis.StrictRedis): Redis client tickets are kept in
+        lookup_key (str): Lookup key of the channel
+        resolution (int): Resolution level
+        region (dict): "corner", "extent" and "time_range" of the region
+        timeout (float): Maximum number of seconds to wait
+        before_seq (int): Only wait for writes accepted before this sequence number, or None for all writes
+        max_age (float): Ignore writes accepted more than this many seconds ago. Defaults to
+            settings.CUTOUT_WRITE_BEHIND_MAX_AGE
+
+    Returns:
+        (bool): True if the overlapping writes drained, False if the wait timed out
+    """
+    if max_age is None:
+        max_age = settings.CUTOUT_WRITE_BEHIND_MAX_AGE
+
+    deadline = time.monotonic() + timeout
+    while get_overlapping_writes(client, lookup_key, resolution, region, before_seq, max_age):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(PENDING_POLL_INTERVAL)
+    return True
+
+
+def wait_to_read(lookup_key, resolution, corner, extent, time_range):
+    """Method to wait until a region can be read without missing acknowledged asynchronous writes
+
+    Does nothing unless settings.CUTOUT_WRITE_BEHIND_ENABLED is set.
+
+    Args:
+        lookup_key (str): Lookup key of the channel
+        resolution (int): Resolution level
+        corner ((int, int, int)): (x, y, z) start of the region
+        extent ((int, int, int)): (x, y, z) span of the region
+        time_range ([int, int]): Start and stop time samples
+
+    Returns:
+        (bool): True if the region can be read, False if the pending writes to it did not drain in time
+    """
+    if not settings.CUTOUT_WRITE_BEHIND_ENABLED:
+        return True
+
+    region = {"corner": tuple(corner), "extent": tuple(extent), "time_range": list(time_range)}
+    return wait_for_pending_writes(get_spatialdb().kvio.cache_client, lookup_key, resolution, region,
+                                   settings.CUTOUT_WRITE_BEHIND_WAIT_TIMEOUT)
+
+
+def get_ticket(client, ticket_id):
+    """Method to get the status of a write ticket
+
+    Args:
+        client (redis.StrictRedis): Redis client tickets are kept in
+        ticket_id (str): Ticket id
+
+    Returns:
+        (dict|None): status, user, region and error of the write, or None if the ticket doesn't exist
+    """
+    fields = client.hgetall(get_ticket_key(ticket_id))
+    if not fields:
+        return None
+
+    ticket = {k.decode() if isinstance(k, bytes) else k: v.decode() if isinstance(v, bytes) else v
+              for k, v in fields.items()}
+    for name in ("corner", "extent", "time_range"):
+        ticket[name] = json.loads(ticket[name])
+    for name in ("created", "finished"):
+        if name in ticket:
+            ticket[name] = float(ticket[name])
+    ticket["resolution"] = int(ticket["resolution"])
+    ticket["ticket_id"] = ticket_id
+    return ticket
+
+
+def is_process_alive(pid):
+    """Method to check if a process exists on this node
+
+    Args:
+        pid (int): Process id
+
+    Returns:
+        (bool): True if the process exists
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WriteBehindQueue(object):
+    """Spool of a worker process's asynchronous writes and the threads that apply them"""
+
+    def __init__(self, spool_dir, workers, max_pending, ttl, wait_timeout, max_attempts=1):
+        """
+        Args:
+            spool_dir (str): Directory this process's writes are saved in
+            workers (int): Number of channels written at once
+            max_pending (int): Maximum number of writes waiting or being applied
+            ttl (int): Number of seconds a ticket's status is kept
+            wait_timeout (float): Maximum number of seconds a write waits at a time for earlier, overlapping writes
+                accepted by other workers
+            max_attempts (int): Number of times a write is tried, counting both waits for earlier writes that timed
+                out and errors while applying it, before its ticket is failed
+        """
+        self.spool_dir = spool_dir
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.max_attempts = max(1, max_attempts)
+        os.makedirs(spool_dir, exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._lock = threading.Lock()
+        self._lanes = {}
+        self._running = set()
+        self._pending = 0
+        self._applied = 0
+        self._failed = 0
+
+    def submit(self, client, username, resource, resolution, corner, data, time_start, iso=False):
+        """Method to save a write and queue it
+
+        The write is on disk and its region is recorded as pending before the method returns.
+
+        Args:
+            client (redis.StrictRedis): Redis client tickets are kept in
+            username (str): User that made the write
+            resource (spdb.project.BossResource): Resource for the channel
+            resolution (int): Resolution level
+            corner ((int, int, int)): (x, y, z) start of the region
+            data (np.ndarray): 4D (t, z, y, x) data to write
+            time_start (int): First time sample of the data
+            iso (bool): Flag indicating if the data is written to the isotropic data
+
+        Returns:
+            (dict|None): The ticket, or None if the queue is full
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                return None
+            self._pending += 1
+
+        try:
+            lookup_key = resource.get_lookup_key()
+            ticket_id = uuid.uuid4().hex
+            seq = client.incr(get_sequence_key(lookup_key))
+            meta = {"ticket_id": ticket_id, "seq": seq, "resource": resource.to_dict(), "resolution": resolution,
+                    "corner": list(corner), "extent": [data.shape[3], data.shape[2], data.shape[1]],
+                    "time_range": [time_start, time_start + data.shape[0]], "iso": iso}
+            self._save(meta, data)
+
+            pipe = client.pipeline()
+            pipe.hmset(get_ticket_key(ticket_id), {"status": "queued", "user": username, "channel": lookup_key,
+                                                   "resolution": resolution, "corner": json.dumps(meta["corner"]),
+                                                   "extent": json.dumps(meta["extent"]),
+                                                   "time_range": json.dumps(meta["time_range"]),
+                                                   "created": time.time()})
+            pipe.expire(get_ticket_key(ticket_id), self.ttl)
+            pipe.hset(get_pending_key(lookup_key, resolution), ticket_id,
+                      json.dumps({"seq": seq, "corner": meta["corner"], "extent": meta["extent"],
+                                  "time_range": meta["time_range"], "created": time.time()}))
+            pipe.execute()
+        except:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+        self._enqueue(meta)
+        return get_ticket(client, ticket_id)
+
+    def _save(self, meta, data):
+        """Method to durably save a write to the spool directory
+
+        The data and description are written to temp names, synced and renamed, so a crash never leaves a partial
+        write that looks complete.
+        """
+        data_path = os.path.join(self.spool_dir, meta["ticket_id"] + ".npy")
+        with open(data_path + ".tmp", "wb") as fh:
+            np.save(fh, data, allow_pickle=False)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.rename(data_path + ".tmp", data_path)
+        self._save_meta(meta)
+
+    def _save_meta(self, meta):
+        """Method to durably save or replace the description of a write"""
+        meta_path = os.path.join(self.spool_dir, meta["ticket_id"] + ".json")
+        with open(meta_path + ".tmp", "w") as fh:
+            json.dump(meta, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.rename(meta_path + ".tmp", meta_path)
+
+    def _enqueue(self, meta):
+        """Method to add a saved write to its channel's lane, starting the lane if it is idle"""
+        lookup_key = meta["resource"]["lookup_key"]
+        with self._lock:
+            self._lanes.setdefault(lookup_key, deque()).append(meta)
+            if lookup_key in self._running:
+                return
+            self._running.add(lookup_key)
+        self._executor.submit(self._run_lane, lookup_key)
+
+    def _run_lane(self, lookup_key):
+        """Method to apply a channel's writes in order until its lane is empty"""
+        try:
+            while True:
+                with self._lock:
+                    lane = self._lanes[lookup_key]
+                    if not lane:
+                        del self._lanes[lookup_key]
+                        self._running.discard(lookup_key)
+                        return
+                    meta = lane.popleft()
+                if not self.apply(meta):
+                    # Retry before any later write of the channel, so the lane stays in order
+                    with self._lock:
+                        lane.appendleft(meta)
+        finally:
+            # Threads outside the request cycle have to close their own database connections
+            connection.close()
+
+    def apply(self, meta):
+        """Method to apply a saved write and record the outcome
+
+        A write is only applied once the overlapping writes accepted before it by other workers are done. If they are
+        not done within the wait timeout, or applying the write raises an error, the write stays saved and has to be
+        retried, until it has been tried max_attempts times. Its ticket is then failed, but the saved write is left in
+        the spool directory so it is applied again when the directory is adopted by recover().
+
+        Args:
+            meta (dict): Description of the write, as saved by submit()
+
+        Returns:
+            (bool): False if the write has to be retried
+        """
+        cache = get_spatialdb()
+        client = cache.kvio.cache_client
+        key = get_ticket_key(meta["ticket_id"])
+        resource = BossResourceBasic(meta["resource"])
+        lookup_key = resource.get_lookup_key()
+        data_path = os.path.join(self.spool_dir, meta["ticket_id"] + ".npy")
+        meta_path = os.path.join(self.spool_dir, meta["ticket_id"] + ".json")
+
+        try:
+            client.hset(key, "status", "waiting")
+
+            # Writes accepted earlier by other workers go first
+            if not wait_for_pending_writes(client, lookup_key, meta["resolution"], meta, self.wait_timeout,
+                                           before_seq=meta["seq"]):
+                raise TimeoutError("Timed out waiting for earlier writes to the region")
+
+            client.hset(key, "status", "running")
+            data = np.load(data_path, allow_pickle=False)
+            cache.write_cuboid(resource, meta["corner"], meta["resolution"], data, meta["time_range"][0],
+                               iso=meta["iso"])
+            mark_written(cache, resource, meta["resolution"], meta["corner"], meta["extent"], meta["time_range"])
+            client.hmset(key, {"status": "done", "finished": time.time()})
+        except Exception as err:
+            meta["attempts"] = meta.get("attempts", 0) + 1
+            try:
+                self._save_meta(meta)
+            except OSError:
+                pass
+
+            if meta["attempts"] < self.max_attempts:
+                # Waits for earlier writes already took the wait timeout, errors back off before the retry
+                if not isinstance(err, TimeoutError):
+                    time.sleep(min(RETRY_BACKOFF * 2 ** (meta["attempts"] - 1), RETRY_BACKOFF_MAX))
+                return False
+
+            try:
+                client.hmset(key, {"status": "failed", "error": str(err), "finished": time.time()})
+                client.hdel(get_pending_key(lookup_key, meta["resolution"]), meta["ticket_id"])
+            except Exception:
+                pass
+
+            with self._lock:
+                self._pending -= 1
+                self._failed += 1
+            return True
+
+        client.hdel(get_pending_key(lookup_key, meta["resolution"]), meta["ticket_id"])
+        for path in (meta_path, data_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        with self._lock:
+            self._pending -= 1
+            self._applied += 1
+        return True
+
+    def recover(self, spool_root):
+        """Method to adopt and queue the saved writes of worker processes that no longer exist
+
+        Args:
+            spool_root (str): Directory holding the spool directory of every worker process
+
+        Returns:
+            (int): Number of writes queued
+        """
+        recovered = []
+        for name in sorted(os.listdir(spool_root)):
+            path = os.path.join(spool_root, name)
+            if path == self.spool_dir or not name.isdigit() or is_process_alive(int(name)):
+                continue
+
+            # Renaming claims the directory, so only one new process adopts it
+            claimed = os.path.join(self.spool_dir, "adopted-{}".format(name))
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue
+
+            for file_name in os.listdir(claimed):
+                if file_name.endswith(".json") and os.path.isfile(os.path.join(claimed, file_name)):
+                    os.rename(os.path.join(claimed, file_name[:-5] + ".npy"),
+                              os.path.join(self.spool_dir, file_name[:-5] + ".npy"))
+                    os.rename(os.path.join(claimed, file_name), os.path.join(self.spool_dir, file_name))
+                    with open(os.path.join(self.spool_dir, file_name)) as fh:
+                        meta = json.load(fh)
+                    # Writes that failed in the exited worker get a fresh set of attempts
+                    meta.pop("attempts", None)
+                    recovered.append(meta)
+            # Drop temp files of writes that were never completely saved
+            shutil.rmtree(claimed, ignore_errors=True)
+
+        with self._lock:
+            self._pending += len(recovered)
+        for meta in sorted(recovered, key=lambda m: m["seq"]):
+            self._enqueue(meta)
+        return len(recovered)
+
+    def get_stats(self):
+        """Method to get the counters of the queue
+
+        Returns:
+            (dict): Counter values
+        """
+        with self._lock:
+            return {"pending": self._pending, "max_pending": self.max_pending, "applied": self._applied,
+                    "failed": self._failed, "channels": len(self._lanes)}
+
+
+_lock = threading.Lock()
+_state = {"pid": None, "queue": None}
+
+
+def get_spool_root():
+    """Method to get the directory holding the spool directory of every worker process
+
+    Returns:
+        (str): Directory path
+    """
+    return settings.CUTOUT_WRITE_BEHIND_DIR or os.path.join(tempfile.gettempdir(), "boss-write-behind")
+
+
+def get_write_behind_queue():
+    """Method to get the write-behind queue of the current worker process
+
+    The queue is rebuilt whenever the process id changes, and adopts the writes of worker processes that have exited.
+
+    Returns:
+        (WriteBehindQueue): The worker's queue
+    """
+    pid = os.getpid()
+    with _lock:
+        if _state["queue"] is None or _state["pid"] != pid:
+            spool_root = get_spool_root()
+            queue = WriteBehindQueue(os.path.join(spool_root, str(pid)), settings.CUTOUT_WRITE_BEHIND_WORKERS,
+                                     settings.CUTOUT_WRITE_BEHIND_MAX_PENDING, settings.CUTOUT_WRITE_BEHIND_TICKET_TTL,
+                                     settings.CUTOUT_WRITE_BEHIND_WAIT_TIMEOUT,
+                                     settings.CUTOUT_WRITE_BEHIND_MAX_ATTEMPTS)
+            queue.recover(spool_root)
+            _state["queue"] = queue
+            _state["pid"] = pid
+        return _state["queue"]
+
+
+def start_write_behind():
+    """Method to create the write-behind queue of a worker as soon as it starts, if write-behind is enabled
+
+    Creating the queue applies the writes left by worker processes that have exited, so they don't keep blocking their
+    regions until a request happens to need the queue.
+
+    Returns:
+        None
+    """
+    if settings.CUTOUT_WRITE_BEHIND_ENABLED:
+        get_write_behind_queue()
+
+
+def register_write_behind_start():
+    """Method to start the write-behind queue of every uwsgi worker
+
+    Called when the app is loaded. In the uwsgi master the queue is started after each fork. Apps loaded in a worker
+    (lazy-apps) start it right away. Outside of uwsgi the queue is started the first time it is needed.
+
+    Returns:
+        None
+    """
+    if uwsgi is None:
+        return
+    if uwsgi.worker_id() == 0:
+        postfork(start_write_behind)
+    else:
+        start_write_behind()
@@ -18,13 +18,19 @@ from django.conf import settings
 
 from bosscore.request import BossRequest
 from bosscore.error import BossError, BossHTTPError, ErrorCodes
+from bosscore.timing import TimingMixin, get_timer
 
 import spdb
 
+from bossspatialdb.pool import get_spatialdb
+from bossspatialdb.coalesce import coalesced_cutout
+from bossspatialdb.window import parse_window
+from bossspatialdb.writebehind import wait_to_read
+
 from .renderers import PNGRenderer, JPEGRenderer
 
 
-class CutoutTile(APIView):
+class CutoutTile(TimingMixin, APIView):
     """
     View to handle spatial cutouts by providing all datamodel fields
 
@@ -80,6 +86,12 @@ class CutoutTile(APIView):
         except ValueError:
             return BossHTTPError("Datatype does not match channel", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
 
+        # Check for an optional intensity window and output data type
+        try:
+            window = parse_window(request.query_params, resource.get_numpy_data_type())
+        except BossError as err:
+            return err.to_http()
+
         # Make sure cutout request is under 1GB UNCOMPRESSED
         total_bytes = req.get_x_span() * req.get_y_span() * req.get_z_span() * len(req.get_time()) * (self.bit_depth/8)
         if total_bytes > settings.CUTOUT_MAX_SIZE:
@@ -87,17 +99,24 @@ class CutoutTile(APIView):
                                  ErrorCodes.REQUEST_TOO_LARGE)
 
         # Get interface to SPDB cache
-        cache = spdb.spatialdb.SpatialDB(settings.KVIO_SETTINGS,
-                                         settings.STATEIO_CONFIG,
-                                         settings.OBJECTIO_CONFIG)
+        cache = get_spatialdb()
 
         # Get the params to pull data out of the cache
         corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
         extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
 
+        # Reads of a region wait for the asynchronous writes to it that are still pending
+        if not wait_to_read(resource.get_lookup_key(), req.get_resolution(), corner, extent,
+                            [req.get_time().start, req.get_time().stop]):
+            return BossHTTPError("Writes to this region are still pending. Retry the request later.",
+                                 ErrorCodes.SERVER_BUSY)
+
         # Do a cutout as specified
-        data = cache.cutout(resource, corner, extent, req.get_resolution(),
-                            [req.get_time().start, req.get_time().stop])
+        with get_timer(request).stage("fetch"):
+            data = coalesced_cutout(cache, resource, corner, extent, req.get_resolution(),
+                                    [req.get_time().start, req.get_time().stop])
+        if window:
+            data.data = window.apply(data.data)
 
         # Covert the cutout back to an image and return it
         if orientation == 'xy':
@@ -113,7 +132,7 @@ class CutoutTile(APIView):
         return Response(img)
 
 
-class Tile(APIView):
+class Tile(TimingMixin, APIView):
     """
     View to handle tile interface when accessing via tile indicies
 
@@ -173,6 +192,12 @@ class Tile(APIView):
         except ValueError:
             return BossHTTPError("Datatype does not match channel", ErrorCodes.DATATYPE_DOES_NOT_MATCH)
 
+        # Check for an optional intensity window and output data type
+        try:
+            window = parse_window(request.query_params, resource.get_numpy_data_type())
+        except BossError as err:
+            return err.to_http()
+
         # Make sure cutout request is under 1GB UNCOMPRESSED
         total_bytes = req.get_x_span() * req.get_y_span() * req.get_z_span() * len(req.get_time()) * (self.bit_depth/8)
         if total_bytes > settings.CUTOUT_MAX_SIZE:
@@ -180,17 +205,24 @@ class Tile(APIView):
                                  ErrorCodes.REQUEST_TOO_LARGE)
 
         # Get interface to SPDB cache
-        cache = spdb.spatialdb.SpatialDB(settings.KVIO_SETTINGS,
-                                         settings.STATEIO_CONFIG,
-                                         settings.OBJECTIO_CONFIG)
+        cache = get_spatialdb()
 
         # Get the params to pull data out of the cache
         corner = (req.get_x_start(), req.get_y_start(), req.get_z_start())
         extent = (req.get_x_span(), req.get_y_span(), req.get_z_span())
 
+        # Reads of a region wait for the asynchronous writes to it that are still pending
+        if not wait_to_read(resource.get_lookup_key(), req.get_resolution(), corner, extent,
+                            [req.get_time().start, req.get_time().stop]):
+            return BossHTTPError("Writes to this region are still pending. Retry the request later.",
+                                 ErrorCodes.SERVER_BUSY)
+
         # Do a cutout as specified
-        data = cache.cutout(resource, corner, extent, req.get_resolution(),
-                            [req.get_time().start, req.get_time().stop])
+        with get_timer(request).stage("fetch"):
+            data = coalesced_cutout(cache, resource, corner, extent, req.get_resolution(),
+                                    [req.get_time().start, req.get_time().stop])
+        if window:
+            data.data = window.apply(data.data)
 
         # Covert the cutout back to an image and return it
         if orientation == 'xy':